@@ -0,0 +1,29 @@
+"""Add workout data version
+
+Revision ID: 3e8c1d7a5b92
+Revises: a8d6f31e0c57
+Create Date: 2024-07-14 10:05:41.208364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8c1d7a5b92'
+down_revision: Union[str, None] = 'a8d6f31e0c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('workout_version',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+                    sa.PrimaryKeyConstraint('user_id'))
+
+
+def downgrade() -> None:
+    op.drop_table('workout_version')
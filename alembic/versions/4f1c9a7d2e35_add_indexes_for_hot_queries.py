@@ -0,0 +1,46 @@
+"""Add indexes for hot queries
+
+Revision ID: 4f1c9a7d2e35
+Revises: b29919374ade
+Create Date: 2024-06-02 11:20:41.512004
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1c9a7d2e35'
+down_revision: Union[str, None] = 'b29919374ade'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_workout_record_user_id_workout_date', 'workout_record', ['user_id', 'workout_date'], False),
+    ('ix_user_words_user_id_reminder_date', 'user_words', ['user_id', 'reminder_date'], False),
+    ('ix_rates_code', 'rates', ['code'], True),
+    ('ix_todos_owner_id_complete_priority', 'todos', ['owner_id', 'complete', 'priority'], False),
+]
+
+
+def upgrade() -> None:
+    # Перед уникальным индексом оставляем по одной (последней) записи на код валюты
+    op.execute(
+        "DELETE FROM rates r USING rates newer "
+        "WHERE r.code = newer.code AND r.id < newer.id"
+    )
+
+    # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции, поэтому
+    # индексные миграции идут в autocommit_block()
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,31 @@
+"""Make todos order columns not null
+
+Revision ID: 5d2b8e6f1a47
+Revises: c71f4e2b9d05
+Create Date: 2024-07-28 11:05:36.204719
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2b8e6f1a47'
+down_revision: Union[str, None] = 'c71f4e2b9d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Старые задачи без приоритета оказываются в конце списка, как и раньше (NULL сортировался последним)
+    op.execute("UPDATE todos SET priority = 5 WHERE priority IS NULL")
+    op.execute("UPDATE todos SET complete = false WHERE complete IS NULL")
+    op.alter_column('todos', 'priority', existing_type=sa.Integer(), nullable=False, server_default='5')
+    op.alter_column('todos', 'complete', existing_type=sa.Boolean(), nullable=False, server_default='false')
+
+
+def downgrade() -> None:
+    op.alter_column('todos', 'complete', existing_type=sa.Boolean(), nullable=True, server_default=None)
+    op.alter_column('todos', 'priority', existing_type=sa.Integer(), nullable=True, server_default=None)
@@ -0,0 +1,29 @@
+"""Add user_words (user_id, word) index
+
+Revision ID: 7b3f52c8e914
+Revises: d41a7e9b3c62
+Create Date: 2024-06-23 10:14:37.208815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3f52c8e914'
+down_revision: Union[str, None] = 'd41a7e9b3c62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_words_user_id_word', 'user_words', ['user_id', 'word'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_words_user_id_word', table_name='user_words',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,39 @@
+"""Add rate history
+
+Revision ID: 9c2e6b1f4a80
+Revises: 4f1c9a7d2e35
+Create Date: 2024-06-09 18:02:15.947310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2e6b1f4a80'
+down_revision: Union[str, None] = '4f1c9a7d2e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('rate_history',
+                    sa.Column('code', sa.String(), nullable=False),
+                    sa.Column('date', sa.Date(), nullable=False),
+                    sa.Column('rate', sa.Float(), nullable=False),
+                    sa.PrimaryKeyConstraint('code', 'date'))
+    op.create_index('ix_rate_history_date_brin', 'rate_history', ['date'], postgresql_using='brin')
+
+    # Первый снимок - текущие курсы
+    op.execute(
+        "INSERT INTO rate_history (code, date, rate) "
+        "SELECT code, created_at::date, rate FROM rates "
+        "WHERE created_at IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rate_history_date_brin', table_name='rate_history', postgresql_using='brin')
+    op.drop_table('rate_history')
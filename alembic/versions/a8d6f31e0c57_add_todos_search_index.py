@@ -0,0 +1,34 @@
+"""Add todos full-text search index
+
+Revision ID: a8d6f31e0c57
+Revises: e5a90c7d1b48
+Create Date: 2024-07-07 13:25:49.630118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d6f31e0c57'
+down_revision: Union[str, None] = 'e5a90c7d1b48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Выражение должно совпадать с backend.models.todo_search_document
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_todos_search', 'todos',
+            [sa.text("(setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                     "setweight(to_tsvector('simple', coalesce(description, '')), 'B'))")],
+            postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_todos_search', table_name='todos', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,52 @@
+"""Add personal records
+
+Revision ID: c71f4e2b9d05
+Revises: 3e8c1d7a5b92
+Create Date: 2024-07-21 16:42:10.517830
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c71f4e2b9d05'
+down_revision: Union[str, None] = '3e8c1d7a5b92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('personal_record',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('exercise_name', sa.String(), nullable=False),
+                    sa.Column('best_weight', sa.Float(), nullable=False),
+                    sa.Column('best_weight_date', sa.DateTime(), nullable=True),
+                    sa.Column('best_one_rep_max', sa.Float(), nullable=False),
+                    sa.Column('best_one_rep_max_date', sa.DateTime(), nullable=True),
+                    sa.Column('best_volume', sa.Float(), nullable=False),
+                    sa.Column('best_volume_date', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('user_id', 'exercise_name'))
+
+    # Рекорды по уже записанным тренировкам; дальше таблицу ведёт create_workout
+    op.execute(
+        "INSERT INTO personal_record "
+        "SELECT user_id, exercise_name, "
+        "max(w), (array_agg(workout_date ORDER BY w DESC, workout_date))[1], "
+        "max(orm), (array_agg(workout_date ORDER BY orm DESC, workout_date))[1], "
+        "max(v), (array_agg(workout_date ORDER BY v DESC, workout_date))[1] "
+        "FROM ("
+        "  SELECT user_id, exercise_name, workout_date, coalesce(weight, 0) AS w, "
+        "  CASE WHEN repetitions <= 1 THEN coalesce(weight, 0) "
+        "  ELSE coalesce(weight, 0) * (1 + repetitions / 30.0::float8) END AS orm, "
+        "  sets * repetitions * coalesce(weight, 0) AS v "
+        "  FROM workout_record"
+        ") records "
+        "GROUP BY user_id, exercise_name"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('personal_record')
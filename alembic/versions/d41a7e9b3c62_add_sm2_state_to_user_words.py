@@ -0,0 +1,28 @@
+"""Add SM-2 state to user words
+
+Revision ID: d41a7e9b3c62
+Revises: 9c2e6b1f4a80
+Create Date: 2024-06-16 12:40:08.512306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a7e9b3c62'
+down_revision: Union[str, None] = '9c2e6b1f4a80'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_words', sa.Column('ease_factor', sa.Float(), server_default='2.5', nullable=False))
+    op.add_column('user_words', sa.Column('repetitions', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('user_words', 'repetitions')
+    op.drop_column('user_words', 'ease_factor')
@@ -0,0 +1,34 @@
+"""Extend todos owner index with id
+
+Revision ID: e5a90c7d1b48
+Revises: 7b3f52c8e914
+Create Date: 2024-06-30 16:52:03.114276
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a90c7d1b48'
+down_revision: Union[str, None] = '7b3f52c8e914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Новый индекс строим до удаления старого, чтобы список задач не остался без индекса
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_owner_id_complete_priority_id', 'todos', ['owner_id', 'complete', 'priority', 'id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_todos_owner_id_complete_priority', table_name='todos',
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_owner_id_complete_priority', 'todos', ['owner_id', 'complete', 'priority'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_todos_owner_id_complete_priority_id', table_name='todos',
+                      postgresql_concurrently=True, if_exists=True)
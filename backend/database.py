@@ -1,15 +1,97 @@
+from contextlib import asynccontextmanager
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 import os
 from dotenv import load_dotenv
 
+from backend.env import env_flag
+from backend.metrics import TimedAsyncQueuePool, TimedQueuePool
+
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Режим работы с БД: "async" (asyncpg + AsyncSession) или "sync" (psycopg2 + Session)
+DATABASE_MODE = os.getenv("DATABASE_MODE", "async")
+
+
+def to_async_url(url: str) -> str:
+    # postgresql://... -> postgresql+asyncpg://...
+    scheme, _, rest = url.partition("://")
+    return f"{scheme.split('+')[0]}+asyncpg://{rest}"
+
+
+# Настройки пула соединений (одинаковые для sync и async движков)
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+}
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, **POOL_OPTIONS)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL),
+                                   poolclass=TimedAsyncQueuePool, **POOL_OPTIONS)
+
+# expire_on_commit=False: после commit объекты остаются читаемыми вне run_sync
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
+
+
+async def get_db():
+    if DATABASE_MODE == "async":
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def stream_db(db, statement, chunk_size: int = 1000):
+    """Выдаёт результат statement порциями по chunk_size строк через серверный курсор.
+
+    В памяти одновременно только одна порция, сколько бы строк ни вернул запрос.
+    """
+    statement = statement.execution_options(yield_per=chunk_size)
+    if isinstance(db, AsyncSession):
+        result = await db.stream(statement)
+        async for partition in result.partitions():
+            yield partition
+    else:
+        result = await run_in_threadpool(db.execute, statement)
+        async for partition in iterate_in_threadpool(result.partitions()):
+            yield partition
+
+
+async def close_db(db):
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
+
+
+# Сессия вне HTTP-запроса (фоновые задачи), режим выбирается так же, как в get_db
+db_session = asynccontextmanager(get_db)
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Выполняет fn(session, *args, **kwargs) не блокируя event loop.
+
+    Для AsyncSession функция выполняется через run_sync поверх asyncpg,
+    для обычной Session - в пуле потоков.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -0,0 +1,9 @@
+import os
+
+
+def env_flag(name: str, default: bool) -> bool:
+    """Булев флаг из переменной окружения: 1/true/yes - включён, любое другое значение - выключен."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
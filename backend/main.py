@@ -1,9 +1,25 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from backend.database import engine, Base
+from backend.database import engine, async_engine, Base, DATABASE_MODE
+from backend.metrics import pool_stats
+from backend.pdf_renderer import pdf_renderer
+from backend.rates_refresher import RATES_REFRESH_ENABLED, rates_refresher
 from backend.routers import todos, repetition, rates, training
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if RATES_REFRESH_ENABLED:
+        rates_refresher.start()
+    await pdf_renderer.start()
+    yield
+    await rates_refresher.stop()
+    pdf_renderer.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 Base.metadata.create_all(bind=engine)
 
@@ -13,6 +29,15 @@ async def health_check():
     return {'status': 'Healthy'}
 
 
+@app.get('/healthy/db-pool')
+async def db_pool_stats():
+    return {
+        'mode': DATABASE_MODE,
+        'sync': pool_stats(engine.pool),
+        'async': pool_stats(async_engine.sync_engine.pool),
+    }
+
+
 app.include_router(todos.router)
 app.include_router(repetition.router)
 app.include_router(rates.router)
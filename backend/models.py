@@ -1,6 +1,18 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Float, Index, func, literal_column
 from backend.database import Base
 
+# Конфигурация без стемминга: задачи пишут и по-русски, и по-английски
+TODO_SEARCH_CONFIG = 'simple'
+
+
+def todo_search_document(title, description):
+    # Индекс используется, только если запрос содержит то же выражение, поэтому константы - литералы, не параметры.
+    # Совпадения в названии (вес A) ранжируются выше совпадений в описании (вес B)
+    config = literal_column(f"'{TODO_SEARCH_CONFIG}'")
+    return func.setweight(func.to_tsvector(config, func.coalesce(title, literal_column("''"))), literal_column("'A'")) \
+        .op('||')(func.setweight(func.to_tsvector(config, func.coalesce(description, literal_column("''"))),
+                                 literal_column("'B'")))
+
 
 class Todos(Base):
     __tablename__ = 'todos'
@@ -9,8 +21,15 @@ class Todos(Base):
     owner_id = Column(Integer, index=True)
     title = Column(String)
     description = Column(String)
-    priority = Column(Integer)
-    complete = Column(Boolean, default=False)
+    # NOT NULL: NULL нельзя сравнить в keyset-курсоре, такие задачи выпадали бы со страниц
+    priority = Column(Integer, nullable=False, default=5, server_default='5')
+    complete = Column(Boolean, nullable=False, default=False, server_default='false')
+
+    __table_args__ = (
+        # id в конце индекса - для keyset-пагинации по (complete, priority, id)
+        Index('ix_todos_owner_id_complete_priority_id', 'owner_id', 'complete', 'priority', 'id'),
+        Index('ix_todos_search', todo_search_document(title, description), postgresql_using='gin'),
+    )
 
 
 class UserWord(Base):
@@ -21,6 +40,15 @@ class UserWord(Base):
     translation = Column(String, nullable=False)
     interval = Column(Integer, nullable=True)
     reminder_date = Column(DateTime)
+    # Состояние алгоритма SM-2, лестница интервалов их не использует
+    ease_factor = Column(Float, nullable=False, default=2.5, server_default='2.5')
+    repetitions = Column(Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        Index('ix_user_words_user_id_reminder_date', 'user_id', 'reminder_date'),
+        # Проверка дубликатов при импорте словаря
+        Index('ix_user_words_user_id_word', 'user_id', 'word'),
+    )
 
 
 class Rates(Base):
@@ -31,6 +59,23 @@ class Rates(Base):
     rate = Column(Float, nullable=False)
     created_at = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_rates_code', 'code', unique=True),
+    )
+
+
+class RateHistory(Base):
+    # Дневные снимки курсов к евро, только дописываются; за день хранится последний курс
+    __tablename__ = 'rate_history'
+    code = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    rate = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # Строки пишутся в порядке дат, поэтому BRIN по дате почти ничего не весит
+        Index('ix_rate_history_date_brin', 'date', postgresql_using='brin'),
+    )
+
 
 class Currency(Base):
     __tablename__ = 'currency'
@@ -49,6 +94,30 @@ class WorkoutRecord(Base):
     weight = Column(Float, nullable=True)
     workout_date = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_workout_record_user_id_workout_date', 'user_id', 'workout_date'),
+    )
+
+
+class WorkoutVersion(Base):
+    # Растёт при каждой новой записи о тренировке; по нему кэшируются PDF-отчёты
+    __tablename__ = 'workout_version'
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+class PersonalRecord(Base):
+    # Лучшие результаты по упражнению; обновляются при каждой записи о тренировке
+    __tablename__ = 'personal_record'
+    user_id = Column(Integer, primary_key=True)
+    exercise_name = Column(String, primary_key=True)
+    best_weight = Column(Float, nullable=False)
+    best_weight_date = Column(DateTime)
+    best_one_rep_max = Column(Float, nullable=False)  # Оценка максимума на одно повторение
+    best_one_rep_max_date = Column(DateTime)
+    best_volume = Column(Float, nullable=False)  # Подходы × повторения × вес одной записи
+    best_volume_date = Column(DateTime)
+
 
 class BodyMeasurements(Base):
     __tablename__ = 'body_measurements'
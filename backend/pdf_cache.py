@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from backend.metrics import Counter
+
+load_dotenv()
+
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Пусто - отчёты хранятся в памяти процесса, иначе - файлами в этом каталоге
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "")
+# Формат записи: байт признака следующей страницы, затем PDF. Входит в ключ, чтобы
+# записи старого формата в общем каталоге не читались, а вытеснялись
+CACHE_FORMAT = 2
+
+
+class CachedReport(NamedTuple):
+    pdf: bytes
+    # Есть ли у отчёта следующая страница (заголовок X-Has-More)
+    has_more: bool
+
+
+def report_key(user_id: int, version: int, scope: list, exercise_name: Optional[str]) -> str:
+    """Адрес отчёта: одинаковые параметры и версия данных дают тот же PDF.
+
+    scope - фильтр по датам, уже не зависящий от сегодняшнего дня (неделя
+    превращена в конкретные даты).
+    """
+    raw = json.dumps([CACHE_FORMAT, user_id, version, scope, exercise_name], default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class PdfCache:
+    """LRU готовых PDF, ограниченный суммарным размером.
+
+    В памяти хранятся сами отчёты; в режиме directory - только размеры, а отчёты
+    лежат файлами <key>.pdf и переживают перезапуск. Индекс меняется только из
+    event loop, файловые операции идут в пуле потоков.
+
+    Каталог могут делить несколько воркеров, поэтому max_bytes ограничивает весь
+    каталог: при сохранении его размер пересчитывается по файлам, а вытесняются
+    файлы с самым старым mtime (чтение из кэша обновляет mtime).
+    """
+
+    def __init__(self, max_bytes: int = PDF_CACHE_MAX_BYTES, directory: Optional[str] = PDF_CACHE_DIR or None):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self._entries = OrderedDict()  # key -> bytes или размер файла
+        self._size = 0
+
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = Counter()
+
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._load_index(self._scan_files())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key):
+        return self.directory / f"{key}.pdf"
+
+    @staticmethod
+    def _entry_size(entry):
+        return entry if isinstance(entry, int) else len(entry)
+
+    def _add(self, key, entry):
+        self._remove(key)
+        self._entries[key] = entry
+        self._size += self._entry_size(entry)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= self._entry_size(entry)
+
+    def _scan_files(self):
+        # (mtime, key, size), самые давно использованные первыми
+        files = []
+        for path in self.directory.glob('*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, path.stem, stat.st_size))
+        files.sort()
+        return files
+
+    def _load_index(self, files):
+        self._entries = OrderedDict((key, size) for _, key, size in files)
+        self._size = sum(size for _, _, size in files)
+
+    def _evict_files(self):
+        files = self._scan_files()
+        total = sum(size for _, _, size in files)
+        evicted = 0
+        while files and total > self.max_bytes:
+            _, key, size = files.pop(0)
+            self._path(key).unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        return files, evicted
+
+    def _touch(self, path):
+        # Явное время: mtime от ядра огрублено до тика, и соседние записи не различить
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def _read_file(self, key):
+        path = self._path(key)
+        pdf = path.read_bytes()
+        self._touch(path)
+        return pdf
+
+    def _write_file(self, key, pdf):
+        # Уникальное имя: тот же отчёт может одновременно сохранять другой запрос или воркер
+        tmp_path = self.directory / f"{key}.{uuid.uuid4().hex}.tmp"
+        tmp_path.write_bytes(pdf)
+        self._touch(tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+    async def get(self, key: str) -> Optional[CachedReport]:
+        entry = self._entries.get(key)
+        if self.directory is not None:
+            # Отчёт мог сохранить или удалить другой воркер с тем же каталогом
+            try:
+                entry = await run_in_threadpool(self._read_file, key)
+            except FileNotFoundError:
+                self._remove(key)
+                entry = None
+            else:
+                self._add(key, len(entry))
+
+        if entry is None:
+            self.misses.inc()
+            return None
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self.hits.inc()
+        return CachedReport(entry[1:], entry[:1] == b'1')
+
+    async def put(self, key: str, pdf: bytes, has_more: bool = False):
+        pdf = (b'1' if has_more else b'0') + pdf
+        if len(pdf) > self.max_bytes:
+            return
+        if self.directory is not None:
+            await run_in_threadpool(self._write_file, key, pdf)
+            # Размер считаем по каталогу, а не по своему индексу: туда же пишут другие воркеры
+            files, evicted = await run_in_threadpool(self._evict_files)
+            self._load_index(files)
+            self.evictions.inc(evicted)
+            return
+
+        self._add(key, pdf)
+        while self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions.inc()
+
+    def stats(self) -> dict:
+        hits, misses = self.hits.value, self.misses.value
+        return {
+            'storage': 'disk' if self.directory is not None else 'memory',
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            'evictions': self.evictions.value,
+        }
+
+
+pdf_cache = PdfCache()
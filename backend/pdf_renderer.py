@@ -0,0 +1,211 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from backend.metrics import Counter, Histogram
+
+load_dotenv()
+
+# Процессов рендера: WeasyPrint занимает ядро целиком, больше числа ядер ставить нет смысла
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", 2))
+# Сколько рендеров может ждать свободного процесса; сверх этого - 503
+PDF_MAX_QUEUE = int(os.getenv("PDF_MAX_QUEUE", 8))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", 30))
+TEMPLATES_DIR = 'backend/templates'
+# Рендер длиннее этого - отчёт за годы, гистограмме нужны корзины крупнее обычных
+RENDER_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# Сколько ждать, пока все процессы пула запустятся и загрузят WeasyPrint
+WARM_UP_TIMEOUT = 60
+
+
+class RendererBusyError(Exception):
+    pass
+
+
+class RenderTimeoutError(Exception):
+    pass
+
+
+class _RenderInterrupted(BaseException):
+    # BaseException: WeasyPrint местами глушит Exception (например, при загрузке картинок)
+    pass
+
+
+# Состояние процесса-воркера: шаблоны и шрифты загружаются один раз при старте
+_templates = None
+_font_config = None
+_warm_up_barrier = None
+
+
+def _on_render_timeout(signum, frame):
+    raise _RenderInterrupted()
+
+
+def _init_worker(templates_dir, warm_up_barrier):
+    global _templates, _font_config, _warm_up_barrier
+
+    from jinja2 import Environment, FileSystemLoader
+    from weasyprint import HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    _templates = Environment(loader=FileSystemLoader(searchpath=templates_dir))
+    _font_config = FontConfiguration()
+    _warm_up_barrier = warm_up_barrier
+    # Первый рендер подгружает pango и fontconfig - пусть это случится до запросов
+    HTML(string='<p>warm-up</p>').write_pdf(font_config=_font_config)
+    signal.signal(signal.SIGALRM, _on_render_timeout)
+
+
+def _render(template_name, context, timeout):
+    from weasyprint import HTML
+
+    started = time.perf_counter()
+    # WeasyPrint почти весь на Python, поэтому сигнал прерывает даже долгую вёрстку
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        html = _templates.get_template(template_name).render(**context)
+        pdf = HTML(string=html).write_pdf(font_config=_font_config)
+    except _RenderInterrupted:
+        raise RenderTimeoutError() from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return pdf, time.perf_counter() - started
+
+
+def _ping():
+    # Воркер ждёт остальных, поэтому каждую задачу прогрева выполняет свой процесс
+    _warm_up_barrier.wait(WARM_UP_TIMEOUT)
+    return os.getpid()
+
+
+class PdfRenderer:
+    """Рендер PDF в пуле процессов, чтобы вёрстка не блокировала event loop.
+
+    В очереди и в работе одновременно не больше workers + max_queue рендеров,
+    остальные сразу получают RendererBusyError. Место освобождается, когда рендер
+    действительно закончился, даже если клиент уже ушёл.
+    """
+
+    def __init__(self, workers: int = PDF_WORKERS, max_queue: int = PDF_MAX_QUEUE,
+                 timeout: float = PDF_RENDER_TIMEOUT, templates_dir: str = TEMPLATES_DIR):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.templates_dir = templates_dir
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._warm_up = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.render_histogram = Histogram(RENDER_BUCKETS_MS)
+        self.latency_histogram = Histogram(RENDER_BUCKETS_MS)
+        self.rendered = Counter()
+        self.rejected = Counter()
+        self.timeouts = Counter()
+        self.failures = Counter()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: форк процесса с потоками пула БД и event loop небезопасен
+            context = multiprocessing.get_context('spawn')
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.templates_dir, context.Barrier(self.workers)),
+            )
+            # spawn-пул запускает процессы лениво, по одному на submit без свободного воркера;
+            # задачи прогрева ждут друг друга, так что поднимаются и инициализируются все
+            self._warm_up = [executor.submit(_ping) for _ in range(self.workers)]
+            self._executor = executor
+        return self._executor
+
+    @staticmethod
+    async def _wait_ready(warm_up):
+        # shield: отмена запроса не должна отменять прогрев, который ждут и другие
+        await asyncio.shield(asyncio.gather(*(asyncio.wrap_future(future) for future in warm_up)))
+
+    async def start(self):
+        """Поднимает и прогревает все процессы, чтобы ни один отчёт не ждал импорта WeasyPrint."""
+        self._get_executor()
+        await self._wait_ready(self._warm_up)
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _reset(self, executor):
+        # Пул мог уже пересоздать другой запрос - его не трогаем
+        if self._executor is executor:
+            self.shutdown()
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    async def render(self, template_name: str, context: dict) -> bytes:
+        """Рендерит шаблон в PDF; context должен сериализоваться pickle."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected.inc()
+                raise RendererBusyError()
+            self._pending += 1
+
+        started = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            # Новый пул (после старта или падения воркера) сначала прогревается целиком
+            await self._wait_ready(self._warm_up)
+            future = executor.submit(_render, template_name, context, self.timeout)
+        except BaseException as exc:
+            self._release(None)
+            if isinstance(exc, BrokenProcessPool):
+                self._reset(executor)
+                raise RendererBusyError() from exc
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            pdf, render_seconds = await asyncio.wrap_future(future)
+        except RenderTimeoutError:
+            self.timeouts.inc()
+            raise
+        except BrokenProcessPool:
+            # Воркер упал (например, по памяти) - следующий рендер поднимет новый пул
+            self.failures.inc()
+            self._reset(executor)
+            raise RendererBusyError()
+        except Exception:
+            self.failures.inc()
+            raise
+
+        self.rendered.inc()
+        self.render_histogram.observe(render_seconds)
+        self.latency_histogram.observe(time.perf_counter() - started)
+        return pdf
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'pending': self._pending,
+            'rendered': self.rendered.value,
+            'rejected': self.rejected.value,
+            'timeouts': self.timeouts.value,
+            'failures': self.failures.value,
+            # render - вёрстка в воркере, latency - вместе с ожиданием в очереди
+            'render_ms': self.render_histogram.snapshot(),
+            'latency_ms': self.latency_histogram.snapshot(),
+        }
+
+
+pdf_renderer = PdfRenderer()
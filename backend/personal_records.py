@@ -0,0 +1,108 @@
+"""Личные рекорды по упражнениям: лучший вес, оценка 1ПМ и объём одной записи.
+
+Таблица personal_record обновляется одним upsert'ом на каждую новую тренировку.
+Полный пересчёт по workout_record (после загрузки истории в обход API):
+
+    python -m backend.personal_records [user_id ...]
+"""
+import asyncio
+import sys
+
+from sqlalchemy import DateTime, case, delete, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert
+
+from backend.database import db_session, run_db
+from backend.models import PersonalRecord, WorkoutRecord
+
+METRICS = ('weight', 'one_rep_max', 'volume')
+
+
+def estimated_one_rep_max(weight, repetitions):
+    # Формула Эпли; на одно повторение максимум - сам вес
+    if repetitions <= 1:
+        return weight
+    return weight * (1 + repetitions / 30)
+
+
+def record_values(record: WorkoutRecord) -> dict:
+    weight = record.weight or 0
+    values = {
+        'weight': weight,
+        'one_rep_max': estimated_one_rep_max(weight, record.repetitions),
+        'volume': record.sets * record.repetitions * weight,
+    }
+    return {
+        'user_id': record.user_id,
+        'exercise_name': record.exercise_name,
+        **{f"best_{metric}": value for metric, value in values.items()},
+        **{f"best_{metric}_date": record.workout_date for metric in METRICS},
+    }
+
+
+def upsert_records(stmt):
+    """Слияние с уже сохранённым рекордом: остаётся лучшее значение и дата, когда оно поставлено."""
+    current, new = PersonalRecord.__table__.c, stmt.excluded
+    set_ = {}
+    for metric in METRICS:
+        best, date = f"best_{metric}", f"best_{metric}_date"
+        set_[best] = func.greatest(current[best], new[best])
+        set_[date] = case((new[best] > current[best], new[date]), else_=current[date])
+    return stmt.on_conflict_do_update(index_elements=[current.user_id, current.exercise_name], set_=set_)
+
+
+def update_personal_records(db, record: WorkoutRecord):
+    """Учитывает новую запись о тренировке; коммит - вместе с самой записью."""
+    db.execute(upsert_records(insert(PersonalRecord).values(**record_values(record))))
+
+
+def rebuild_personal_records(db, user_ids=None) -> int:
+    """Пересчитывает рекорды по всей истории тренировок одним INSERT ... SELECT."""
+    weight = func.coalesce(WorkoutRecord.weight, 0)
+    values = {
+        'weight': weight,
+        'one_rep_max': case((WorkoutRecord.repetitions <= 1, weight),
+                            else_=weight * (1 + WorkoutRecord.repetitions / 30.0)),
+        'volume': WorkoutRecord.sets * WorkoutRecord.repetitions * weight,
+    }
+
+    def achieved_at(value):
+        # Дата первой записи с лучшим значением
+        return func.array_agg(aggregate_order_by(WorkoutRecord.workout_date, value.desc(), WorkoutRecord.workout_date),
+                              type_=ARRAY(DateTime))[1]
+
+    query = select(
+        WorkoutRecord.user_id,
+        WorkoutRecord.exercise_name,
+        *(column for value in values.values() for column in (func.max(value), achieved_at(value))),
+    ).group_by(WorkoutRecord.user_id, WorkoutRecord.exercise_name)
+    clear = delete(PersonalRecord)
+    if user_ids:
+        query = query.where(WorkoutRecord.user_id.in_(user_ids))
+        clear = clear.where(PersonalRecord.user_id.in_(user_ids))
+
+    columns = ['user_id', 'exercise_name', *(name for metric in METRICS for name in (f"best_{metric}", f"best_{metric}_date"))]
+    db.execute(clear)
+    # Тренировку, записанную во время пересчёта, upsert из create_workout сольёт с результатом
+    rebuilt = db.execute(upsert_records(insert(PersonalRecord).from_select(columns, query)))
+    db.commit()
+    return rebuilt.rowcount
+
+
+def get_personal_records(db, user_id):
+    rows = db.query(PersonalRecord).filter(PersonalRecord.user_id == user_id) \
+        .order_by(PersonalRecord.exercise_name) \
+        .all()
+    return [
+        {column.name: getattr(row, column.name) for column in PersonalRecord.__table__.columns if column.name != 'user_id'}
+        for row in rows
+    ]
+
+
+async def main(user_ids):
+    async with db_session() as db:
+        rebuilt = await run_db(db, rebuild_personal_records, user_ids or None)
+    print(f"Пересчитано рекордов: {rebuilt}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main([int(user_id) for user_id in sys.argv[1:]]))
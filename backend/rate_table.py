@@ -0,0 +1,132 @@
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func
+
+from backend.database import run_db
+from backend.models import Currency, Rates
+
+load_dotenv()
+
+# Как часто (в секундах) сверять версию курсов с БД, чтобы увидеть обновление из другого воркера
+RATES_VERSION_POLL_SECONDS = float(os.getenv("RATES_VERSION_POLL_SECONDS", 5))
+
+
+@dataclass(frozen=True)
+class RateTable:
+    """Неизменяемый снимок курсов: вектор курсов к евро и индекс кодов валют."""
+
+    version: Optional[datetime]
+    index: dict
+    rates: np.ndarray
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def rate(self, code) -> float:
+        return float(self.rates[self.index[code]])
+
+    def convert_many(self, sources, targets, amounts):
+        """Конвертирует суммы за один векторный проход.
+
+        Возвращает (results, known, valid): known - оба кода известны,
+        valid - курс источника ненулевой; для невалидных позиций results = nan.
+        """
+        source_index = np.fromiter((self.index.get(code, -1) for code in sources), dtype=np.intp, count=len(sources))
+        target_index = np.fromiter((self.index.get(code, -1) for code in targets), dtype=np.intp, count=len(targets))
+        amounts = np.asarray(amounts, dtype=np.float64)
+
+        known = (source_index >= 0) & (target_index >= 0)
+        valid = known.copy()
+        results = np.full(len(amounts), np.nan)
+        if known.any():
+            source_rates = self.rates[source_index[known]]
+            valid[known] = source_rates != 0
+            results[valid] = amounts[valid] / self.rates[source_index[valid]] * self.rates[target_index[valid]]
+        return results, known, valid
+
+
+def get_rates_version(db):
+    return db.query(func.max(Rates.created_at)).scalar()
+
+
+def load_rate_table(db) -> RateTable:
+    rows = db.query(Rates.code, Rates.rate, Rates.created_at).order_by(Rates.code).all()
+    versions = [created_at for _, _, created_at in rows if created_at is not None]
+
+    return RateTable(
+        version=max(versions) if versions else None,
+        index={code: i for i, (code, _, _) in enumerate(rows)},
+        rates=np.array([rate for _, rate, _ in rows], dtype=np.float64),
+    )
+
+
+def load_currency_titles(db):
+    return dict(db.query(Currency.code, Currency.title).all())
+
+
+class RateTableCache:
+    """Держит актуальный RateTable в памяти процесса.
+
+    Снимок подменяется целиком (присваивание ссылки атомарно), читатели всегда
+    видят согласованный вектор. Обновление из другого воркера замечаем, сверяя
+    max(created_at) не чаще раза в poll_seconds.
+    """
+
+    def __init__(self, poll_seconds: float = RATES_VERSION_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._table: Optional[RateTable] = None
+        self._checked_at = 0.0
+
+    async def get(self, db) -> RateTable:
+        table = self._table
+        if table is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+            return table
+
+        version = await run_db(db, get_rates_version)
+        self._checked_at = time.monotonic()
+        if table is None or version != table.version:
+            table = await self.reload(db)
+        return table
+
+    async def reload(self, db) -> RateTable:
+        table = await run_db(db, load_rate_table)
+        self._table = table
+        self._checked_at = time.monotonic()
+        return table
+
+    def invalidate(self):
+        self._table = None
+
+
+class CurrencyTitlesCache:
+    """Названия валют почти не меняются: читаем таблицу один раз на процесс."""
+
+    def __init__(self):
+        self._titles: Optional[dict] = None
+
+    async def get(self, db) -> dict:
+        titles = self._titles
+        if titles is None:
+            titles = await self.reload(db)
+        return titles
+
+    async def reload(self, db) -> dict:
+        titles = await run_db(db, load_currency_titles)
+        self._titles = titles
+        return titles
+
+    def set(self, titles: dict):
+        self._titles = dict(titles)
+
+    def invalidate(self):
+        self._titles = None
+
+
+rate_table = RateTableCache()
+currency_titles = CurrencyTitlesCache()
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.database import db_session, run_db
+from backend.env import env_flag
+from backend.models import Currency, RateHistory, Rates
+from backend.rate_table import currency_titles, rate_table
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RATES_API_URL = os.getenv("RATES_API_URL", "http://api.exchangeratesapi.io/v1")
+RATES_REFRESH_ENABLED = env_flag("RATES_REFRESH_ENABLED", True)
+RATES_REFRESH_INTERVAL = float(os.getenv("RATES_REFRESH_INTERVAL", 6 * 60 * 60))
+RATES_HTTP_TIMEOUT = float(os.getenv("RATES_HTTP_TIMEOUT", 10))
+RATES_FETCH_ATTEMPTS = int(os.getenv("RATES_FETCH_ATTEMPTS", 4))
+# Через сколько секунд повторить фоновое обновление, если предыдущее не удалось
+RATES_RETRY_DELAY = float(os.getenv("RATES_RETRY_DELAY", 5 * 60))
+# Случайная добавка к ожиданию: воркеры просыпаются в разное время, и первый обновивший
+# курсы избавляет остальных от запроса к API
+RATES_REFRESH_JITTER = float(os.getenv("RATES_REFRESH_JITTER", 60))
+
+
+class UpstreamError(Exception):
+    pass
+
+
+def parse_mapping(path, data, field, convert):
+    """Словарь код -> значение из ответа API; неожиданный формат - UpstreamError."""
+    try:
+        return {str(code): convert(value) for code, value in data[field].items()}
+    except (KeyError, AttributeError, TypeError, ValueError) as exc:
+        raise UpstreamError(f"{path}: неожиданный ответ ({exc!r})") from exc
+
+
+def save_currencies(db, symbols):
+    db.execute(insert(Currency), [{'code': code, 'title': title} for code, title in symbols.items()])
+    db.commit()
+
+
+def save_rates(db, currency_rates, currency_titles):
+    # Один INSERT ... ON CONFLICT на все валюты, время обновления общее
+    currency_date = datetime.now()
+    rows = [
+        {'code': code, 'title': currency_titles.get(code, ''), 'rate': rate, 'created_at': currency_date}
+        for code, rate in currency_rates["rates"].items()
+    ]
+    if not rows:
+        return 0
+
+    stmt = insert(Rates).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Rates.code],
+        set_={'rate': stmt.excluded.rate, 'created_at': stmt.excluded.created_at},
+    )
+    db.execute(stmt)
+
+    # Дневной снимок в историю: повторное обновление в тот же день перезаписывает курс дня
+    history_stmt = insert(RateHistory).values(
+        [{'code': row['code'], 'date': currency_date.date(), 'rate': row['rate']} for row in rows]
+    )
+    history_stmt = history_stmt.on_conflict_do_update(
+        index_elements=[RateHistory.code, RateHistory.date],
+        set_={'rate': history_stmt.excluded.rate},
+    )
+    db.execute(history_stmt)
+    db.commit()
+    return len(rows)
+
+
+class RatesRefresher:
+    """Периодически забирает курсы у внешнего API и сохраняет их.
+
+    Одновременные вызовы refresh() сливаются в один запрос к API (single-flight).
+    При ошибке API последний удачный снимок в БД и в памяти не трогаем.
+    """
+
+    def __init__(self, api_url=RATES_API_URL, token=None, interval=RATES_REFRESH_INTERVAL,
+                 timeout=RATES_HTTP_TIMEOUT, attempts=RATES_FETCH_ATTEMPTS,
+                 retry_delay=RATES_RETRY_DELAY, jitter=RATES_REFRESH_JITTER, backoff_base=1.0, backoff_cap=30.0,
+                 session_factory=db_session):
+        self.api_url = api_url
+        self.token = token if token is not None else os.getenv('RATES_TOKEN')
+        self.interval = interval
+        self.timeout = timeout
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.session_factory = session_factory
+
+        self.last_success: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def backoff(self, attempt: int) -> float:
+        # Экспоненциальная задержка с полным jitter
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def get_json(self, client: httpx.AsyncClient, path: str) -> dict:
+        error = None
+        for attempt in range(self.attempts):
+            if attempt:
+                await asyncio.sleep(self.backoff(attempt - 1))
+            try:
+                response = await client.get(path, params={'access_key': self.token})
+            except httpx.TransportError as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                continue
+
+            # 429 и 5xx - временные ошибки, остальные повторять бессмысленно
+            if response.status_code == 429 or response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+                continue
+            if response.status_code != 200:
+                raise UpstreamError(f"{path}: HTTP {response.status_code}")
+
+            try:
+                data = response.json()
+            except ValueError:
+                raise UpstreamError(f"{path}: ответ не в формате JSON") from None
+            if not isinstance(data, dict):
+                raise UpstreamError(f"{path}: неожиданный ответ")
+            if not data.get('success'):
+                raise UpstreamError(f"{path}: {data.get('error')}")
+            return data
+
+        raise UpstreamError(f"{path}: {error} после {self.attempts} попыток")
+
+    async def refresh(self) -> Optional[int]:
+        """Обновляет курсы; возвращает число обновлённых валют или None при ошибке."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._refresh())
+        # shield: отмена одного из ожидающих не должна прерывать общую загрузку
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self) -> Optional[int]:
+        started = time.perf_counter()
+        try:
+            async with httpx.AsyncClient(base_url=self.api_url, timeout=self.timeout) as client, \
+                    self.session_factory() as db:
+                titles = await currency_titles.get(db)
+                if not titles:
+                    titles = parse_mapping('/symbols', await self.get_json(client, '/symbols'), 'symbols', str)
+                    await run_db(db, save_currencies, titles)
+                    currency_titles.set(titles)
+
+                rates = parse_mapping('/latest', await self.get_json(client, '/latest'), 'rates', float)
+                updated = await run_db(db, save_rates, {'rates': rates}, titles)
+                await rate_table.reload(db)
+        except UpstreamError as exc:
+            self.last_error = str(exc)
+            logger.warning("Не удалось обновить курсы валют: %s", exc)
+            return None
+        except Exception as exc:
+            # Ошибка БД и прочее - статус /refresher должен её показать
+            self.last_error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        self.last_success = datetime.now()
+        self.last_error = None
+        logger.info("Курсы валют обновлены: %s шт. за %s мс", updated, self.last_duration_ms)
+        return updated
+
+    async def _next_delay(self) -> float:
+        # Свежий снимок мог сохранить другой воркер или предыдущий запуск - тогда ждём его старения
+        async with self.session_factory() as db:
+            table = await rate_table.get(db)
+        if table.version is None:
+            return 0
+        age = (datetime.now() - table.version).total_seconds()
+        return max(0.0, self.interval - age)
+
+    async def run_forever(self):
+        while True:
+            try:
+                delay = await self._next_delay()
+            except Exception:
+                logger.exception("Не удалось определить возраст курсов валют")
+                delay = 0
+            if delay > 0:
+                await asyncio.sleep(delay + random.uniform(0, self.jitter))
+                continue
+
+            try:
+                updated = await self.refresh()
+            except Exception:
+                logger.exception("Ошибка фонового обновления курсов валют")
+                updated = None
+            delay = self.interval if updated is not None else min(self.interval, self.retry_delay)
+            await asyncio.sleep(delay + random.uniform(0, self.jitter))
+
+    def start(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+
+    def status(self) -> dict:
+        return {
+            'running': self._loop_task is not None and not self._loop_task.done(),
+            'interval': self.interval,
+            'last_success': self.last_success,
+            'last_error': self.last_error,
+            'last_duration_ms': self.last_duration_ms,
+        }
+
+
+rates_refresher = RatesRefresher()
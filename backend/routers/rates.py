@@ -1,17 +1,18 @@
-from datetime import datetime, timedelta
-from sqlalchemy import func
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Annotated
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import Annotated, Optional, Union
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from backend.database import SessionLocal
-from backend.models import Currency, Rates
+from backend.database import get_db, run_db
+from backend.models import RateHistory
+from backend.rate_table import currency_titles, rate_table
+from backend.rates_refresher import rates_refresher
 from starlette import status
-from pydantic import BaseModel, Field
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from pydantic import BaseModel, Field, model_validator
 
-import requests
+MAX_BATCH_SIZE = 100_000
 
 router = APIRouter(
     prefix="/rates",
@@ -20,103 +21,196 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[Union[Session, AsyncSession], Depends(get_db)]
 
 
 class RateRequest(BaseModel):
     source: str = Field(default="RUB", min_length=3, max_length=3)
     target: str = Field(default="USD", min_length=3, max_length=3)
     sum: float = Field(gt=0)
+    as_of: Optional[date] = Field(None, description="Конвертация по курсу на указанную дату")
 
 
-def get_currency_title(db):
-    currencies = db.query(Currency).all()
-    currency_dict = {currency.code: currency.title for currency in currencies}
+class ConvertItem(BaseModel):
+    source: str = Field(min_length=3, max_length=3)
+    target: str = Field(min_length=3, max_length=3)
+    sum: float = Field(gt=0)
 
-    if not currency_dict:
-        url = f"http://api.exchangeratesapi.io/v1/symbols?access_key={os.getenv('RATES_TOKEN')}"
-        response = requests.get(url)
 
-        if response.status_code == 200:
-            data = response.json()
-            if data["success"]:
-                for code, title in data["symbols"].items():
-                    new_currency = Currency(code=code, title=title)
-                    db.add(new_currency)
-                db.commit()
-            currencies = db.query(Currency).all()
-            currency_dict = {currency.code: currency.title for currency in currencies}
+class ConvertBatchRequest(BaseModel):
+    # Либо список троек source/target/sum, либо одна пара валют и список сумм
+    items: Optional[list[ConvertItem]] = Field(None, max_length=MAX_BATCH_SIZE)
+    source: Optional[str] = Field(None, min_length=3, max_length=3)
+    target: Optional[str] = Field(None, min_length=3, max_length=3)
+    amounts: Optional[list[Annotated[float, Field(gt=0)]]] = Field(None, max_length=MAX_BATCH_SIZE)
+
+    @model_validator(mode='after')
+    def check_shape(self):
+        pair_mode = self.source is not None or self.target is not None or self.amounts is not None
+        if self.items is not None and pair_mode:
+            raise ValueError('Передайте либо items, либо source/target/amounts')
+        if self.items is None and (self.source is None or self.target is None or self.amounts is None):
+            raise ValueError('Для пакетной конвертации нужны items или source, target и amounts')
+        return self
+
+    def columns(self):
+        if self.items is not None:
+            return ([item.source for item in self.items], [item.target for item in self.items],
+                    [item.sum for item in self.items])
+        size = len(self.amounts)
+        return [self.source] * size, [self.target] * size, self.amounts
+
+
+def snapshot_headers(version: datetime) -> dict:
+    return {
+        'ETag': f'"{version.strftime("%Y%m%d%H%M%S%f")}"',
+        # created_at хранится в локальном времени сервера без пояса
+        'Last-Modified': format_datetime(version.astimezone(timezone.utc), usegmt=True),
+        'Cache-Control': 'no-cache',
+    }
+
+
+def is_not_modified(request: Request, headers: dict, version: datetime) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        etags = [etag.strip().removeprefix('W/') for etag in if_none_match.split(',')]
+        return '*' in etags or headers['ETag'] in etags
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # Last-Modified передаётся с точностью до секунды
+        return version.astimezone(timezone.utc).replace(microsecond=0) <= since
+    return False
 
-    return currency_dict
 
+def get_rates_as_of(db, codes, as_of):
+    # Последний известный курс каждой валюты на дату as_of (DISTINCT ON по первичному ключу)
+    rows = db.query(RateHistory.code, RateHistory.rate) \
+        .filter(RateHistory.code.in_(codes), RateHistory.date <= as_of) \
+        .distinct(RateHistory.code) \
+        .order_by(RateHistory.code, RateHistory.date.desc()) \
+        .all()
+    return dict(rows)
 
-def get_rates():
-    url = f"http://api.exchangeratesapi.io/v1/latest?access_key={os.getenv('RATES_TOKEN')}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    return False
+
+def get_rate_history(db, start, end, codes=None):
+    query = db.query(RateHistory.code, RateHistory.date, RateHistory.rate) \
+        .filter(RateHistory.date >= start, RateHistory.date <= end)
+    if codes:
+        query = query.filter(RateHistory.code.in_(codes))
+    return query.order_by(RateHistory.date).all()
 
 
 @router.get('/update-rates', status_code=status.HTTP_200_OK)
-async def get_and_feel_rates(db: db_dependency):
-    currency_titles = get_currency_title(db)
-    currency_rates = get_rates()
+async def get_and_feel_rates():
+    updated = await rates_refresher.refresh()
 
-    if not currency_titles or not currency_rates:
+    if updated is None:
         raise HTTPException(status_code=400, detail="Ошибка получения данных")
 
-    currency_date = datetime.now()
+    return {'message': 'Курсы валют обновлены', 'updated': updated,
+            'duration_ms': rates_refresher.last_duration_ms}
+
+
+@router.get('/currencies', status_code=status.HTTP_200_OK)
+async def list_currencies(db: db_dependency):
+    titles = await currency_titles.get(db)
+    return [{'code': code, 'title': title} for code, title in sorted(titles.items())]
 
-    for code, rate in currency_rates["rates"].items():
-        # Проверяем, существует ли уже валюта с таким кодом в базе
-        existing_currency = db.query(Rates).filter(Rates.code == code).first()
-        if existing_currency:
-            # Если валюта существует, обновляем её курс и время
-            existing_currency.rate = rate
-            existing_currency.created_at = currency_date
-        else:
-            # Если валюты нет, создаём новую запись
-            new_currency = Rates(code=code, title=currency_titles.get(code, ''), rate=rate, created_at=currency_date)
-            db.add(new_currency)
-    db.commit()
-    return {'message': 'Курсы валют обновлены'}
+
+@router.post('/currencies/reload', status_code=status.HTTP_200_OK)
+async def reload_currencies(db: db_dependency):
+    titles = await currency_titles.reload(db)
+    return {'count': len(titles)}
+
+
+@router.get('/refresher', status_code=status.HTTP_200_OK)
+async def refresher_status():
+    return rates_refresher.status()
 
 
 @router.get("/", status_code=status.HTTP_200_OK)
-async def get_last_update(db: db_dependency):
-    last_update = db.query(func.max(Rates.created_at)).scalar()
+async def get_last_update(db: db_dependency, request: Request, response: Response):
+    last_update = (await rate_table.get(db)).version
 
     if last_update is None:
         raise HTTPException(status_code=404, detail="Данные о валютах не найдены")
 
+    headers = snapshot_headers(last_update)
+    if is_not_modified(request, headers, last_update):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+
     return {'status': 'success', "last_update": last_update.strftime("%Y-%m-%d %H:%M:%S")}
 
 
 @router.post('/get-rate', status_code=status.HTTP_200_OK)
 async def get_rate(db: db_dependency, rate_request: RateRequest):
-    source_currency_to_base = db.query(Rates).filter(Rates.code == rate_request.source).first()
-    target_currency_to_base = db.query(Rates).filter(Rates.code == rate_request.target).first()
-
-    if not source_currency_to_base or not target_currency_to_base:
-        raise HTTPException(status_code=404, detail="Неизвестный код валюты")
-
-    # Евро базовая валюта
-    if rate_request.target == "EUR":
-        if source_currency_to_base.rate == 0:
-            raise HTTPException(status_code=400, detail="Некорректный курс валюты источника.")
-        return {'result': rate_request.sum / source_currency_to_base.rate}
-
-    source_in_euro = rate_request.sum / source_currency_to_base.rate
-    sum_result = source_in_euro * target_currency_to_base.rate
-
-    return {'result': sum_result}
+    if rate_request.as_of is not None:
+        codes = {rate_request.source, rate_request.target}
+        rates = await run_db(db, get_rates_as_of, codes, rate_request.as_of)
+        if not codes <= rates.keys():
+            raise HTTPException(status_code=404, detail="Нет курса валюты на указанную дату")
+        source_rate, target_rate = rates[rate_request.source], rates[rate_request.target]
+    else:
+        table = await rate_table.get(db)
+        if rate_request.source not in table or rate_request.target not in table:
+            raise HTTPException(status_code=404, detail="Неизвестный код валюты")
+        source_rate, target_rate = table.rate(rate_request.source), table.rate(rate_request.target)
+
+    # Евро базовая валюта: переводим сумму в евро, затем в целевую валюту
+    if source_rate == 0:
+        raise HTTPException(status_code=400, detail="Некорректный курс валюты источника.")
+
+    return {'result': rate_request.sum / source_rate * target_rate}
+
+
+@router.get('/history', status_code=status.HTTP_200_OK)
+async def rate_history(
+        db: db_dependency,
+        request: Request,
+        response: Response,
+        start: date,
+        end: date,
+        codes: Annotated[Optional[list[str]], Query()] = None,
+):
+    if start > end:
+        raise HTTPException(status_code=400, detail="Начало периода позже его конца")
+
+    # История меняется только вместе со снимком курсов
+    version = (await rate_table.get(db)).version
+    if version is not None:
+        headers = snapshot_headers(version)
+        if is_not_modified(request, headers, version):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+
+    rows = await run_db(db, get_rate_history, start, end, codes)
+
+    history = defaultdict(list)
+    for code, day, rate in rows:
+        history[code].append([day.isoformat(), rate])
+    return {'start': start, 'end': end, 'rates': history}
+
+
+@router.post('/convert-batch', status_code=status.HTTP_200_OK)
+async def convert_batch(db: db_dependency, batch_request: ConvertBatchRequest):
+    table = await rate_table.get(db)
+    sources, targets, amounts = batch_request.columns()
+    results, known, valid = table.convert_many(sources, targets, amounts)
+
+    response = []
+    for result, is_known, is_valid in zip(results.tolist(), known.tolist(), valid.tolist()):
+        if is_valid:
+            response.append({'result': result})
+        elif is_known:
+            response.append({'error': 'Некорректный курс валюты источника.'})
+        else:
+            response.append({'error': 'Неизвестный код валюты'})
+    return {'results': response}
@@ -1,13 +1,19 @@
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from fastapi import APIRouter, Depends
-from typing import Annotated
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Annotated, Literal, Optional, Union
+from sqlalchemy import Integer, String, column, func, literal, select, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from backend.database import SessionLocal
+from backend.database import get_db, run_db
 from backend.models import UserWord
+from backend.scheduling import DEFAULT_GRADE, MAX_GRADE, ReviewState, get_scheduler
+from backend.word_import import LineTooLongError, iter_word_rows
 from starlette import status
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 router = APIRouter(
     prefix="/word",
@@ -16,16 +22,11 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
-REPEAT_SCHEDULE = [1, 2, 5, 7, 10, 14, 20, 25, 30, 35, 50, 60, 120, 180]
+db_dependency = Annotated[Union[Session, AsyncSession], Depends(get_db)]
+MAX_SESSION_SIZE = 100
+MAX_FORECAST_DAYS = 365
+IMPORT_BATCH_SIZE = 1000
+scheduler = get_scheduler()
 
 
 class WordRequest(BaseModel):
@@ -34,49 +35,259 @@ class WordRequest(BaseModel):
     translation: str
 
 
-@router.get('/', status_code=status.HTTP_200_OK)
-async def get_word(db: db_dependency):
+class WordResult(BaseModel):
+    id: int
+    grade: int = Field(DEFAULT_GRADE, ge=0, le=MAX_GRADE)
+
+
+class SessionResultsRequest(BaseModel):
+    user_id: int
+    # word_ids - повторённые слова с оценкой по умолчанию, results - с явной оценкой
+    word_ids: list[int] = Field([], max_length=MAX_SESSION_SIZE)
+    results: list[WordResult] = Field([], max_length=MAX_SESSION_SIZE)
+
+    def grades(self) -> dict:
+        grades = dict.fromkeys(self.word_ids, DEFAULT_GRADE)
+        grades.update((result.id, result.grade) for result in self.results)
+        return grades
+
+
+def due_words_query(db, user_id, current_utc):
+    return db.query(UserWord) \
+        .filter(UserWord.user_id == user_id, UserWord.reminder_date < current_utc + timedelta(days=1))
+
+
+def get_due_word(db, user_id, current_utc):
+    # Диапазон по самой колонке (без func.date), чтобы работал индекс (user_id, reminder_date).
+    # FOR UPDATE SKIP LOCKED: параллельный запрос не получит то же слово и не будет ждать
+    # его блокировку, а возьмёт следующее; блокировка держится до commit в next_word
+    return due_words_query(db, user_id, current_utc) \
+        .order_by(UserWord.reminder_date) \
+        .with_for_update(skip_locked=True) \
+        .first()
+
+
+def reschedule(db, word_model, current_utc, grade=DEFAULT_GRADE):
+    """Переносит слово на следующее повторение по алгоритму scheduler; выученное слово удаляет.
+
+    Возвращает True, если слово удалено. Commit остаётся за вызывающим.
+    """
+    state = scheduler.review(
+        ReviewState(word_model.reminder_date, word_model.interval, word_model.ease_factor, word_model.repetitions),
+        grade,
+        current_utc,
+    )
+    if state is None:
+        db.delete(word_model)
+        return True
+
+    word_model.reminder_date = state.reminder_date
+    word_model.interval = state.interval
+    word_model.ease_factor = state.ease_factor
+    word_model.repetitions = state.repetitions
+    return False
+
+
+def next_word(db, user_id):
     current_utc = datetime.utcnow().date()  # Получаем текущую дату без времени
-    word_model = db.query(UserWord).filter(func.date(UserWord.reminder_date) <= current_utc).first()
+    word_model = get_due_word(db, user_id, current_utc)
 
     if word_model:
-        # Проверяем, является ли текущий интервал последним в расписании
-        if word_model.interval == REPEAT_SCHEDULE[-1]:
-            # Поскольку это последний интервал, возвращаем слово пользователю и удаляем его из базы данных
-            response = {"success": True, "word": word_model.word, "translation": word_model.translation}
-
-            # Удаление слова из базы данных
-            db.delete(word_model)
-            db.commit()
+        response = {"success": True, "word": word_model.word, "translation": word_model.translation}
+        deleted = reschedule(db, word_model, current_utc)
+        db.commit()
 
+        if deleted:
+            # Это был последний интервал: слово возвращено пользователю и удалено из базы данных
             response["message"] = "Это было последнее повторение, слово будет удалено!"
-            return response
         else:
-            # Находим следующий интервал для повторения
-            element_index = REPEAT_SCHEDULE.index(word_model.interval)
-            next_index = element_index + 1 if element_index + 1 < len(REPEAT_SCHEDULE) else element_index
-            new_reminder_date = current_utc + timedelta(days=REPEAT_SCHEDULE[element_index])
-            new_interval = REPEAT_SCHEDULE[next_index]
-
-            # Обновляем дату напоминания и интервал в модели
-            word_model.reminder_date = new_reminder_date
-            word_model.interval = new_interval
-            db.commit()
-
-            return {"success": True, "word": word_model.word, "translation": word_model.translation, 'date': word_model.reminder_date}
+            response["date"] = word_model.reminder_date
+        return response
     else:
         return {"success": False, "message": "Нет слов для повторения"}
 
 
-@router.post('/', status_code=status.HTTP_201_CREATED)
-async def add_word(db: db_dependency, word_request: WordRequest):
+def get_session_words(db, user_id, limit):
+    # Только чтение: слова переносятся, когда бот пришлёт результаты сессии
+    words = due_words_query(db, user_id, datetime.utcnow().date()) \
+        .order_by(UserWord.reminder_date) \
+        .limit(limit) \
+        .all()
+    return [{"id": word.id, "word": word.word, "translation": word.translation} for word in words]
+
+
+def save_session_results(db, user_id, grades):
+    """Переносит все повторённые за сессию слова одной транзакцией.
+
+    grades - {id слова: оценка}. Слова, которые уже не к повторению (их успел
+    перенести другой запрос), или занятые параллельной транзакцией пропускаются.
+    """
+    current_utc = datetime.utcnow().date()
+    words = due_words_query(db, user_id, current_utc) \
+        .filter(UserWord.id.in_(grades)) \
+        .order_by(UserWord.id) \
+        .with_for_update(skip_locked=True) \
+        .all()
+
+    deleted = sum(reschedule(db, word, current_utc, grades[word.id]) for word in words)
+    db.commit()
+    return {"success": True, "updated": len(words) - deleted, "deleted": deleted,
+            "skipped": len(grades) - len(words), "next_reminder_date": get_next_reminder_date(db, user_id)}
+
+
+def get_next_reminder_date(db, user_id):
+    # Ближайшее повторение пользователя - по нему бот планирует напоминание
+    reminder_date = db.query(func.min(UserWord.reminder_date)).filter(UserWord.user_id == user_id).scalar()
+    return reminder_date.date() if reminder_date is not None else None
+
+
+def get_due_summary(db, today, user_ids=None):
+    """Одним агрегатным запросом: сколько слов к повторению и когда ближайшее, по каждому пользователю."""
+    query = db.query(
+        UserWord.user_id,
+        func.count().filter(UserWord.reminder_date < today + timedelta(days=1)),
+        func.min(UserWord.reminder_date),
+    ).filter(UserWord.reminder_date.isnot(None)).group_by(UserWord.user_id)
+    if user_ids:
+        query = query.filter(UserWord.user_id.in_(user_ids))
+
+    return [
+        {"user_id": user_id, "due": due, "next_reminder_date": next_reminder_date.date()}
+        for user_id, due, next_reminder_date in query.all()
+    ]
+
+
+def forecast_reviews(db, user_id, days, today):
+    """Прогноз числа повторений пользователя на каждый из ближайших days дней.
+
+    Состояния всех слов читаются одним запросом, дальше расписание считается векторно.
+    """
+    rows = db.query(UserWord.reminder_date, UserWord.interval, UserWord.ease_factor, UserWord.repetitions) \
+        .filter(UserWord.user_id == user_id, UserWord.reminder_date.isnot(None)) \
+        .all()
+
+    reminder_dates, intervals, ease_factors, repetitions = zip(*rows) if rows else ((), (), (), ())
+    offsets = np.array(reminder_dates, dtype='datetime64[D]') - np.datetime64(today, 'D')
+    counts = scheduler.forecast(
+        offsets.astype(np.int64),
+        [interval or 0 for interval in intervals],
+        ease_factors,
+        repetitions,
+        days,
+    )
+    return [{"date": today + timedelta(days=day), "reviews": int(count)} for day, count in enumerate(counts)]
+
+
+def insert_word(db, word_request: WordRequest):
+    state = scheduler.initial(datetime.utcnow().date())
     word_model = UserWord(
         user_id=word_request.user_id,
         word=word_request.word,
         translation=word_request.translation,
-        interval=REPEAT_SCHEDULE[1],
-        reminder_date=datetime.utcnow().date() + timedelta(days=REPEAT_SCHEDULE[0])
+        interval=state.interval,
+        reminder_date=state.reminder_date,
+        ease_factor=state.ease_factor,
+        repetitions=state.repetitions,
     )
     db.add(word_model)
     db.commit()
     db.refresh(word_model)
+    return state.reminder_date
+
+
+def insert_words_batch(db, user_id, rows):
+    """Вставляет пачку (word, translation) одним INSERT ... SELECT, пропуская дубликаты.
+
+    Дубликатом считается слово, которое уже есть у пользователя или раньше встретилось
+    в этой же пачке. Возвращает число вставленных слов.
+    """
+    # Параллельный импорт того же пользователя ждёт, иначе оба могли бы вставить одно слово
+    db.execute(select(func.pg_advisory_xact_lock(user_id)))
+
+    state = scheduler.initial(datetime.utcnow().date())
+    batch = values(column('word', String), column('translation', String), column('position', Integer),
+                   name='batch').data([(word, translation, i) for i, (word, translation) in enumerate(rows)])
+    existing = select(UserWord.id).where(UserWord.user_id == user_id, UserWord.word == batch.c.word).exists()
+
+    new_words = select(
+        literal(user_id), batch.c.word, batch.c.translation, literal(state.interval),
+        literal(state.reminder_date, UserWord.reminder_date.type),
+        literal(state.ease_factor), literal(state.repetitions),
+    ).where(~existing).distinct(batch.c.word).order_by(batch.c.word, batch.c.position)
+
+    result = db.execute(insert(UserWord).from_select(
+        ['user_id', 'word', 'translation', 'interval', 'reminder_date', 'ease_factor', 'repetitions'],
+        new_words,
+    ))
+    db.commit()
+    return result.rowcount
+
+
+@router.get('/', status_code=status.HTTP_200_OK)
+async def get_word(user_id: int, db: db_dependency):
+    return await run_db(db, next_word, user_id)
+
+
+@router.get('/session', status_code=status.HTTP_200_OK)
+async def get_session(user_id: int, db: db_dependency,
+                      limit: Annotated[int, Query(ge=1, le=MAX_SESSION_SIZE)] = 20):
+    words = await run_db(db, get_session_words, user_id, limit)
+    if not words:
+        return {"success": False, "message": "Нет слов для повторения"}
+    return {"success": True, "words": words}
+
+
+@router.post('/session/results', status_code=status.HTTP_200_OK)
+async def post_session_results(db: db_dependency, results: SessionResultsRequest):
+    return await run_db(db, save_session_results, results.user_id, results.grades())
+
+
+@router.get('/forecast', status_code=status.HTTP_200_OK)
+async def get_forecast(user_id: int, db: db_dependency,
+                       days: Annotated[int, Query(ge=1, le=MAX_FORECAST_DAYS)] = 30):
+    forecast = await run_db(db, forecast_reviews, user_id, days, datetime.utcnow().date())
+    return {"success": True, "scheduler": scheduler.name, "forecast": forecast}
+
+
+@router.get('/due-summary', status_code=status.HTTP_200_OK)
+async def due_summary(db: db_dependency, user_id: Annotated[Optional[list[int]], Query()] = None):
+    return await run_db(db, get_due_summary, datetime.utcnow().date(), user_id)
+
+
+@router.post('/import', status_code=status.HTTP_200_OK)
+async def import_words(user_id: int, request: Request, db: db_dependency,
+                       file_format: Annotated[Literal['csv', 'jsonl'], Query(alias='format')] = 'csv'):
+    """Потоковый импорт словаря из тела запроса (CSV или JSONL).
+
+    Тело читается по частям и пишется пачками по IMPORT_BATCH_SIZE, каждая пачка
+    в своей транзакции. Повторный импорт того же файла ничего не дублирует, поэтому
+    оборвавшуюся загрузку можно просто повторить.
+    """
+    total = inserted = invalid = 0
+    batch = []
+    try:
+        async for row in iter_word_rows(request.stream(), file_format):
+            total += 1
+            if row is None:
+                invalid += 1
+                continue
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                inserted += await run_db(db, insert_words_batch, user_id, batch)
+                batch = []
+        if batch:
+            inserted += await run_db(db, insert_words_batch, user_id, batch)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Файл должен быть в кодировке UTF-8")
+    except LineTooLongError:
+        raise HTTPException(status_code=413, detail="Слишком длинная строка в файле")
+
+    return {"success": True, "total": total, "inserted": inserted,
+            "duplicates": total - invalid - inserted, "invalid": invalid,
+            "next_reminder_date": await run_db(db, get_next_reminder_date, user_id)}
+
+
+@router.post('/', status_code=status.HTTP_201_CREATED)
+async def add_word(db: db_dependency, word_request: WordRequest):
+    reminder_date = await run_db(db, insert_word, word_request)
+    return {"success": True, "reminder_date": reminder_date}
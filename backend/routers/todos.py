@@ -1,11 +1,16 @@
-from fastapi import APIRouter, HTTPException, Path, Depends
+from fastapi import APIRouter, HTTPException, Path, Depends, Query, Response
 from pydantic import BaseModel, Field
-from typing import Annotated
+from typing import Annotated, Literal, Optional, Union
+import re
+from collections import Counter
+from sqlalchemy import case, delete, func, insert, literal_column, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette import status
 
-from backend.database import SessionLocal
-from backend.models import Todos
+from backend.database import get_db, run_db
+from backend.models import TODO_SEARCH_CONFIG, Todos, todo_search_document
+from backend.todo_cache import todo_cache
 
 router = APIRouter(
     prefix="/todos",
@@ -14,15 +19,12 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[Union[Session, AsyncSession], Depends(get_db)]
+TodoField = Literal['id', 'owner_id', 'title', 'description', 'priority', 'complete']
+TODO_FIELDS = ('id', 'owner_id', 'title', 'description', 'priority', 'complete')
+MAX_PAGE_SIZE = 100
+MAX_BULK_OPERATIONS = 1000
+MAX_SEARCH_RESULTS = 100
 
 
 class TodoRequest(BaseModel):
@@ -33,15 +35,242 @@ class TodoRequest(BaseModel):
     complete: bool
 
 
+class CreateOperation(BaseModel):
+    op: Literal['create']
+    todo: TodoRequest
+
+
+class TodoIdOperation(BaseModel):
+    op: Literal['toggle', 'delete']
+    id: int = Field(gt=0)
+
+
+class BulkTodoRequest(BaseModel):
+    operations: list[Annotated[Union[CreateOperation, TodoIdOperation], Field(discriminator='op')]] = Field(
+        min_length=1, max_length=MAX_BULK_OPERATIONS)
+
+
+def toggled(column):
+    return ~column
+
+
+def get_user_todos(db, user_id):
+    columns = [getattr(Todos, name) for name in TODO_FIELDS]
+    return [row._asdict() for row in db.query(*columns).filter(Todos.owner_id == user_id).all()]
+
+
+def encode_cursor(complete, priority, todo_id):
+    return f"{int(complete)}.{priority}.{todo_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        complete, priority, todo_id = cursor.split('.')
+        return bool(int(complete)), int(priority), int(todo_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor.')
+
+
+def get_todos_page(db, user_id, limit, after=None, before=None, fields=TODO_FIELDS):
+    """Страница задач в порядке (complete, priority, id) по курсору (keyset).
+
+    after - следующая страница после задачи с этим ключом, before - предыдущая.
+    Читается только limit + 1 строк по индексу (owner_id, complete, priority, id),
+    сколько бы задач ни было до курсора.
+    """
+    key = (Todos.complete, Todos.priority, Todos.id)
+    # Ключ нужен для курсоров, даже если его нет среди запрошенных полей
+    columns = [getattr(Todos, name) for name in dict.fromkeys((*fields, 'complete', 'priority', 'id'))]
+    query = db.query(*columns).filter(Todos.owner_id == user_id)
+
+    if before is not None:
+        query = query.filter(tuple_(*key) < before).order_by(*(column.desc() for column in key))
+    else:
+        if after is not None:
+            query = query.filter(tuple_(*key) > after)
+        query = query.order_by(*key)
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+
+    has_next = has_more if before is None else True
+    has_prev = after is not None if before is None else has_more
+    return {
+        "items": [{name: getattr(row, name) for name in fields} for row in rows],
+        "next_cursor": encode_cursor(rows[-1].complete, rows[-1].priority, rows[-1].id) if rows and has_next else None,
+        "prev_cursor": encode_cursor(rows[0].complete, rows[0].priority, rows[0].id) if rows and has_prev else None,
+    }
+
+
+def build_search_query(text, mode):
+    config = literal_column(f"'{TODO_SEARCH_CONFIG}'")
+    if mode == 'prefix':
+        # Каждое слово запроса - префикс: "пок мол" найдёт "купить молоко в покупках"
+        words = re.findall(r'\w+', text)
+        if not words:
+            return None
+        return func.to_tsquery(config, ' & '.join(f"{word}:*" for word in words))
+    # Синтаксис поисковиков: "точная фраза", or, -исключение
+    return func.websearch_to_tsquery(config, text)
+
+
+def search_todos(db, user_id, text, mode='words', limit=20):
+    """Поиск по названию и описанию через GIN-индекс ix_todos_search, лучшие совпадения первыми."""
+    ts_query = build_search_query(text, mode)
+    if ts_query is None:
+        return []
+
+    document = todo_search_document(Todos.title, Todos.description)
+    rank = func.ts_rank(document, ts_query)
+    rows = db.query(Todos.id, Todos.title, Todos.description, Todos.priority, Todos.complete, rank.label('rank')) \
+        .filter(Todos.owner_id == user_id, document.op('@@')(ts_query)) \
+        .order_by(rank.desc(), Todos.id) \
+        .limit(limit) \
+        .all()
+    return [row._asdict() for row in rows]
+
+
+def get_todo_by_id(db, todo_id):
+    return db.query(Todos).filter(Todos.id == todo_id).first()
+
+
+def insert_todo(db, data):
+    db.add(Todos(**data))
+    db.commit()
+
+
+def toggle_todo(db, todo_id):
+    # Один UPDATE ... RETURNING вместо SELECT и последующей записи
+    updated = db.execute(
+        update(Todos).where(Todos.id == todo_id).values(complete=toggled(Todos.complete)).returning(Todos.owner_id),
+        execution_options={'synchronize_session': False},
+    ).first()
+    if updated is None:
+        raise HTTPException(status_code=404, detail='Todo not found.')
+    db.commit()
+    return updated.owner_id
+
+
+def remove_todo(db, todo_id):
+    deleted = db.execute(
+        delete(Todos).where(Todos.id == todo_id).returning(Todos.owner_id),
+        execution_options={'synchronize_session': False},
+    ).first()
+    if deleted is None:
+        raise HTTPException(status_code=404, detail='Todo not found.')
+    db.commit()
+    return deleted.owner_id
+
+
+def apply_bulk(db, operations):
+    """Выполняет операции одной транзакцией, по одному запросу на каждый вид операций.
+
+    Порядок: сначала все создания, затем переключения, затем удаления. Повторное
+    переключение одной задачи в запросе учитывается (чётное число - статус не меняется).
+    Возвращает результаты в порядке операций и владельцев изменённых задач.
+    """
+    results = [None] * len(operations)
+    owner_ids = {operation.todo.owner_id for operation in operations if operation.op == 'create'}
+
+    creates = [(i, operation) for i, operation in enumerate(operations) if operation.op == 'create']
+    if creates:
+        created_ids = db.execute(
+            insert(Todos).returning(Todos.id, sort_by_parameter_order=True),
+            [operation.todo.model_dump() for _, operation in creates],
+        ).scalars().all()
+        for (i, _), todo_id in zip(creates, created_ids):
+            results[i] = {'op': 'create', 'id': todo_id}
+
+    toggles = Counter(operation.id for operation in operations if operation.op == 'toggle')
+    toggled_state = {}
+    if toggles:
+        flipped = [todo_id for todo_id, count in toggles.items() if count % 2]
+        rows = db.execute(
+            update(Todos)
+            .where(Todos.id.in_(toggles))
+            .values(complete=case((Todos.id.in_(flipped), toggled(Todos.complete)), else_=Todos.complete))
+            .returning(Todos.id, Todos.complete, Todos.owner_id),
+            execution_options={'synchronize_session': False},
+        ).all()
+        toggled_state = {row.id: row.complete for row in rows}
+        owner_ids.update(row.owner_id for row in rows)
+
+    deletes = {operation.id for operation in operations if operation.op == 'delete'}
+    deleted_ids = set()
+    if deletes:
+        rows = db.execute(
+            delete(Todos).where(Todos.id.in_(deletes)).returning(Todos.id, Todos.owner_id),
+            execution_options={'synchronize_session': False},
+        ).all()
+        deleted_ids = {row.id for row in rows}
+        owner_ids.update(row.owner_id for row in rows)
+
+    db.commit()
+
+    for i, operation in enumerate(operations):
+        if operation.op == 'toggle':
+            found = operation.id in toggled_state
+            results[i] = {'op': 'toggle', 'id': operation.id, 'complete': toggled_state.get(operation.id)}
+        elif operation.op == 'delete':
+            found = operation.id in deleted_ids
+            results[i] = {'op': 'delete', 'id': operation.id}
+        else:
+            continue
+        if not found:
+            results[i] = {'op': operation.op, 'id': operation.id, 'error': 'Todo not found.'}
+    return results, owner_ids
+
+
 @router.get('/', status_code=status.HTTP_200_OK)
 async def read_all(user_id: int, db: db_dependency):
-    return db.query(Todos).filter(Todos.owner_id == user_id).all()
+    content = await todo_cache.get_or_load(user_id, 'all', lambda: run_db(db, get_user_todos, user_id))
+    return Response(content, media_type='application/json')
+
+
+@router.get('/cache', status_code=status.HTTP_200_OK)
+async def cache_stats():
+    return todo_cache.stats()
+
+
+@router.get('/page', status_code=status.HTTP_200_OK)
+async def read_page(user_id: int, db: db_dependency,
+                    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = 20,
+                    after: Optional[str] = None, before: Optional[str] = None,
+                    fields: Annotated[Optional[list[TodoField]], Query()] = None):
+    if after is not None and before is not None:
+        raise HTTPException(status_code=400, detail='Use either after or before.')
+
+    fields = tuple(dict.fromkeys(fields)) if fields else TODO_FIELDS
+    if after is None and before is None:
+        # Первая страница - то, что бот показывает при каждом открытии списка
+        content = await todo_cache.get_or_load(
+            user_id, f"page:{limit}:{','.join(fields)}",
+            lambda: run_db(db, get_todos_page, user_id, limit, None, None, fields),
+        )
+        return Response(content, media_type='application/json')
+
+    return await run_db(
+        db, get_todos_page, user_id, limit,
+        decode_cursor(after) if after is not None else None,
+        decode_cursor(before) if before is not None else None,
+        fields,
+    )
+
+
+@router.get('/search', status_code=status.HTTP_200_OK)
+async def search(user_id: int, q: Annotated[str, Query(min_length=1, max_length=200)], db: db_dependency,
+                 mode: Literal['words', 'prefix'] = 'words',
+                 limit: Annotated[int, Query(ge=1, le=MAX_SEARCH_RESULTS)] = 20):
+    return await run_db(db, search_todos, user_id, q, mode, limit)
 
 
 @router.get("/todo/{todo_id}", status_code=status.HTTP_200_OK)
 async def read_todo(db: db_dependency, todo_id: int = Path(gt=0)):
 
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).first()
+    todo_model = await run_db(db, get_todo_by_id, todo_id)
     if todo_model is not None:
         return todo_model
     raise HTTPException(status_code=404, detail='Todo not found.')
@@ -49,29 +278,24 @@ async def read_todo(db: db_dependency, todo_id: int = Path(gt=0)):
 
 @router.post("/todo", status_code=status.HTTP_201_CREATED)
 async def create_todo(db: db_dependency, todo_request: TodoRequest):
-    todo_model = Todos(**todo_request.model_dump())
+    await run_db(db, insert_todo, todo_request.model_dump())
+    await todo_cache.invalidate(todo_request.owner_id)
 
-    db.add(todo_model)
-    db.commit()
+
+@router.post("/bulk", status_code=status.HTTP_200_OK)
+async def bulk_todos(db: db_dependency, bulk_request: BulkTodoRequest):
+    results, owner_ids = await run_db(db, apply_bulk, bulk_request.operations)
+    await todo_cache.invalidate(*owner_ids)
+    return {'results': results}
 
 
 @router.put("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def update_todo(db: db_dependency, todo_id: int = Path(gt=0)):
-
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).first()
-    if todo_model is None:
-        raise HTTPException(status_code=404, detail='Todo not found.')
-
-    todo_model.complete = not todo_model.complete
-    db.commit()
+    owner_id = await run_db(db, toggle_todo, todo_id)
+    await todo_cache.invalidate(owner_id)
 
 
 @router.delete("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_todo(db: db_dependency, todo_id: int = Path(gt=0)):
-
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).first()
-    if todo_model is None:
-        raise HTTPException(status_code=404, detail='Todo not found.')
-
-    db.query(Todos).filter(Todos.id == todo_id).delete()
-    db.commit()
+    owner_id = await run_db(db, remove_todo, todo_id)
+    await todo_cache.invalidate(owner_id)
@@ -1,27 +1,29 @@
+import codecs
+import csv
+import io
+import json
 from collections import defaultdict
-from enum import Enum
-from weasyprint import HTML
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
-from datetime import datetime, timedelta
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import func
+from sqlalchemy import Date, cast, extract, func, select
+from sqlalchemy.dialects.postgresql import insert
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from backend.database import SessionLocal
-from backend.models import WorkoutRecord, BodyMeasurements
-from typing import Annotated, Optional
-from pydantic import BaseModel, Field
+from backend.database import close_db, get_db, run_db, stream_db
+from backend.models import WorkoutRecord, BodyMeasurements, WorkoutVersion
+from backend.pdf_cache import pdf_cache, report_key
+from backend.pdf_renderer import PDF_RENDER_TIMEOUT, RendererBusyError, RenderTimeoutError, pdf_renderer
+from backend.personal_records import get_personal_records, rebuild_personal_records, update_personal_records
+from typing import Annotated, Literal, Optional, Union
+from pydantic import BaseModel, Field, field_validator
 from starlette import status
 from calendar import monthrange
-from jinja2 import Environment, FileSystemLoader
-import os
 
 
 templates = Jinja2Templates(directory='backend/templates')
-templateLoader = FileSystemLoader(searchpath='backend/templates')
-
-# Создаём объект Environment для загрузки шаблонов
-env = Environment(loader=templateLoader)
 
 router = APIRouter(
     prefix="/workout",
@@ -30,15 +32,12 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[Union[Session, AsyncSession], Depends(get_db)]
+# Записей в одном PDF: вёрстка всего отчёта держится в памяти процесса рендера
+PDF_PAGE_ROWS = 500
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_COLUMNS = ('workout_date', 'exercise_name', 'sets', 'repetitions', 'weight')
+MAX_STATS_WEEKS = 520
 
 
 class WorkoutRecordRequest(BaseModel):
@@ -48,6 +47,14 @@ class WorkoutRecordRequest(BaseModel):
     weight: float = Field(ge=0)
     workout_date: datetime
 
+    @field_validator('workout_date')
+    @classmethod
+    def to_naive_utc(cls, value: datetime) -> datetime:
+        # Колонка без часового пояса: asyncpg не принимает aware-значения
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
 
 def get_period_start_end(period: str):
     today = datetime.today().date()
@@ -78,23 +85,29 @@ async def prepare_pdf(workouts):
     workouts_by_date = defaultdict(list)
     for workout in workouts:
         date = workout.workout_date.date()
-        workouts_by_date[date].append(workout)
+        # В процесс рендера уходят простые словари, а не ORM-объекты
+        workouts_by_date[date].append({
+            'exercise_name': workout.exercise_name,
+            'sets': workout.sets,
+            'repetitions': workout.repetitions,
+            'weight': workout.weight,
+        })
 
-    template = env.get_template('workouts.html')
-    html_content = template.render(workouts_by_date=workouts_by_date)
-    pdf = HTML(string=html_content).write_pdf()
-    return pdf
+    try:
+        return await pdf_renderer.render('workouts.html', {'workouts_by_date': dict(workouts_by_date)})
+    except RendererBusyError:
+        raise HTTPException(status_code=503, detail='Отчёты сейчас формируются для других, попробуйте позже.',
+                            headers={'Retry-After': str(int(PDF_RENDER_TIMEOUT))})
+    except RenderTimeoutError:
+        raise HTTPException(status_code=504, detail='Отчёт слишком большой, выберите период короче.')
 
 
-@router.get('/', status_code=status.HTTP_200_OK)
-async def get_workouts(
-        request: Request,
-        user_id: int,
-        date: Optional[str] = Query(None, description="Дата в формате ДД.ММ.ГГГГ"),
-        period: Optional[str] = Query(None, description="Выберите период или оставьте пустым:", enum=allowed_periods),
-        exercise_name: Optional[str] = None,
-        db: Session = Depends(get_db)
-):
+def find_workouts(db, user_id, date, period, exercise_name, page=1):
+    """Записи для PDF-отчёта, новые первыми, страница page по PDF_PAGE_ROWS записей.
+
+    Возвращает на одну запись больше страницы, если дальше есть ещё записи.
+    None - у пользователя нет ни одной тренировки (для last-workout).
+    """
     query = db.query(WorkoutRecord).filter(WorkoutRecord.user_id == user_id)
 
     # фильтр по дате
@@ -106,17 +119,11 @@ async def get_workouts(
         if period == 'last-workout':
             # Получаем дату последней тренировки
             last_workout_date = db.query(func.max(WorkoutRecord.workout_date)).filter(WorkoutRecord.user_id == user_id).scalar()
-            if last_workout_date:
-                # Получаем все записи за последнюю тренировку
-                workouts = query.filter(WorkoutRecord.workout_date == last_workout_date).all()
-                pdf = await prepare_pdf(workouts)
-
-                headers = {
-                    'Content-Disposition': 'attachment; filename="workout_report.pdf"',
-                }
-                return Response(content=pdf, media_type='application/pdf', headers=headers)
-            else:
-                return {"message": "Последняя тренировка не найдена."}
+            if not last_workout_date:
+                return None
+            # Получаем все записи за последнюю тренировку
+            query = query.filter(WorkoutRecord.workout_date == last_workout_date)
+            exercise_name = None
         else:
             start, end = get_period_start_end(period)
             if start and end:
@@ -125,26 +132,204 @@ async def get_workouts(
     if exercise_name:
         query = query.filter(WorkoutRecord.exercise_name.ilike(f"%{exercise_name}%"))
 
-    if period != 'last-workout':  # Убедимся, что мы не обрабатываем это условие еще раз
-        workouts = query.order_by(WorkoutRecord.workout_date.desc()).all()
+    return query.order_by(WorkoutRecord.workout_date.desc(), WorkoutRecord.id.desc()) \
+        .offset((page - 1) * PDF_PAGE_ROWS) \
+        .limit(PDF_PAGE_ROWS + 1) \
+        .all()
 
-        if not workouts:
-            return {"message": "Ничего не найдено по заданным критериям."}
 
-        pdf = await prepare_pdf(workouts)
+def insert_record(db, model):
+    db.add(model)
+    db.commit()
+
 
-        headers = {
-            'Content-Disposition': 'attachment; filename="workout_report.pdf"',
-        }
-        return Response(content=pdf, media_type='application/pdf', headers=headers)
+def get_workout_version(db, user_id):
+    return db.query(WorkoutVersion.version).filter(WorkoutVersion.user_id == user_id).scalar() or 0
+
+
+def insert_workout(db, model):
+    db.add(model)
+    update_personal_records(db, model)
+    # Версия растёт в той же транзакции: закэшированные отчёты пользователя больше не подходят
+    stmt = insert(WorkoutVersion).values(user_id=model.user_id, version=1)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[WorkoutVersion.user_id],
+        set_={'version': WorkoutVersion.version + 1},
+    ))
+    db.commit()
+
+
+def report_scope(date, period):
+    """Фильтр по датам для ключа кэша: "текущая неделя" сегодня и через неделю - разные отчёты."""
+    if date:
+        return ['date', datetime.strptime(date, "%d.%m.%Y").date()]
+    if period == 'last-workout':
+        # Последняя тренировка определяется только данными, а их меняет версия
+        return ['last-workout']
+    return ['range', *get_period_start_end(period)]
+
+
+@router.get('/', status_code=status.HTTP_200_OK)
+async def get_workouts(
+        request: Request,
+        user_id: int,
+        db: db_dependency,
+        date: Optional[str] = Query(None, description="Дата в формате ДД.ММ.ГГГГ"),
+        period: Optional[str] = Query(None, description="Выберите период или оставьте пустым:", enum=allowed_periods),
+        exercise_name: Optional[str] = None,
+        page: Annotated[int, Query(ge=1, description=f"Страница отчёта по {PDF_PAGE_ROWS} записей")] = 1,
+):
+    headers = {
+        'Content-Disposition': 'attachment; filename="workout_report.pdf"',
+    }
+    version = await run_db(db, get_workout_version, user_id)
+    scope = report_scope(date, period)
+    cache_key = report_key(user_id, version, [*scope, page], exercise_name if scope != ['last-workout'] else None)
+    cached = await pdf_cache.get(cache_key)
+    if cached is not None:
+        headers['X-Has-More'] = '1' if cached.has_more else '0'
+        return Response(content=cached.pdf, media_type='application/pdf', headers=headers)
+
+    workouts = await run_db(db, find_workouts, user_id, date, period, exercise_name, page)
+
+    if workouts is None and page == 1:
+        return {"message": "Последняя тренировка не найдена."}
+    if not workouts:
+        return {"message": "Ничего не найдено по заданным критериям."}
+
+    # Следующую страницу бот запрашивает сам, пока не получит X-Has-More: 0 или сообщение вместо PDF
+    has_more = len(workouts) > PDF_PAGE_ROWS
+    headers['X-Has-More'] = '1' if has_more else '0'
+    pdf = await prepare_pdf(workouts[:PDF_PAGE_ROWS])
+    await pdf_cache.put(cache_key, pdf, has_more)
+    return Response(content=pdf, media_type='application/pdf', headers=headers)
+
+
+def export_query(user_id, exercise_name=None):
+    # Хронологический порядок идёт по индексу (user_id, workout_date) без сортировки всей истории
+    query = select(*(getattr(WorkoutRecord, name) for name in EXPORT_COLUMNS)) \
+        .where(WorkoutRecord.user_id == user_id)
+    if exercise_name:
+        query = query.where(WorkoutRecord.exercise_name.ilike(f"%{exercise_name}%"))
+    return query.order_by(WorkoutRecord.workout_date, WorkoutRecord.id)
+
+
+def csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunk(rows) -> bytes:
+    return ''.join(
+        json.dumps({**row._asdict(), 'workout_date': row.workout_date.isoformat() if row.workout_date else None},
+                   ensure_ascii=False) + '\n'
+        for row in rows
+    ).encode('utf-8')
+
+
+@router.get('/export', status_code=status.HTTP_200_OK)
+async def export_workouts(user_id: int, db: db_dependency, format: Literal['csv', 'ndjson'] = 'csv',
+                          exercise_name: Optional[str] = None):
+    """Вся история тренировок файлом, который отдаётся по мере чтения из БД."""
+    async def chunks():
+        # Тело ответа читается после выхода из get_db: закрытая сессия снова открывает
+        # соединение для курсора, а закрываем её здесь, когда поток дочитан или оборван
+        try:
+            if format == 'csv':
+                # BOM - чтобы Excel открыл кириллицу; импорт слов тоже его понимает
+                yield codecs.BOM_UTF8 + csv_chunk([EXPORT_COLUMNS])
+            async for rows in stream_db(db, export_query(user_id, exercise_name), EXPORT_CHUNK_SIZE):
+                yield csv_chunk(rows) if format == 'csv' else ndjson_chunk(rows)
+        finally:
+            await close_db(db)
+
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    headers = {'Content-Disposition': f'attachment; filename="workouts.{format}"'}
+    return StreamingResponse(chunks(), media_type=media_type, headers=headers)
+
+
+def get_workout_stats(db, user_id, since, exercise_name=None):
+    """Недельные агрегаты по упражнениям, посчитанные в БД одним запросом.
+
+    volume - сумма подходы × повторения × вес, sessions - число дней с упражнением,
+    volume_change - разница с предыдущей неделей, где упражнение было,
+    trend - наклон линейной регрессии недельного объёма (прирост за неделю).
+    """
+    week = func.date_trunc('week', WorkoutRecord.workout_date)
+    weight = func.coalesce(WorkoutRecord.weight, 0)
+    query = select(
+        WorkoutRecord.exercise_name,
+        week.label('week'),
+        func.sum(WorkoutRecord.sets * WorkoutRecord.repetitions * weight).label('volume'),
+        func.max(WorkoutRecord.weight).label('max_weight'),
+        func.count(cast(WorkoutRecord.workout_date, Date).distinct()).label('sessions'),
+    ).where(WorkoutRecord.user_id == user_id, WorkoutRecord.workout_date >= since)
+    if exercise_name:
+        query = query.where(WorkoutRecord.exercise_name.ilike(f"%{exercise_name}%"))
+    weekly = query.group_by(WorkoutRecord.exercise_name, week).subquery()
+
+    by_exercise = {'partition_by': weekly.c.exercise_name}
+    week_number = extract('epoch', weekly.c.week) / (7 * 24 * 60 * 60)
+    rows = db.execute(
+        select(
+            weekly,
+            (weekly.c.volume - func.lag(weekly.c.volume).over(**by_exercise, order_by=weekly.c.week))
+            .label('volume_change'),
+            func.regr_slope(weekly.c.volume, week_number).over(**by_exercise).label('trend'),
+        ).order_by(weekly.c.exercise_name, weekly.c.week)
+    ).all()
+
+    stats = {}
+    for row in rows:
+        exercise = stats.setdefault(row.exercise_name, {
+            'exercise_name': row.exercise_name,
+            'trend': round(row.trend, 2) if row.trend is not None else None,
+            'weeks': [],
+        })
+        exercise['weeks'].append({
+            'week': row.week.date(),
+            'volume': round(row.volume, 2),
+            'max_weight': row.max_weight,
+            'sessions': row.sessions,
+            'volume_change': round(row.volume_change, 2) if row.volume_change is not None else None,
+        })
+    return list(stats.values())
+
+
+@router.get('/stats', status_code=status.HTTP_200_OK)
+async def workout_stats(user_id: int, db: db_dependency,
+                        weeks: Annotated[int, Query(ge=1, le=MAX_STATS_WEEKS)] = 12,
+                        exercise_name: Optional[str] = None):
+    # Считаем с понедельника: первая неделя в ответе полная
+    today = datetime.today().date()
+    since = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+    return await run_db(db, get_workout_stats, user_id, since, exercise_name)
+
+
+@router.get('/records', status_code=status.HTTP_200_OK)
+async def personal_records(user_id: int, db: db_dependency):
+    return await run_db(db, get_personal_records, user_id)
+
+
+@router.post('/records/rebuild', status_code=status.HTTP_200_OK)
+async def rebuild_records(db: db_dependency, user_id: Annotated[Optional[list[int]], Query()] = None):
+    if not user_id:
+        # Пересчёт для всех пользователей - только командой python -m backend.personal_records
+        raise HTTPException(status_code=422, detail='Укажите пользователей для пересчёта рекордов.')
+    return {'rebuilt': await run_db(db, rebuild_personal_records, user_id)}
+
+
+@router.get('/renderer', status_code=status.HTTP_200_OK)
+async def renderer_stats():
+    return {**pdf_renderer.stats(), 'cache': pdf_cache.stats()}
 
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
 async def create_workout(user_id: int, workout_request: WorkoutRecordRequest, db: db_dependency):
     todo_model = WorkoutRecord(**workout_request.model_dump(), user_id=user_id)
 
-    db.add(todo_model)
-    db.commit()
+    await run_db(db, insert_workout, todo_model)
 
 
 class BodyMeasurementsRequest(BaseModel):
@@ -160,27 +345,28 @@ class BodyMeasurementsRequest(BaseModel):
 
 @router.get('/measure', status_code=status.HTTP_200_OK)
 async def get_measurements(user_id: int, db: db_dependency):
-    return db.query(BodyMeasurements).filter(BodyMeasurements.user_id == user_id).first()
+    return await run_db(db, lambda session: session.query(BodyMeasurements).filter(BodyMeasurements.user_id == user_id).first())
 
 
 @router.post('/measure', status_code=status.HTTP_201_CREATED)
 async def create_measurements(user_id: int, measurements_request: BodyMeasurementsRequest, db: db_dependency):
     todo_model = BodyMeasurements(**measurements_request.model_dump(), user_id=user_id)
 
-    db.add(todo_model)
-    db.commit()
+    await run_db(db, insert_record, todo_model)
 
 
-@router.put('/measure/{id}', status_code=status.HTTP_201_CREATED)
-async def update_measurements(id: int, measurements_request: BodyMeasurementsRequest, db: db_dependency):
+def apply_measurements(db, id, update_data):
     db_measurement = db.query(BodyMeasurements).filter(BodyMeasurements.id == id).first()
     if not db_measurement:
         raise HTTPException(status_code=404, detail="Измерение не найдено")
 
-    update_data = measurements_request.model_dump()
-
     for field_name, value in update_data.items():
         if value is not None and value > 0:
             setattr(db_measurement, field_name, value)
 
     db.commit()
+
+
+@router.put('/measure/{id}', status_code=status.HTTP_201_CREATED)
+async def update_measurements(id: int, measurements_request: BodyMeasurementsRequest, db: db_dependency):
+    await run_db(db, apply_measurements, id, measurements_request.model_dump())
@@ -0,0 +1,163 @@
+import math
+import os
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REPEAT_SCHEDULE = [1, 2, 5, 7, 10, 14, 20, 25, 30, 35, 50, 60, 120, 180]
+# Алгоритм повторения: ladder (фиксированная лестница интервалов) или sm2
+REPETITION_SCHEDULER = os.getenv("REPETITION_SCHEDULER", "ladder")
+
+# Оценка ответа по шкале SM-2: 0-2 - не вспомнил, 3-5 - вспомнил (5 - легко)
+MAX_GRADE = 5
+DEFAULT_GRADE = 4
+
+
+@dataclass(frozen=True)
+class ReviewState:
+    reminder_date: date
+    interval: Optional[int]
+    ease_factor: float = 2.5
+    repetitions: int = 0
+
+
+class Scheduler(ABC):
+    """Алгоритм интервального повторения.
+
+    review() считает следующее повторение одного слова по оценке ответа,
+    advance_many() - то же для массивов состояний всех слов сразу (с оценкой
+    DEFAULT_GRADE), на нём строится прогноз нагрузки.
+    """
+
+    name: str
+
+    @abstractmethod
+    def initial(self, today: date) -> ReviewState:
+        """Состояние только что добавленного слова."""
+
+    @abstractmethod
+    def review(self, state: ReviewState, grade: int, today: date) -> Optional[ReviewState]:
+        """Следующее состояние слова; None - слово выучено и удаляется."""
+
+    @abstractmethod
+    def advance_many(self, offsets, intervals, ease_factors, repetitions):
+        """Возвращает (offsets, intervals, ease_factors, repetitions, alive) после следующего повторения.
+
+        offsets - день повторения относительно сегодня, alive - слово не выучено.
+        """
+
+    def forecast(self, offsets, intervals, ease_factors, repetitions, days: int) -> np.ndarray:
+        """Число повторений на каждый из ближайших days дней, включая будущие повторы тех же слов."""
+        counts = np.zeros(days, dtype=np.int64)
+        # Просроченные слова будут повторены сегодня
+        offsets = np.maximum(np.asarray(offsets, dtype=np.int64), 0)
+        state = (offsets, np.asarray(intervals, dtype=np.int64),
+                 np.asarray(ease_factors, dtype=np.float64), np.asarray(repetitions, dtype=np.int64))
+        alive = offsets < days
+
+        # Каждый проход - одно повторение всех ещё не выученных слов; интервалы >= 1 дня,
+        # поэтому цикл заканчивается не позже чем через days проходов
+        while alive.any():
+            state = tuple(array[alive] for array in state)
+            counts += np.bincount(state[0], minlength=days)
+            *state, alive = self.advance_many(*state)
+            alive &= state[0] < days
+        return counts
+
+
+class LadderScheduler(Scheduler):
+    """Фиксированная лестница интервалов, оценка ответа не учитывается.
+
+    В interval хранится интервал, который будет применён на следующем повторении.
+    """
+
+    name = 'ladder'
+
+    def __init__(self, schedule=REPEAT_SCHEDULE):
+        self.schedule = list(schedule)
+        self._steps = np.array(self.schedule, dtype=np.int64)
+
+    def _index(self, interval):
+        # Интервал не из лестницы (например, после смены алгоритма) - ближайшая ступень сверху
+        return min(bisect_left(self.schedule, interval or 0), len(self.schedule) - 1)
+
+    def initial(self, today):
+        return ReviewState(reminder_date=today + timedelta(days=self.schedule[0]), interval=self.schedule[1])
+
+    def review(self, state, grade, today):
+        index = self._index(state.interval)
+        if index == len(self.schedule) - 1:
+            return None
+        return ReviewState(
+            reminder_date=today + timedelta(days=self.schedule[index]),
+            interval=self.schedule[index + 1],
+            ease_factor=state.ease_factor,
+            repetitions=state.repetitions + 1,
+        )
+
+    def advance_many(self, offsets, intervals, ease_factors, repetitions):
+        last = len(self.schedule) - 1
+        index = np.minimum(np.searchsorted(self._steps, intervals), last)
+        return (offsets + self._steps[index], self._steps[np.minimum(index + 1, last)],
+                ease_factors, repetitions + 1, index < last)
+
+
+class SM2Scheduler(Scheduler):
+    """SM-2: интервал растёт с коэффициентом лёгкости, который подстраивается под оценки.
+
+    В interval хранится последний применённый интервал. Слово считается выученным,
+    когда следующий интервал превышает max_interval.
+    """
+
+    name = 'sm2'
+
+    def __init__(self, max_interval=REPEAT_SCHEDULE[-1], min_ease=1.3):
+        self.max_interval = max_interval
+        self.min_ease = min_ease
+
+    @staticmethod
+    def _ease_delta(grade):
+        return 0.1 - (MAX_GRADE - grade) * (0.08 + (MAX_GRADE - grade) * 0.02)
+
+    def initial(self, today):
+        return ReviewState(reminder_date=today + timedelta(days=1), interval=1)
+
+    def review(self, state, grade, today):
+        if grade < 3:
+            # Не вспомнил: повторения начинаются заново, коэффициент не меняется
+            interval, repetitions, ease_factor = 1, 0, state.ease_factor
+        else:
+            if state.repetitions == 0:
+                interval = 1
+            elif state.repetitions == 1:
+                interval = 6
+            else:
+                interval = math.ceil(max(state.interval or 1, 1) * state.ease_factor)
+            repetitions = state.repetitions + 1
+            ease_factor = max(self.min_ease, state.ease_factor + self._ease_delta(grade))
+
+        if interval > self.max_interval:
+            return None
+        return ReviewState(today + timedelta(days=interval), interval, ease_factor, repetitions)
+
+    def advance_many(self, offsets, intervals, ease_factors, repetitions):
+        grown = np.ceil(np.maximum(intervals, 1) * ease_factors).astype(np.int64)
+        intervals = np.where(repetitions == 0, 1, np.where(repetitions == 1, 6, grown))
+        ease_factors = np.maximum(self.min_ease, ease_factors + self._ease_delta(DEFAULT_GRADE))
+        return offsets + intervals, intervals, ease_factors, repetitions + 1, intervals <= self.max_interval
+
+
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (LadderScheduler(), SM2Scheduler())}
+
+
+def get_scheduler(name: str = REPETITION_SCHEDULER) -> Scheduler:
+    if name not in SCHEDULERS:
+        raise ValueError(f"Неизвестный алгоритм повторения: {name}")
+    return SCHEDULERS[name]
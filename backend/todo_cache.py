@@ -0,0 +1,246 @@
+import itertools
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+
+from backend.metrics import Counter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Пусто - кэш в памяти процесса (один воркер), redis://... - общий кэш для нескольких воркеров
+TODOS_CACHE_URL = os.getenv("TODOS_CACHE_URL", "")
+TODOS_CACHE_TTL = float(os.getenv("TODOS_CACHE_TTL", 30))
+# Сколько пользователей держать в кэше процесса
+TODOS_CACHE_SIZE = int(os.getenv("TODOS_CACHE_SIZE", 1024))
+# Разных вариантов списка (весь список, первая страница с разными limit/fields) на пользователя
+MAX_VARIANTS_PER_USER = 16
+
+
+class TodoCacheBackend(ABC):
+    """Хранилище сериализованных списков задач: у каждого пользователя несколько вариантов.
+
+    get() возвращает вместе со значением поколение пользователя; set() с устаревшим
+    поколением ничего не записывает. Так список, прочитанный из БД до изменения,
+    не попадёт в кэш после invalidate().
+    """
+
+    name: str
+
+    @abstractmethod
+    async def get(self, user_id: int, variant: str) -> tuple[Optional[bytes], int]:
+        """(значение или None, текущее поколение пользователя)."""
+
+    @abstractmethod
+    async def set(self, user_id: int, variant: str, value: bytes, generation: int):
+        """Сохраняет значение, если поколение пользователя не менялось с get()."""
+
+    @abstractmethod
+    async def invalidate(self, user_id: int):
+        """Удаляет все варианты пользователя и сдвигает его поколение."""
+
+    @abstractmethod
+    async def clear(self):
+        pass
+
+
+class LocalTodoCache(TodoCacheBackend):
+    """LRU по пользователям с TTL в памяти процесса.
+
+    Все обращения идут из цикла событий без await внутри, поэтому блокировки не нужны.
+    """
+
+    name = 'local'
+
+    def __init__(self, max_users: int = TODOS_CACHE_SIZE, ttl: float = TODOS_CACHE_TTL, clock=time.monotonic):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # user_id -> (expires_at, {variant: value})
+        self._generations = {}
+        # Поколения берутся из общего счётчика: после сброса _generations старые
+        # значения не повторятся, и запоздавший set() не пройдёт
+        self._counter = itertools.count(1)
+        self._floor = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _generation(self, user_id):
+        return self._generations.get(user_id, self._floor)
+
+    def _entry(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] <= self.clock():
+            del self._entries[user_id]
+            return None
+        return entry
+
+    async def get(self, user_id, variant):
+        entry = self._entry(user_id)
+        value = entry[1].get(variant) if entry is not None else None
+        if value is not None:
+            self._entries.move_to_end(user_id)
+        return value, self._generation(user_id)
+
+    async def set(self, user_id, variant, value, generation):
+        if self._generation(user_id) != generation:
+            return
+        entry = self._entry(user_id)
+        if entry is None or len(entry[1]) >= MAX_VARIANTS_PER_USER:
+            entry = (self.clock() + self.ttl, {})
+            self._entries[user_id] = entry
+        entry[1][variant] = value
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+        self._generations[user_id] = next(self._counter)
+        if len(self._generations) > 4 * self.max_users:
+            self._generations.clear()
+            self._floor = next(self._counter)
+
+    async def clear(self):
+        self._entries.clear()
+        self._generations.clear()
+        self._floor = next(self._counter)
+
+
+class RedisTodoCache(TodoCacheBackend):
+    """Общий кэш в Redis: варианты пользователя - поля одного хэша с TTL.
+
+    Вытеснение по памяти - политикой Redis (maxmemory-policy volatile-lru или allkeys-lru).
+    Поколение - отдельный счётчик, set() проверяет его в транзакции WATCH/MULTI.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url: str, ttl: float = TODOS_CACHE_TTL, prefix: str = 'todos', client=None):
+        if client is None:
+            # redis нужен только при общем кэше
+            import redis.asyncio as redis
+            # Недоступный Redis не должен задерживать запросы дольше, чем чтение из БД
+            client = redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.redis = client
+        self.ttl = max(int(ttl), 1)
+        self.prefix = prefix
+
+    def _keys(self, user_id):
+        return f"{self.prefix}:{user_id}", f"{self.prefix}:{user_id}:generation"
+
+    async def get(self, user_id, variant):
+        key, generation_key = self._keys(user_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            value, generation = await pipe.hget(key, variant).get(generation_key).execute()
+        return value, int(generation or 0)
+
+    async def set(self, user_id, variant, value, generation):
+        from redis.exceptions import WatchError
+
+        key, generation_key = self._keys(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(generation_key)
+                if int(await pipe.get(generation_key) or 0) != generation:
+                    return
+                full = await pipe.hlen(key) >= MAX_VARIANTS_PER_USER
+                pipe.multi()
+                if full:
+                    pipe.delete(key)
+                pipe.hset(key, variant, value).expire(key, self.ttl)
+                await pipe.execute()
+            except WatchError:
+                # Список изменили, пока мы читали БД
+                pass
+
+    async def invalidate(self, user_id):
+        key, generation_key = self._keys(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            # Поколение живёт дольше любого чтения из БД, потом может начаться с нуля
+            await pipe.incr(generation_key).expire(generation_key, self.ttl * 10).delete(key).execute()
+
+    async def clear(self):
+        async for key in self.redis.scan_iter(match=f"{self.prefix}:*"):
+            await self.redis.delete(key)
+
+
+def dumps(data) -> bytes:
+    # Тот же формат, что у JSONResponse
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class TodoListCache:
+    """Кэш сериализованных списков задач со счётчиками попаданий.
+
+    Ошибки хранилища не ломают запросы: чтение идёт мимо кэша, а протухшие после
+    неудачного invalidate() данные живут не дольше TTL.
+    """
+
+    def __init__(self, backend: TodoCacheBackend):
+        self.backend = backend
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidations = Counter()
+        self.errors = Counter()
+
+    async def get_or_load(self, user_id: int, variant: str, load: Callable[[], Awaitable]) -> bytes:
+        try:
+            value, generation = await self.backend.get(user_id, variant)
+        except Exception:
+            logger.exception("Кэш задач недоступен")
+            self.errors.inc()
+            return dumps(await load())
+
+        if value is not None:
+            self.hits.inc()
+            return value
+
+        self.misses.inc()
+        value = dumps(await load())
+        try:
+            await self.backend.set(user_id, variant, value, generation)
+        except Exception:
+            logger.exception("Не удалось сохранить задачи пользователя %s в кэш", user_id)
+            self.errors.inc()
+        return value
+
+    async def invalidate(self, *user_ids: int):
+        for user_id in dict.fromkeys(user_ids):
+            self.invalidations.inc()
+            try:
+                await self.backend.invalidate(user_id)
+            except Exception:
+                logger.exception("Не удалось сбросить кэш задач пользователя %s", user_id)
+                self.errors.inc()
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        hits, misses = self.hits.value, self.misses.value
+        return {
+            'backend': self.backend.name,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            'invalidations': self.invalidations.value,
+            'errors': self.errors.value,
+        }
+
+
+def create_backend(url: str = TODOS_CACHE_URL) -> TodoCacheBackend:
+    if url:
+        return RedisTodoCache(url)
+    return LocalTodoCache()
+
+
+todo_cache = TodoListCache(create_backend())
@@ -0,0 +1,83 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Optional
+
+# Строка словаря длиннее этого - скорее всего не текстовый файл; ограничивает буфер парсера
+MAX_LINE_LENGTH = 64 * 1024
+CSV_HEADERS = (['word', 'translation'], ['слово', 'перевод'])
+
+
+class LineTooLongError(Exception):
+    pass
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Построчно декодирует поток байтов; в памяти держим не больше одной недочитанной строки."""
+    # utf-8-sig убирает BOM, который добавляет Excel
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+        if len(buffer) > MAX_LINE_LENGTH:
+            raise LineTooLongError()
+
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer.rstrip('\r')
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[list]:
+    pending = ''
+    async for line in lines:
+        # Поле в кавычках может содержать перевод строки: склеиваем строки, пока кавычки не закрыты
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            if len(pending) > MAX_LINE_LENGTH:
+                raise LineTooLongError()
+            continue
+        yield next(csv.reader([pending]))
+        pending = ''
+    if pending:
+        yield next(csv.reader([pending]))
+
+
+def parse_word(word, translation) -> Optional[tuple]:
+    if not isinstance(word, str) or not isinstance(translation, str):
+        return None
+    word, translation = word.strip(), translation.strip()
+    if not word or not translation:
+        return None
+    return word, translation
+
+
+async def iter_word_rows(chunks: AsyncIterator[bytes], file_format: str) -> AsyncIterator[Optional[tuple]]:
+    """Выдаёт (word, translation) для каждой записи файла или None для некорректной.
+
+    csv - строки "слово,перевод" (заголовок word,translation необязателен),
+    jsonl - по объекту {"word": ..., "translation": ...} на строку. Пустые строки пропускаются.
+    """
+    lines = iter_lines(chunks)
+    if file_format == 'csv':
+        first = True
+        async for record in iter_csv_records(lines):
+            if not record:
+                continue
+            if first and [column.strip().lower() for column in record[:2]] in CSV_HEADERS:
+                first = False
+                continue
+            first = False
+            yield parse_word(*record[:2]) if len(record) >= 2 else None
+    else:
+        async for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield None
+                continue
+            yield parse_word(record.get('word'), record.get('translation')) if isinstance(record, dict) else None
@@ -34,7 +34,9 @@ def get_repetition_keyboard():
     back_button = get_back_button()
     new_word_button = types.InlineKeyboardButton(text="➕ Новое слово", callback_data="new_word")
     repeat_words_button = types.InlineKeyboardButton(text="🔄 Повторить слова", callback_data="repeat_word")
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[repeat_words_button], [new_word_button], [back_button]])
+    import_words_button = types.InlineKeyboardButton(text="📥 Импорт слов из файла", callback_data="import_words")
+    keyboard = types.InlineKeyboardMarkup(
+        inline_keyboard=[[repeat_words_button], [new_word_button], [import_words_button], [back_button]])
     return keyboard
 
 
@@ -63,8 +65,10 @@ def get_workouts_keyboard():
     measurements_button = types.InlineKeyboardButton(text="📏 Параметры тела", callback_data="measurements")
     add_exercise_button = types.InlineKeyboardButton(text="➕ Добавить тренировку", callback_data="add_exercise")
     show_exercises_button = types.InlineKeyboardButton(text="👀 Посмотреть тренировки", callback_data="show_exercises")
+    records_button = types.InlineKeyboardButton(text="🏆 Личные рекорды", callback_data="personal_records")
 
-    keyboard_buttons = [[measurements_button, add_exercise_button], [show_exercises_button], [back_button]]
+    keyboard_buttons = [[measurements_button, add_exercise_button], [show_exercises_button], [records_button],
+                        [back_button]]
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
 
     return {'text': text, 'keyboard': keyboard}
@@ -8,6 +8,7 @@ from aiogram.fsm.state import StatesGroup, State
 from telegram_bot.handlers.handler_dispatcher import *
 
 router = Router()
+last_update_cache = {'etag': None, 'last_update': None}
 
 
 @router.callback_query(lambda c: c.data == 'rates')
@@ -24,20 +25,36 @@ async def rates_page(callback_query: types.CallbackQuery):
 async def get_keyboard_rates(user_id):
     keyboard = get_rates_keyboard(user_id)
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"http://web:8000/rates/")
-        if response.status_code == 200:
-            last_update = response.json()['last_update']
-            last_update_datetime = datetime.strptime(last_update, "%Y-%m-%d %H:%M:%S")
-            formatted_date = last_update_datetime.strftime("%d-%m-%Y")
+    last_update = await get_last_update()
+    if last_update:
+        last_update_datetime = datetime.strptime(last_update, "%Y-%m-%d %H:%M:%S")
+        formatted_date = last_update_datetime.strftime("%d-%m-%Y")
 
-            text = f"🕒 Курсы актуальны на 📅 {formatted_date} 🚀"
-        else:
-            text = 'Не удалось получить данные по курсам'
+        text = f"🕒 Курсы актуальны на 📅 {formatted_date} 🚀"
+    else:
+        text = 'Не удалось получить данные по курсам'
 
     return {'keyboard': keyboard, 'text': text}
 
 
+async def get_last_update():
+    # Условный запрос: пока курсы не обновились, бэкенд отвечает 304 без тела
+    headers = {}
+    if last_update_cache['etag']:
+        headers['If-None-Match'] = last_update_cache['etag']
+
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"http://web:8000/rates/", headers=headers)
+
+    if response.status_code == 304:
+        return last_update_cache['last_update']
+    if response.status_code == 200:
+        last_update_cache['etag'] = response.headers.get('etag')
+        last_update_cache['last_update'] = response.json()['last_update']
+        return last_update_cache['last_update']
+    return None
+
+
 @router.callback_query(lambda c: c.data == 'update_rates')
 async def update_rates(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
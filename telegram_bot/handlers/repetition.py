@@ -1,3 +1,5 @@
+from datetime import date
+
 import httpx
 from aiogram import F
 from aiogram.filters import StateFilter
@@ -5,13 +7,24 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from telegram_bot.handlers.handler_dispatcher import *
 from telegram_bot.logger import logger, log_user_action
+from telegram_bot.reminders import reminder_queue
 
 router = Router()
 word_storage = {}
+# Сессии повторения: слова подгружаются пачкой, результаты отправляются одним запросом
+SESSION_SIZE = 50
+review_sessions = {}
+# Оценки ответа по шкале SM-2 (0-5)
+REMEMBERED_GRADE = 4
+FORGOTTEN_GRADE = 1
 
 
 @router.callback_query(lambda c: c.data == 'words')
 async def words_page(callback_query: types.CallbackQuery):
+    # Пользователь вышел из повторения: сохраняем то, что он успел повторить
+    await submit_session_results(callback_query.from_user.id)
+    review_sessions.pop(callback_query.from_user.id, None)
+
     # Добавляем кнопки действий в отдельный ряд
     keyboard = get_repetition_keyboard()
 
@@ -19,28 +32,69 @@ async def words_page(callback_query: types.CallbackQuery):
                                         reply_markup=keyboard)
 
 
-@router.callback_query(lambda c: c.data == 'repeat_word')
-async def get_word(callback_query: types.CallbackQuery):
+async def fetch_session(user_id):
     async with httpx.AsyncClient() as client:
-        response = await client.get(f"http://web:8000/word/")
+        response = await client.get(f"http://web:8000/word/session",
+                                    params={"user_id": user_id, "limit": SESSION_SIZE})
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        words = data['words'] if data['success'] else []
+        # Если пришло меньше лимита, других слов к повторению сегодня нет
+        return {'words': words, 'reviewed': {}, 'exhausted': len(words) < SESSION_SIZE}
+
+
+async def submit_session_results(user_id):
+    session = review_sessions.get(user_id)
+    if not session or not session['reviewed']:
+        return
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"http://web:8000/word/session/results",
+                                     json={"user_id": user_id, "results": [
+                                         {"id": word_id, "grade": grade} for word_id, grade in session['reviewed'].items()
+                                     ]})
         if response.status_code == 200:
-            data = response.json()
-            if data['success']:
-                word_storage[callback_query.from_user.id] = data
+            session['reviewed'] = {}
+            next_reminder_date = response.json()['next_reminder_date']
+            reminder_queue.schedule(user_id, date.fromisoformat(next_reminder_date) if next_reminder_date else None)
+        else:
+            logger.error(f"Не удалось сохранить результаты повторения: {response.status_code}")
 
-                next_word_button = types.InlineKeyboardButton(text="Следующее ➡️", callback_data="repeat_word")
-                translate_button = types.InlineKeyboardButton(text="👁 Перевод", callback_data="show_translation")
-                back_button = types.InlineKeyboardButton(text="🔙 Назад", callback_data="words")
 
-                keyboard = types.InlineKeyboardMarkup(
-                    inline_keyboard=[[translate_button, next_word_button], [back_button]])
+@router.callback_query(lambda c: c.data == 'repeat_word')
+async def get_word(callback_query: types.CallbackQuery):
+    user_id = callback_query.from_user.id
+    session = review_sessions.get(user_id)
+    if session is None or not session['words']:
+        # Результаты отправляем только перед следующей пачкой: оценку последнего слова ещё можно изменить
+        await submit_session_results(user_id)
+        if session is None or not session['exhausted']:
+            session = await fetch_session(user_id)
+            if session is None:
+                await callback_query.answer()
+                return
+            review_sessions[user_id] = session
+
+    if session['words']:
+        data = session['words'].pop(0)
+        session['reviewed'][data['id']] = REMEMBERED_GRADE
+        word_storage[user_id] = data
 
-                await callback_query.message.answer(text=f"🇬🇧 {data['word']}", reply_markup=keyboard)
-            else:
-                await callback_query.message.answer(
-                    f"🚫 {data['message']} 🚫 \nКажется, на сегодня все задания выполнены! 🎉")
-                await words_page(callback_query)
-        await callback_query.answer()
+        next_word_button = types.InlineKeyboardButton(text="Следующее ➡️", callback_data="repeat_word")
+        translate_button = types.InlineKeyboardButton(text="👁 Перевод", callback_data="show_translation")
+        back_button = types.InlineKeyboardButton(text="🔙 Назад", callback_data="words")
+
+        keyboard = types.InlineKeyboardMarkup(
+            inline_keyboard=[[translate_button, next_word_button], [back_button]])
+
+        await callback_query.message.answer(text=f"🇬🇧 {data['word']}", reply_markup=keyboard)
+    else:
+        # Следующее нажатие "Повторить слова" снова спросит бэкенд
+        review_sessions.pop(user_id, None)
+        await callback_query.message.answer(
+            "🚫 Нет слов для повторения 🚫 \nКажется, на сегодня все задания выполнены! 🎉")
+        await words_page(callback_query)
+    await callback_query.answer()
 
 
 @router.callback_query(lambda c: c.data == 'show_translation')
@@ -48,14 +102,26 @@ async def show_translation(callback_query: types.CallbackQuery):
     data = word_storage.get(callback_query.from_user.id, {})
     if data:
         next_word_button = types.InlineKeyboardButton(text="Следующее ➡️", callback_data="repeat_word")
+        forgot_button = types.InlineKeyboardButton(text="🔁 Не вспомнил", callback_data="forgot_word")
         back_button = types.InlineKeyboardButton(text="🔙 Назад", callback_data="words")
-        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[back_button, next_word_button]])
+        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[forgot_button, next_word_button], [back_button]])
         await callback_query.message.edit_text(f"🇬🇧 {data['word']}\n🇷🇺 {data['translation']}", reply_markup=keyboard)
     else:
         await callback_query.message.edit_text("Извините, произошла ошибка.")
     await callback_query.answer()
 
 
+@router.callback_query(lambda c: c.data == 'forgot_word')
+async def forgot_word(callback_query: types.CallbackQuery):
+    user_id = callback_query.from_user.id
+    data = word_storage.get(user_id, {})
+    session = review_sessions.get(user_id)
+    if data and session and data['id'] in session['reviewed']:
+        # С низкой оценкой SM-2 начнёт повторения слова заново
+        session['reviewed'][data['id']] = FORGOTTEN_GRADE
+    await get_word(callback_query)
+
+
 class WordCreation(StatesGroup):
     waiting_for_word = State()
     waiting_for_translate = State()
@@ -131,4 +197,66 @@ async def process_translate_sent(message: types.Message, state: FSMContext):
 async def add_new_word(word_data):
     async with httpx.AsyncClient() as client:
         response = await client.post(f"http://web:8000/word/", json=word_data)
-        return response.status_code == 201
+        if response.status_code != 201:
+            return False
+        reminder_queue.schedule_earlier(word_data['user_id'], date.fromisoformat(response.json()['reminder_date']))
+        return True
+
+
+class WordImport(StatesGroup):
+    waiting_for_file = State()
+
+
+@router.callback_query(lambda c: c.data == 'import_words')
+async def import_words_start(callback_query: CallbackQuery, state: FSMContext):
+    cancel_button = InlineKeyboardButton(text="❌ Отменить ❌", callback_data="cancel_input")
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[cancel_button]])
+
+    await callback_query.message.answer(
+        "📥 Отправьте файл со словами в кодировке UTF-8:\n"
+        "• .csv - строки вида слово,перевод\n"
+        "• .jsonl - строки вида {\"word\": \"...\", \"translation\": \"...\"}\n"
+        "Слова, которые уже есть в словаре, будут пропущены.",
+        reply_markup=keyboard
+    )
+    await state.set_state(WordImport.waiting_for_file)
+
+
+@router.message(StateFilter(WordImport.waiting_for_file), F.document)
+async def process_import_file(message: Message, state: FSMContext):
+    document = message.document
+    file_name = (document.file_name or '').lower()
+    file_format = 'jsonl' if file_name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    file = await message.bot.get_file(document.file_id)
+    file_url = message.bot.session.api.file_url(message.bot.token, file.file_path)
+
+    # Файл не загружается в память бота: байты из Telegram сразу уходят потоком в бэкенд
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10, read=300)) as client:
+        async with client.stream('GET', file_url) as telegram_file:
+            response = await client.post(f"http://web:8000/word/import",
+                                         params={"user_id": message.from_user.id, "format": file_format},
+                                         content=telegram_file.aiter_bytes())
+
+    if response.status_code == 200:
+        data = response.json()
+        if data['next_reminder_date']:
+            reminder_queue.schedule(message.from_user.id, date.fromisoformat(data['next_reminder_date']))
+        await message.answer(
+            f"✅ Импорт завершён\n"
+            f"Добавлено: {data['inserted']}\n"
+            f"Уже были в словаре: {data['duplicates']}\n"
+            f"Некорректных строк: {data['invalid']}",
+            reply_markup=get_repetition_keyboard()
+        )
+    else:
+        logger.error(f"Ошибка импорта слов: {response.status_code} {response.text}")
+        detail = response.json().get('detail') if response.status_code in (400, 413) else None
+        await message.answer(f"❌ Не удалось импортировать слова{': ' + detail if detail else ''}",
+                             reply_markup=get_repetition_keyboard())
+    await state.clear()
+
+
+@router.message(StateFilter(WordImport.waiting_for_file))
+async def process_import_not_file(message: Message):
+    await message.answer("⚠️ Пришлите словарь файлом (.csv или .jsonl) ⚠️")
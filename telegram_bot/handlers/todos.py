@@ -1,12 +1,14 @@
 from aiogram import types, Router, F
 import httpx
-from aiogram.filters import StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from telegram_bot.handlers.handler_dispatcher import get_back_button
 from aiogram.types import (CallbackQuery, Message, InlineKeyboardButton, InlineKeyboardMarkup)
 
 router = Router()
+# Telegram плохо показывает длинные клавиатуры: задачи выводятся страницами
+TODOS_PAGE_SIZE = 8
 
 
 @router.callback_query(lambda c: c.data == 'todos')
@@ -18,19 +20,44 @@ async def show_todos(callback_query: types.CallbackQuery):
                                         reply_markup=task_buttons['keyboard'])
 
 
-async def get_todos_by_user(user_id):
+@router.callback_query(lambda c: c.data and c.data.startswith(('todos_next_', 'todos_prev_')))
+async def show_todos_page(callback_query: types.CallbackQuery):
+    direction, cursor = callback_query.data.removeprefix('todos_').split('_', 1)
+    page = {'after': cursor} if direction == 'next' else {'before': cursor}
+    task_buttons = await get_todos_by_user(callback_query.from_user.id, **page)
+
+    # Листание меняет клавиатуру в том же сообщении
+    await callback_query.message.edit_reply_markup(reply_markup=task_buttons['keyboard'])
+    await callback_query.answer()
+
+
+async def get_todos_by_user(user_id, after=None, before=None):
+    params = {"user_id": user_id, "limit": TODOS_PAGE_SIZE, "fields": ["id", "title", "complete"]}
+    if after is not None:
+        params["after"] = after
+    if before is not None:
+        params["before"] = before
+
     async with httpx.AsyncClient() as client:
-        response = await client.get(f"http://web:8000/todos/", params={"user_id": user_id})
+        response = await client.get(f"http://web:8000/todos/page", params=params)
         if response.status_code == 200:
-            todos = response.json()
+            page = response.json()
         else:
-            todos = []
+            page = {"items": [], "next_cursor": None, "prev_cursor": None}
 
     task_buttons = [
         [types.InlineKeyboardButton(text=f"{todo['title']} {'✅' if todo['complete'] else '➖'}", callback_data=f"todo_detail_{todo['id']}")]
-        for todo in todos
+        for todo in page['items']
     ]
 
+    page_buttons = []
+    if page['prev_cursor']:
+        page_buttons.append(types.InlineKeyboardButton(text="⬅️", callback_data=f"todos_prev_{page['prev_cursor']}"))
+    if page['next_cursor']:
+        page_buttons.append(types.InlineKeyboardButton(text="➡️", callback_data=f"todos_next_{page['next_cursor']}"))
+    if page_buttons:
+        task_buttons.append(page_buttons)
+
     back_button = get_back_button()
     new_task_button = types.InlineKeyboardButton(text="➕ Новая задача", callback_data="new_todo")
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=task_buttons + [[back_button, new_task_button]])
@@ -39,6 +66,28 @@ async def get_todos_by_user(user_id):
     return {'keyboard': keyboard, 'text': text}
 
 
+# Поиск задач: /find молоко, по началу слов (можно вводить не целиком)
+@router.message(Command('find'))
+async def find_todos(message: Message, command: CommandObject):
+    if not command.args:
+        await message.answer("🔎 Напишите, что искать: /find купить молоко")
+        return
+
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"http://web:8000/todos/search",
+                                    params={"user_id": message.from_user.id, "q": command.args[:200],
+                                            "mode": "prefix", "limit": TODOS_PAGE_SIZE})
+        todos = response.json() if response.status_code == 200 else []
+
+    task_buttons = [
+        [types.InlineKeyboardButton(text=f"{todo['title']} {'✅' if todo['complete'] else '➖'}", callback_data=f"todo_detail_{todo['id']}")]
+        for todo in todos
+    ]
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=task_buttons + [[get_back_button()]])
+    text = f"🔎 Найдено задач: {len(todos)}" if todos else "🔎 Ничего не найдено"
+    await message.answer(text, reply_markup=keyboard)
+
+
 @router.callback_query(lambda c: c.data and c.data.startswith('todo_detail_'))
 async def show_todo_details(callback_query: types.CallbackQuery):
     todo_id = callback_query.data.split('_')[2]
@@ -14,6 +14,9 @@ from telegram_bot.logger import logger, log_user_action
 
 router = Router()
 
+# Сколько PDF-страниц отчёта отправлять за раз; полную историю лучше выгружать в CSV
+REPORT_MAX_PAGES = 5
+
 
 @router.callback_query(lambda c: c.data == 'workouts')
 async def workouts_page(callback_query: types.CallbackQuery):
@@ -22,6 +25,39 @@ async def workouts_page(callback_query: types.CallbackQuery):
     await callback_query.message.answer(workouts['text'], reply_markup=workouts['keyboard'])
 
 
+@router.callback_query(lambda c: c.data == 'personal_records')
+async def personal_records_page(callback_query: types.CallbackQuery):
+    async with httpx.AsyncClient() as client:
+        response = await client.get("http://web:8000/workout/records", params={"user_id": callback_query.from_user.id})
+
+    back_button = types.InlineKeyboardButton(text="🔙 Назад", callback_data="workouts")
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[back_button]])
+    if response.status_code != 200:
+        logger.error(f"Ошибка получения рекордов: {response.status_code}")
+        await callback_query.message.answer("❌ Не удалось получить рекорды", reply_markup=keyboard)
+        return
+
+    records = response.json()
+    if not records:
+        await callback_query.message.answer("🏆 Рекордов пока нет: добавьте первую тренировку", reply_markup=keyboard)
+        return
+
+    text = "🏆 Личные рекорды 🏆\n"
+    for record in records:
+        block = (
+            f"\n💪 {record['exercise_name']}\n"
+            f"Вес: {record['best_weight']:g} кг\n"
+            f"Разовый максимум (оценка): {record['best_one_rep_max']:.1f} кг\n"
+            f"Объём (подходы × повторения × вес): {record['best_volume']:g} кг\n"
+        )
+        # Сообщение в Telegram не длиннее 4096 символов
+        if len(text) + len(block) > 4000:
+            await callback_query.message.answer(text)
+            text = ""
+        text += block
+    await callback_query.message.answer(text, reply_markup=keyboard)
+
+
 param_names = {
     "hips": "Объем бедер",
     "chest": "Объем груди",
@@ -384,13 +420,14 @@ async def get_filtres_buttons():
     show_lastmonth_button = types.InlineKeyboardButton(text="За прошлый месяц",
                                                        callback_data="show_workout_last-month")
     show_all_workouts_button = types.InlineKeyboardButton(text="Все тренировки", callback_data="show_workout_all")
+    export_button = types.InlineKeyboardButton(text="📤 Выгрузить всё в CSV", callback_data="export_workouts")
     show_date_button = types.InlineKeyboardButton(text="По дате", callback_data="show_workout_date")
     name_exercise_button = types.InlineKeyboardButton(text="По названию", callback_data="show_workout_exercise-name")
 
     keyboard_buttons = [
         [show_date_button], [name_exercise_button],
         [last_workout_button], [show_curweek_button], [show_lastweek_button], [show_curmonth_button],
-        [show_lastmonth_button], [show_all_workouts_button],
+        [show_lastmonth_button], [show_all_workouts_button], [export_button],
         [back_button]
     ]
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
@@ -428,9 +465,7 @@ async def filter_workouts(callback_query: types.CallbackQuery, state: FSMContext
         back_button = types.InlineKeyboardButton(text="🔙 Назад", callback_data="show_exercises")
         add_exercise = types.InlineKeyboardButton(text="➕ Добавить тренировку", callback_data="add_exercise")
         keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[back_button, add_exercise]])
-        file = await get_workouts_by_filter(callback_query.from_user.id, filter_type, 'period', callback_query)
-        if file:
-            await callback_query.bot.send_document(callback_query.from_user.id, FSInputFile(file))
+        if await send_workout_reports(callback_query.from_user.id, filter_type, 'period', callback_query):
             await callback_query.message.answer('Для возврата к фильтрам нажмите кнопку ниже', reply_markup=keyboard)
         else:
             await callback_query.message.answer('😔 По заданному периоду тренировок не найдено', reply_markup=keyboard)
@@ -464,19 +499,30 @@ async def receive_filter_input(message: types.Message, state: FSMContext):
     add_exercise = types.InlineKeyboardButton(text="➕ Добавить тренировку", callback_data="add_exercise")
     keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[back_button, add_exercise]])
     data = await state.get_data()
-    file = await get_workouts_by_filter(message.from_user.id, data['target'], filter_type, message)
-
-    if file:
-        await message.answer_document(FSInputFile(file))
+    if await send_workout_reports(message.from_user.id, data['target'], filter_type, message):
         await message.answer('Для возврата к фильтрам нажмите кнопку ниже', reply_markup=keyboard)
     else:
         await message.answer('😔 По заданному периоду тренировок не найдено', reply_markup=keyboard)
     await state.clear()
 
 
-async def get_workouts_by_filter(user_id, filter, type, obj):
+async def send_workout_reports(user_id, filter, type, obj) -> bool:
+    """Отправляет отчёт постранично; False - ничего не найдено."""
+    for page in range(1, REPORT_MAX_PAGES + 1):
+        file, has_more = await get_workouts_by_filter(user_id, filter, type, obj, page)
+        if not file:
+            return page > 1
+        await obj.bot.send_document(user_id, FSInputFile(file))
+        if not has_more:
+            return True
+
+    await obj.bot.send_message(user_id, "📄 Показаны последние записи. Всю историю можно выгрузить в CSV")
+    return True
+
+
+async def get_workouts_by_filter(user_id, filter, type, obj, page=1):
     logger.info(type)
-    params = {'user_id': user_id}
+    params = {'user_id': user_id, 'page': page}
     if type == 'period' and filter != 'all':
         params['period'] = filter
     elif type == 'date':
@@ -498,5 +544,28 @@ async def get_workouts_by_filter(user_id, filter, type, obj):
             with open(temp_pdf_path, 'wb') as pdf_file:
                 pdf_file.write(pdf_content)
 
-            return temp_pdf_path
-        return False
+            return temp_pdf_path, response.headers.get('X-Has-More') != '0'
+        return False, False
+
+
+@router.callback_query(lambda c: c.data == "export_workouts")
+async def export_workouts(callback_query: types.CallbackQuery):
+    user_id = callback_query.from_user.id
+    temp_csv_path = f"workouts_{user_id}.csv"
+
+    # История может быть большой: пишем файл по мере получения, не собирая его в памяти
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10, read=300)) as client:
+        async with client.stream('GET', "http://web:8000/workout/export",
+                                 params={'user_id': user_id, 'format': 'csv'}) as response:
+            if response.status_code != 200:
+                logger.error(f"Ошибка выгрузки тренировок: {response.status_code}")
+                await callback_query.message.answer('❌ Не удалось выгрузить тренировки')
+                return
+            with open(temp_csv_path, 'wb') as csv_file:
+                async for chunk in response.aiter_bytes():
+                    csv_file.write(chunk)
+
+    try:
+        await callback_query.bot.send_document(user_id, FSInputFile(temp_csv_path))
+    finally:
+        os.remove(temp_csv_path)
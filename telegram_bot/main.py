@@ -3,6 +3,7 @@ import asyncio
 from aiogram import Bot, Dispatcher
 from telegram_bot.config import Config, load_config
 from telegram_bot.handlers import handler_dispatcher, todos, repetition, rates, workouts
+from telegram_bot.reminders import REMINDERS_ENABLED, run_reminders
 
 
 # Функция конфигурирования и запуска бота
@@ -21,9 +22,16 @@ async def main():
     dp.include_router(rates.router)
     dp.include_router(workouts.router)
 
+    # Напоминания о словах к повторению рассылаются в фоне, пока работает polling
+    reminders_task = asyncio.create_task(run_reminders(bot)) if REMINDERS_ENABLED else None
+
     # Пропускаем накопившиеся апдейты и запускаем polling
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if reminders_task is not None:
+            reminders_task.cancel()
 
 
 asyncio.run(main())
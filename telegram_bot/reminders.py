@@ -0,0 +1,242 @@
+import asyncio
+import enum
+import heapq
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+import httpx
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from dotenv import load_dotenv
+
+from backend.env import env_flag
+from telegram_bot.logger import logger
+
+load_dotenv()
+
+REMINDERS_ENABLED = env_flag("REMINDERS_ENABLED", True)
+# Час (UTC), в который приходит напоминание о словах на этот день
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", 9))
+# Telegram допускает около 30 сообщений в секунду на рассылку, оставляем запас
+REMINDERS_RATE = float(os.getenv("REMINDERS_RATE", 25))
+# Полная пересборка очереди раз в сутки подхватывает слова, добавленные в обход бота
+REMINDERS_REBUILD_INTERVAL = float(os.getenv("REMINDERS_REBUILD_INTERVAL", 24 * 60 * 60))
+REMINDERS_RETRY_DELAY = timedelta(minutes=5)
+SUMMARY_CHUNK_SIZE = 500
+SEND_ATTEMPTS = 3
+
+
+class Delivery(enum.Enum):
+    SENT = 'sent'
+    # Бот заблокирован или чат недоступен - не напоминаем до пересборки очереди
+    BLOCKED = 'blocked'
+    # Telegram или сеть не ответили - попробуем через REMINDERS_RETRY_DELAY
+    RETRY = 'retry'
+
+
+def notify_at(reminder_date: date, now: datetime) -> datetime:
+    """Когда напомнить о словах с датой повторения reminder_date.
+
+    Если этот момент уже прошёл, напоминание за тот день считается отправленным
+    и переносится на ближайший REMINDER_HOUR.
+    """
+    at = datetime.combine(reminder_date, time(REMINDER_HOUR))
+    if at > now:
+        return at
+    at = datetime.combine(now.date(), time(REMINDER_HOUR))
+    return at if at > now else at + timedelta(days=1)
+
+
+class ReminderQueue:
+    """Время следующего напоминания для каждого пользователя.
+
+    Куча (время, user_id) с ленивым удалением: при переносе старая запись остаётся
+    в куче и пропускается, если не совпадает с актуальной из _scheduled.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._scheduled = {}
+        self.changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def get(self, user_id) -> Optional[datetime]:
+        return self._scheduled.get(user_id)
+
+    def _push(self, user_id, at):
+        if self._scheduled.get(user_id) == at:
+            return
+        self._scheduled[user_id] = at
+        heapq.heappush(self._heap, (at, user_id))
+        if len(self._heap) > 2 * len(self._scheduled) + 64:
+            self._compact()
+        self.changed.set()
+
+    def _compact(self):
+        self._heap = [(at, user_id) for user_id, at in self._scheduled.items()]
+        heapq.heapify(self._heap)
+
+    def schedule(self, user_id, reminder_date: Optional[date], now: Optional[datetime] = None):
+        """Ставит напоминание по ближайшей дате повторения; None - слов больше нет."""
+        if reminder_date is None:
+            self._scheduled.pop(user_id, None)
+            return
+        self._push(user_id, notify_at(reminder_date, now or datetime.utcnow()))
+
+    def schedule_earlier(self, user_id, reminder_date: date, now: Optional[datetime] = None):
+        """Новое слово может только приблизить напоминание."""
+        at = notify_at(reminder_date, now or datetime.utcnow())
+        current = self._scheduled.get(user_id)
+        if current is None or at < current:
+            self._push(user_id, at)
+
+    def retry_later(self, user_ids, now: datetime):
+        for user_id in user_ids:
+            self._push(user_id, now + REMINDERS_RETRY_DELAY)
+
+    def rebuild(self, summary, now: datetime):
+        self._scheduled = {row['user_id']: notify_at(row['next_reminder_date'], now) for row in summary}
+        self._compact()
+        self.changed.set()
+
+    def next_time(self) -> Optional[datetime]:
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list:
+        users = []
+        while self._heap and self._heap[0][0] <= now:
+            at, user_id = heapq.heappop(self._heap)
+            if self._scheduled.get(user_id) == at:
+                del self._scheduled[user_id]
+                users.append(user_id)
+        return users
+
+
+class RateLimiter:
+    """Равномерно распределяет отправки: не больше rate сообщений в секунду."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+reminder_queue = ReminderQueue()
+
+
+async def fetch_due_summary(client: httpx.AsyncClient, user_ids=None) -> list:
+    response = await client.get("http://web:8000/word/due-summary", params={"user_id": user_ids or []})
+    response.raise_for_status()
+    return [
+        {**row, 'next_reminder_date': date.fromisoformat(row['next_reminder_date'])}
+        for row in response.json()
+    ]
+
+
+async def send_reminder(bot: Bot, user_id, due, limiter: RateLimiter) -> Delivery:
+    repeat_words_button = types.InlineKeyboardButton(text="🔄 Повторить слова", callback_data="repeat_word")
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[repeat_words_button]])
+
+    for _ in range(SEND_ATTEMPTS):
+        await limiter.wait()
+        try:
+            await bot.send_message(user_id, f"🔔 Пора повторить слова: {due} 🧠", reply_markup=keyboard)
+            return Delivery.SENT
+        except TelegramRetryAfter as exc:
+            logger.warning(f"Telegram просит подождать {exc.retry_after} с перед рассылкой")
+            await asyncio.sleep(exc.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as exc:
+            logger.info(f"Напоминание пользователю {user_id} не доставлено: {exc}")
+            return Delivery.BLOCKED
+        except TelegramAPIError as exc:
+            # Сетевая ошибка или ошибка сервера Telegram
+            logger.warning(f"Напоминание пользователю {user_id} не отправлено: {exc}")
+            return Delivery.RETRY
+    return Delivery.RETRY
+
+
+async def send_due_reminders(bot: Bot, client: httpx.AsyncClient, queue: ReminderQueue, user_ids,
+                             limiter: RateLimiter):
+    for start in range(0, len(user_ids), SUMMARY_CHUNK_SIZE):
+        chunk = user_ids[start:start + SUMMARY_CHUNK_SIZE]
+        try:
+            summary = {row['user_id']: row for row in await fetch_due_summary(client, chunk)}
+        except Exception as exc:
+            # Недоступный бэкенд или неожиданный ответ
+            logger.error(f"Не удалось получить слова к повторению: {exc!r}")
+            queue.retry_later(user_ids[start:], datetime.utcnow())
+            return
+
+        for user_id in chunk:
+            row = summary.get(user_id)
+            if row is None:
+                continue  # Слов не осталось
+            try:
+                delivery = await send_reminder(bot, user_id, row['due'], limiter) if row['due'] else Delivery.SENT
+            except Exception:
+                logger.exception(f"Ошибка при отправке напоминания пользователю {user_id}")
+                delivery = Delivery.RETRY
+            if delivery is Delivery.RETRY:
+                queue.retry_later([user_id], datetime.utcnow())
+            elif delivery is Delivery.SENT:
+                # Если слова так и не повторят, ближайшая дата в прошлом - напомним завтра
+                queue.schedule(user_id, row['next_reminder_date'])
+
+
+async def run_reminders(bot: Bot, queue: ReminderQueue = reminder_queue,
+                        rate: float = REMINDERS_RATE, rebuild_interval: float = REMINDERS_REBUILD_INTERVAL):
+    """Фоновая рассылка напоминаний о словах к повторению.
+
+    Очередь собирается одним агрегатным запросом при старте (и раз в rebuild_interval),
+    дальше обновляется обработчиками бота; бэкенд опрашивается только по пользователям,
+    которым пора напомнить.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = RateLimiter(rate)
+    rebuild_at = loop.time()
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        while True:
+            if loop.time() >= rebuild_at:
+                try:
+                    queue.rebuild(await fetch_due_summary(client), datetime.utcnow())
+                    rebuild_at = loop.time() + rebuild_interval
+                    logger.info(f"Очередь напоминаний пересобрана: {len(queue)} пользователей")
+                except Exception as exc:
+                    logger.error(f"Не удалось собрать очередь напоминаний: {exc!r}")
+                    rebuild_at = loop.time() + REMINDERS_RETRY_DELAY.total_seconds()
+
+            due_users = queue.pop_due(datetime.utcnow())
+            if due_users:
+                try:
+                    await send_due_reminders(bot, client, queue, due_users, limiter)
+                except Exception:
+                    # Задача не должна умереть молча: main.py только отменяет её при остановке
+                    logger.exception("Ошибка рассылки напоминаний")
+                    # Кому уже напомнили, те снова в очереди - повторяем только для остальных
+                    queue.retry_later([user_id for user_id in due_users if queue.get(user_id) is None],
+                                      datetime.utcnow())
+
+            # Спим до ближайшего напоминания; обработчики бота будят цикл, если оно стало раньше
+            queue.changed.clear()
+            timeout = rebuild_at - loop.time()
+            next_time = queue.next_time()
+            if next_time is not None:
+                timeout = min(timeout, (next_time - datetime.utcnow()).total_seconds())
+            try:
+                await asyncio.wait_for(queue.changed.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
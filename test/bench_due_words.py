@@ -0,0 +1,67 @@
+"""Бенчмарк выдачи следующего слова для повторения на большой таблице user_words.
+
+Запуск: python -m test.bench_due_words [rows] [users]
+"""
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from backend.models import UserWord
+from backend.routers.repetition import get_due_word
+from test.db_conection import TestingSessionLocal, engine
+
+DUE_INDEX = next(index for index in UserWord.__table__.indexes if index.name == 'ix_user_words_user_id_reminder_date')
+
+
+def fill(rows: int, users: int):
+    # Индекс строим после загрузки: так быстрее, чем поддерживать его на каждой вставке
+    with engine.begin() as connection:
+        connection.execute(text("TRUNCATE user_words RESTART IDENTITY"))
+        DUE_INDEX.drop(connection, checkfirst=True)
+        connection.execute(text(
+            "INSERT INTO user_words (user_id, word, translation, interval, reminder_date) "
+            "SELECT g % :users + 1, 'word' || g, 'слово' || g, 2, current_date - 30 + g % 60 "
+            "FROM generate_series(1, :rows) g"
+        ), {'rows': rows, 'users': users})
+        DUE_INDEX.create(connection)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE user_words"))
+
+
+def run(rows: int, users: int, samples: int = 2000):
+    started = time.perf_counter()
+    fill(rows, users)
+    print(f"Загружено {rows} строк для {users} пользователей за {time.perf_counter() - started:.1f} с")
+
+    today = datetime.utcnow().date()
+    timings = []
+    with TestingSessionLocal() as db:
+        get_due_word(db, 1, today)  # прогрев соединения
+        for _ in range(samples):
+            user_id = random.randint(1, users)
+            started = time.perf_counter()
+            get_due_word(db, user_id, today)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        plan = db.execute(text(
+            "EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM user_words "
+            "WHERE user_id = :user_id AND reminder_date < :tomorrow ORDER BY reminder_date LIMIT 1"
+        ), {'user_id': users // 2, 'tomorrow': today + timedelta(days=1)})
+
+        print("\n".join(row[0] for row in plan))
+
+    timings.sort()
+    print(f"get_due_word: p50={statistics.median(timings):.3f} мс, "
+          f"p99={timings[int(len(timings) * 0.99)]:.3f} мс, max={timings[-1]:.3f} мс")
+
+    with engine.begin() as connection:
+        connection.execute(text("TRUNCATE user_words RESTART IDENTITY"))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
@@ -1,7 +1,11 @@
+from contextlib import contextmanager
+
 import pytest
 
-from backend.database import Base
-from sqlalchemy import create_engine
+from backend.database import Base, DATABASE_MODE, to_async_url
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 import os
 from sqlalchemy.orm import sessionmaker
 
@@ -10,9 +14,25 @@ TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
 engine = create_engine(TEST_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient поднимает новый event loop на каждый запрос, поэтому соединения не переиспользуем
+async_engine = create_async_engine(to_async_url(TEST_DATABASE_URL), poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base.metadata.create_all(bind=engine)
 
 
+async def override_get_db():
+    if DATABASE_MODE == "async":
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+    else:
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
 @pytest.fixture(scope="function")
 def db_session():
     session = TestingSessionLocal()
@@ -21,4 +41,21 @@ def db_session():
     yield session  # Предоставляем сессию для теста
 
     session.close()  # Закрываем сессию после теста
-    Base.metadata.drop_all(bind=engine)  # Удаляем все таблицы для очистки
\ No newline at end of file
+    Base.metadata.drop_all(bind=engine)  # Удаляем все таблицы для очистки
+
+
+@contextmanager
+def round_trips():
+    calls = []
+
+    def before_cursor_execute(*_):
+        calls.append(1)
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield calls
+    finally:
+        for target in engines:
+            event.remove(target, 'before_cursor_execute', before_cursor_execute)
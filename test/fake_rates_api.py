@@ -0,0 +1,64 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FakeRatesApi:
+    """Локальный HTTP-сервер, заменяющий exchangeratesapi.io в тестах.
+
+    Для каждого пути задаётся очередь ответов (status, body); последний ответ
+    повторяется, когда очередь заканчивается. body в bytes отдаётся как есть.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.calls = defaultdict(int)
+        self.delay = 0.0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def respond(self, path, *responses):
+        self.responses[path] = list(responses)
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0].removeprefix('/v1')
+                api.calls[path] += 1
+                time.sleep(api.delay)
+
+                queue = api.responses.get(path) or [(404, {})]
+                status, body = queue.pop(0) if len(queue) > 1 else queue[0]
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_rates_api():
+    with FakeRatesApi() as api:
+        yield api
@@ -1,25 +1,19 @@
-import os
-from datetime import datetime
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, datetime
 
 from backend.main import app
-from backend.routers.rates import get_and_feel_rates
 import pytest
 from fastapi.testclient import TestClient
 from fastapi import status
-import requests_mock
 
 
-from backend.models import Rates
+from backend.models import Currency, RateHistory, Rates
+from backend.rate_table import CurrencyTitlesCache, RateTableCache, currency_titles, rate_table
+from backend.rates_refresher import RatesRefresher, rates_refresher, save_rates
 from backend.routers.rates import get_db
-from test.db_conection import TestingSessionLocal, db_session
-
-
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from test.db_conection import override_get_db, db_session, engine, async_engine, round_trips
+from test.fake_rates_api import fake_rates_api
 
 
 client = TestClient(app)
@@ -51,6 +45,7 @@ def test_rate(db_session):
 
     db_session.add_all(rates)
     db_session.commit()
+    rate_table.invalidate()
 
     yield rates  # Предоставляем данные для теста
 
@@ -58,26 +53,138 @@ def test_rate(db_session):
     db_session.commit()
 
 
+@pytest.fixture
+def refresher(fake_rates_api):
+    currency_titles.invalidate()
+    fake_rates_api.respond('/symbols', (200, {"success": True, "symbols": {"USD": "United States Dollar"}}))
+    return RatesRefresher(api_url=fake_rates_api.url, token='test', backoff_base=0,
+                          session_factory=asynccontextmanager(override_get_db))
+
+
+@pytest.mark.asyncio
+async def test_get_and_feel_rates(db_session, fake_rates_api, refresher):
+    fake_rates_api.respond('/latest', (200, {"success": True, "rates": {"USD": 1.1}}))
+
+    assert await refresher.refresh() == 1
+    usd_rate = db_session.query(Rates).filter_by(code="USD").first()
+    assert usd_rate is not None
+    assert usd_rate.rate == 1.1
+    assert usd_rate.title == "United States Dollar"
+
+
+@pytest.mark.asyncio
+async def test_refresh_retries_transient_errors(test_rate, db_session, fake_rates_api, refresher):
+    fake_rates_api.respond('/latest', (503, {}), (429, {}), (200, {"success": True, "rates": {"USD": 1.3}}))
+
+    assert await refresher.refresh() == 1
+    assert fake_rates_api.calls['/latest'] == 3
+    assert db_session.query(Rates.rate).filter_by(code="USD").scalar() == 1.3
+
+
+@pytest.mark.asyncio
+async def test_refresh_failure_keeps_last_snapshot(test_rate, db_session, fake_rates_api, refresher):
+    fake_rates_api.respond('/latest', (500, {}))
+
+    assert await refresher.refresh() is None
+    assert fake_rates_api.calls['/latest'] == refresher.attempts
+    assert "HTTP 500" in refresher.last_error
+    assert db_session.query(Rates.rate).filter_by(code="USD").scalar() == 1.1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('body', [
+    {"success": True},
+    {"success": True, "rates": {"USD": "n/a"}},
+    {"success": True, "rates": ["USD"]},
+    [1, 2],
+    b'<html>Bad Gateway</html>',
+])
+async def test_refresh_rejects_unexpected_payload(test_rate, db_session, fake_rates_api, refresher, body):
+    fake_rates_api.respond('/latest', (200, body))
+
+    assert await refresher.refresh() is None
+    assert refresher.last_error.startswith('/latest: ')
+    assert db_session.query(Rates.rate).filter_by(code="USD").scalar() == 1.1
+
+
+@pytest.mark.asyncio
+async def test_background_refresh_skips_fresh_snapshot(db_session, fake_rates_api, refresher, monkeypatch):
+    db_session.add(Rates(code="USD", title="United States Dollar", rate=1.1, created_at=datetime.now()))
+    db_session.commit()
+    rate_table.invalidate()
+    fake_rates_api.respond('/latest', (200, {"success": True, "rates": {"USD": 1.3}}))
+
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+        if len(delays) == 2:
+            raise asyncio.CancelledError()
+
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    refresher.interval, refresher.jitter = 3600, 0
+    with pytest.raises(asyncio.CancelledError):
+        await refresher.run_forever()
+
+    # Снимок свежий (его мог сохранить другой воркер) - ждём, а не идём в API
+    assert 3590 < delays[0] <= 3600 and 3590 < delays[1] <= 3600
+    assert fake_rates_api.calls['/latest'] == 0
+
+    db_session.query(Rates).delete()
+    db_session.commit()
+
+
 @pytest.mark.asyncio
-async def test_get_and_feel_rates(db_session):
-    with requests_mock.Mocker() as m:
-        m.get(f"http://api.exchangeratesapi.io/v1/symbols?access_key={os.getenv('RATES_TOKEN')}", json={
-            "success": True,
-            "symbols": {
-                "USD": "United States Dollar",
-            }
-        })
-        m.get(f"http://api.exchangeratesapi.io/v1/latest?access_key={os.getenv('RATES_TOKEN')}", json={
-            "success": True,
-            "rates": {
-                "USD": 1.1,
-            }
-        })
-
-        await get_and_feel_rates(db=db_session)
-        usd_rate = db_session.query(Rates).filter_by(code="USD").first()
-        assert usd_rate is not None
-        assert usd_rate.rate == 1.1
+async def test_concurrent_refreshes_coalesce(test_rate, fake_rates_api, refresher):
+    fake_rates_api.delay = 0.2
+    fake_rates_api.respond('/latest', (200, {"success": True, "rates": {"USD": 1.3}}))
+
+    results = await asyncio.gather(*(refresher.refresh() for _ in range(5)))
+    assert results == [1] * 5
+    assert fake_rates_api.calls['/latest'] == 1
+    assert fake_rates_api.calls['/symbols'] == 1
+
+
+def test_update_rates_endpoint(test_rate, fake_rates_api, refresher, monkeypatch):
+    monkeypatch.setattr(rates_refresher, 'api_url', fake_rates_api.url)
+    monkeypatch.setattr(rates_refresher, 'session_factory', asynccontextmanager(override_get_db))
+    monkeypatch.setattr(rates_refresher, 'attempts', 1)
+
+    fake_rates_api.respond('/latest', (200, {"success": True, "rates": {"USD": 1.3, "RUB": 90}}))
+    response = client.get("/rates/update-rates")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["updated"] == 2
+
+    fake_rates_api.respond('/latest', (200, {"success": False, "error": {"code": 101}}))
+    response = client.get("/rates/update-rates")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/rates/refresher").json()["last_error"]
+
+
+def count_round_trips(fn, *args):
+    with round_trips() as calls:
+        fn(*args)
+    return len(calls)
+
+
+def test_save_rates_upserts(test_rate, db_session):
+    save_rates(db_session, {"rates": {"USD": 1.2, "THB": 39.5}}, {"THB": "Thai Baht"})
+    db_session.expire_all()
+
+    rates = {rate.code: rate for rate in db_session.query(Rates).all()}
+    assert rates["USD"].rate == 1.2
+    assert rates["USD"].title == "United States Dollar"
+    assert rates["THB"].title == "Thai Baht"
+    assert rates["USD"].created_at == rates["THB"].created_at
+    assert rates["RUB"].rate == 100
+
+
+def test_save_rates_round_trips_do_not_grow(test_rate, db_session):
+    few = {"rates": {f"C{i:02d}": i + 1.0 for i in range(3)}}
+    many = {"rates": {f"C{i:02d}": i + 1.0 for i in range(170)}}
+
+    assert count_round_trips(save_rates, db_session, few, {}) == count_round_trips(save_rates, db_session, many, {})
+    assert db_session.query(Rates).count() == 173
 
 
 def test_get_last_update(test_rate):
@@ -118,3 +225,203 @@ def test_get_rate(test_rate):
 
     data = response.json()
     assert data["detail"] == 'Неизвестный код валюты'
+
+
+@pytest.mark.asyncio
+async def test_rate_table_served_from_memory(test_rate, db_session):
+    cache = RateTableCache(poll_seconds=60)
+    table = await cache.get(db_session)
+    assert table.rate("USD") == 1.1
+
+    with round_trips() as calls:
+        assert await cache.get(db_session) is table
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_rate_table_picks_up_new_version(test_rate, db_session):
+    # poll_seconds=0: версия сверяется на каждом обращении, как после истечения интервала
+    cache = RateTableCache(poll_seconds=0)
+    table = await cache.get(db_session)
+    assert await cache.get(db_session) is table
+
+    # Курсы обновил другой воркер
+    save_rates(db_session, {"rates": {"USD": 1.3}}, {})
+
+    table = await cache.get(db_session)
+    assert table.rate("USD") == 1.3
+    assert table.version == db_session.query(Rates.created_at).filter_by(code="USD").scalar()
+
+
+def test_convert_batch_items(test_rate):
+    request_data = {
+        "items": [
+            {"source": "RUB", "target": "USD", "sum": 1000},
+            {"source": "RUB", "target": "XXX", "sum": 1000},
+            {"source": "USD", "target": "EUR", "sum": 11},
+        ]
+    }
+
+    response = client.post("/rates/convert-batch", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+
+    results = response.json()["results"]
+    assert results[0]["result"] == pytest.approx(11)
+    assert results[1] == {"error": "Неизвестный код валюты"}
+    assert results[2]["result"] == pytest.approx(10)
+
+
+def test_convert_batch_amounts(test_rate):
+    request_data = {"source": "EUR", "target": "RUB", "amounts": [1, 2.5, 10]}
+
+    response = client.post("/rates/convert-batch", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["result"] for item in response.json()["results"]] == pytest.approx([100, 250, 1000])
+
+
+def test_convert_batch_requires_one_shape(test_rate):
+    response = client.post("/rates/convert-batch", json={"source": "EUR", "amounts": [1]})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.post("/rates/convert-batch", json={
+        "items": [{"source": "RUB", "target": "USD", "sum": 1}],
+        "source": "EUR", "target": "RUB", "amounts": [1],
+    })
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.fixture
+def test_rate_history(db_session):
+    history = [
+        RateHistory(code="RUB", date=date(2024, 1, 1), rate=90),
+        RateHistory(code="USD", date=date(2024, 1, 1), rate=1.1),
+        RateHistory(code="RUB", date=date(2024, 2, 1), rate=100),
+        RateHistory(code="USD", date=date(2024, 2, 1), rate=1.2),
+        RateHistory(code="EUR", date=date(2024, 2, 1), rate=1),
+    ]
+    db_session.add_all(history)
+    db_session.commit()
+
+    yield history
+
+    db_session.query(RateHistory).delete()
+    db_session.commit()
+
+
+def test_save_rates_appends_history(test_rate, db_session):
+    save_rates(db_session, {"rates": {"USD": 1.2}}, {})
+    save_rates(db_session, {"rates": {"USD": 1.25}}, {})
+
+    history = db_session.query(RateHistory).filter_by(code="USD").all()
+    assert len(history) == 1
+    assert history[0].date == datetime.now().date()
+    assert history[0].rate == 1.25
+
+
+def test_get_rate_as_of(test_rate_history):
+    request_data = {"source": "RUB", "target": "USD", "sum": 900, "as_of": "2024-01-15"}
+
+    response = client.post("/rates/get-rate", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["result"] == pytest.approx(11)
+
+    request_data["as_of"] = "2024-12-31"
+    response = client.post("/rates/get-rate", json=request_data)
+    assert response.json()["result"] == pytest.approx(10.8)
+
+    request_data["as_of"] = "2023-12-31"
+    response = client.post("/rates/get-rate", json=request_data)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_rate_history_range(test_rate_history):
+    response = client.get("/rates/history", params={"start": "2024-01-01", "end": "2024-01-31"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["rates"] == {"RUB": [["2024-01-01", 90.0]], "USD": [["2024-01-01", 1.1]]}
+
+    response = client.get("/rates/history", params={"start": "2024-01-01", "end": "2024-02-01", "codes": ["USD"]})
+    assert response.json()["rates"] == {"USD": [["2024-01-01", 1.1], ["2024-02-01", 1.2]]}
+
+
+@pytest.fixture
+def test_currencies(db_session):
+    db_session.add_all([Currency(code="USD", title="United States Dollar"), Currency(code="EUR", title="Euro")])
+    db_session.commit()
+    currency_titles.invalidate()
+
+    yield
+
+    db_session.query(Currency).delete()
+    db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_currency_titles_loaded_once(test_currencies, db_session):
+    cache = CurrencyTitlesCache()
+    titles = await cache.get(db_session)
+    assert titles == {"USD": "United States Dollar", "EUR": "Euro"}
+
+    db_session.add(Currency(code="THB", title="Thai Baht"))
+    db_session.commit()
+    with round_trips() as calls:
+        assert await cache.get(db_session) is titles
+    assert calls == []
+
+    assert "THB" in await cache.reload(db_session)
+
+
+@pytest.mark.asyncio
+async def test_refresh_uses_cached_titles(test_currencies, db_session, fake_rates_api, refresher):
+    fake_rates_api.respond('/latest', (200, {"success": True, "rates": {"USD": 1.1, "EUR": 1}}))
+    assert await refresher.refresh() == 2
+
+    with round_trips() as calls:
+        assert await refresher.refresh() == 2
+    # Второе обновление: только upsert курсов, истории и перечитывание таблицы курсов
+    assert len(calls) == 3
+    assert fake_rates_api.calls['/symbols'] == 0
+
+
+def test_list_currencies(test_currencies):
+    response = client.get("/rates/currencies")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"code": "EUR", "title": "Euro"},
+        {"code": "USD", "title": "United States Dollar"},
+    ]
+
+    response = client.post("/rates/currencies/reload")
+    assert response.json() == {"count": 2}
+
+
+def test_get_last_update_conditional(test_rate, db_session):
+    response = client.get("/rates/")
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    response = client.get("/rates/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get("/rates/", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = client.get("/rates/", headers={"If-None-Match": '"outdated"'})
+    assert response.status_code == status.HTTP_200_OK
+
+    # Новый снимок курсов - новый ETag
+    save_rates(db_session, {"rates": {"USD": 1.3}}, {})
+    rate_table.invalidate()
+    response = client.get("/rates/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+
+
+def test_rate_history_conditional(test_rate, test_rate_history):
+    params = {"start": "2024-01-01", "end": "2024-12-31"}
+    response = client.get("/rates/history", params=params)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.get("/rates/history", params=params, headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine, exc
+from starlette import status
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.metrics import Histogram, TimedQueuePool, pool_stats
+from test.db_conection import TEST_DATABASE_URL
+
+client = TestClient(app)
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets_ms=(1, 10))
+    histogram.observe(0.0005)
+    histogram.observe(0.005)
+    histogram.observe(1)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 3
+    assert snapshot['buckets'] == {'le_1ms': 1, 'le_10ms': 1, 'le_inf': 1}
+
+
+def test_pool_exhaustion_is_visible():
+    engine = create_engine(TEST_DATABASE_URL, poolclass=TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.1)
+    connection = engine.connect()
+    try:
+        stats = pool_stats(engine.pool)
+        assert stats['checked_out'] == 1
+        assert stats['idle'] == 0
+
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    finally:
+        connection.close()
+
+    stats = pool_stats(engine.pool)
+    assert stats['checked_out'] == 0
+    assert stats['idle'] == 1
+    assert stats['timeouts'] == 1
+    assert stats['wait_time']['count'] == 2
+    engine.dispose()
+
+
+def test_db_pool_endpoint():
+    response = client.get('/healthy/db-pool')
+    assert response.status_code == status.HTTP_200_OK
+
+    data = response.json()
+    for key in ('sync', 'async'):
+        assert {'checked_out', 'idle', 'overflow', 'wait_time'} <= data[key].keys()
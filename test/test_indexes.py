@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event, text
+
+from backend.routers.repetition import get_due_word
+from backend.routers.rates import get_rate_history, get_rates_as_of
+from backend.routers.todos import get_todos_page, get_user_todos, search_todos
+from backend.routers.training import export_query, find_workouts, get_workout_stats
+from test.db_conection import db_session, engine
+
+
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(session, statement, parameters):
+    rows = session.connection().exec_driver_sql(f"EXPLAIN {statement}", parameters).all()
+    return "\n".join(row[0] for row in rows)
+
+
+def assert_uses_index(session, query_fn, *args):
+    # На пустых таблицах планировщик всегда выбирает Seq Scan, поэтому запрещаем его:
+    # если запрос не может использовать индекс, в плане всё равно останется Seq Scan
+    session.execute(text("SET enable_seqscan = off"))
+    with captured_selects() as statements:
+        query_fn(session, *args)
+
+    assert statements
+    for statement, parameters in statements:
+        plan = explain(session, statement, parameters)
+        assert 'Seq Scan' not in plan, plan
+        assert 'Index' in plan, plan
+
+
+def test_todos_listing_uses_index(db_session):
+    assert_uses_index(db_session, get_user_todos, 1)
+
+
+@pytest.mark.parametrize('after, before', [(None, None), ((False, 3, 10), None), (None, (True, 1, 5))])
+def test_todos_page_uses_index(db_session, after, before):
+    assert_uses_index(db_session, get_todos_page, 1, 20, after, before)
+
+
+@pytest.mark.parametrize('mode', ['words', 'prefix'])
+def test_todos_search_uses_index(db_session, mode):
+    # Оба индекса подходят; без ix_todos_owner_id_* проверяем, что поиск умеет идти через GIN
+    db_session.execute(text("DROP INDEX ix_todos_owner_id_complete_priority_id"))
+    db_session.execute(text("DROP INDEX ix_todos_owner_id"))
+    with captured_selects() as statements:
+        search_todos(db_session, 1, 'купить молоко', mode)
+    assert 'ix_todos_search' in explain(db_session, *statements[0])
+    assert_uses_index(db_session, search_todos, 1, 'купить молоко', mode)
+
+
+@pytest.mark.parametrize('date, period, exercise_name', [
+    ('01.01.2024', None, None),
+    (None, 'current-week', None),
+    (None, 'last-month', None),
+    (None, 'last-workout', None),
+    (None, None, 'Жим'),
+])
+def test_workout_filters_use_index(db_session, date, period, exercise_name):
+    assert_uses_index(db_session, find_workouts, 1, date, period, exercise_name)
+
+
+def test_workout_export_uses_index(db_session):
+    assert_uses_index(db_session, lambda session, user_id: session.execute(export_query(user_id)).all(), 1)
+
+
+def test_workout_stats_use_index(db_session):
+    assert_uses_index(db_session, get_workout_stats, 1, date(2024, 1, 1))
+
+
+def test_due_word_uses_index(db_session):
+    assert_uses_index(db_session, get_due_word, 1, datetime.utcnow().date())
+
+
+def test_rate_history_range_uses_index(db_session):
+    assert_uses_index(db_session, get_rate_history, date(2024, 1, 1), date(2024, 12, 31))
+
+
+def test_rate_as_of_uses_index(db_session):
+    assert_uses_index(db_session, get_rates_as_of, {'RUB', 'USD'}, date(2024, 6, 1))
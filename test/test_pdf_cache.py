@@ -0,0 +1,83 @@
+from datetime import date
+
+import pytest
+
+from backend.pdf_cache import CachedReport, PdfCache, report_key
+
+
+def test_report_key_depends_on_every_part():
+    key = report_key(1, 3, ['range', date(2024, 6, 3), date(2024, 6, 9)], 'Жим')
+    assert key == report_key(1, 3, ['range', date(2024, 6, 3), date(2024, 6, 9)], 'Жим')
+    assert len({
+        key,
+        report_key(2, 3, ['range', date(2024, 6, 3), date(2024, 6, 9)], 'Жим'),
+        report_key(1, 4, ['range', date(2024, 6, 3), date(2024, 6, 9)], 'Жим'),
+        report_key(1, 3, ['range', date(2024, 6, 10), date(2024, 6, 16)], 'Жим'),
+        report_key(1, 3, ['range', date(2024, 6, 3), date(2024, 6, 9)], None),
+    }) == 5
+
+
+@pytest.mark.asyncio
+async def test_cache_keeps_has_more_flag(tmp_path):
+    for cache in (PdfCache(max_bytes=100), PdfCache(max_bytes=100, directory=str(tmp_path))):
+        await cache.put('page1', b'%PDF-1', has_more=True)
+        await cache.put('page2', b'%PDF-2')
+        assert await cache.get('page1') == CachedReport(b'%PDF-1', True)
+        assert await cache.get('page2') == CachedReport(b'%PDF-2', False)
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def make_cache(request, tmp_path):
+    def make(max_bytes):
+        return PdfCache(max_bytes=max_bytes, directory=str(tmp_path) if request.param == 'disk' else None)
+    return make
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used_by_size(make_cache):
+    cache = make_cache(max_bytes=25)
+    await cache.put('a', b'a' * 10)
+    await cache.put('b', b'b' * 10)
+    assert await cache.get('a') == (b'a' * 10, False)  # b теперь самый старый
+
+    await cache.put('c', b'c' * 10)
+    assert await cache.get('b') is None
+    assert await cache.get('c') == (b'c' * 10, False)
+
+    # Отчёт больше всего кэша не сохраняется и ничего не вытесняет
+    await cache.put('huge', b'x' * 30)
+    assert await cache.get('huge') is None
+    assert len(cache) == 2
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['bytes']) == (2, 2, 1, 22)
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_survives_restart(tmp_path):
+    cache = PdfCache(max_bytes=100, directory=str(tmp_path))
+    await cache.put('a', b'%PDF-a')
+
+    restarted = PdfCache(max_bytes=100, directory=str(tmp_path))
+    assert await restarted.get('a') == (b'%PDF-a', False)
+    assert restarted.stats()['bytes'] == 7
+
+    # Файл удалил другой воркер - просто промах
+    (tmp_path / 'a.pdf').unlink()
+    assert await cache.get('a') is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_directory_is_bounded_as_a_whole(tmp_path):
+    # Два воркера с одним каталогом не должны занять вдвое больше max_bytes
+    first = PdfCache(max_bytes=25, directory=str(tmp_path))
+    second = PdfCache(max_bytes=25, directory=str(tmp_path))
+    await first.put('a', b'a' * 10)
+    await second.put('b', b'b' * 10)
+    assert await first.get('b') == (b'b' * 10, False)  # a теперь самый старый во всём каталоге
+
+    await second.put('c', b'c' * 10)
+    assert sorted(path.name for path in tmp_path.glob('*.pdf')) == ['b.pdf', 'c.pdf']
+    assert second.stats()['bytes'] == 22
+    assert await first.get('a') is None
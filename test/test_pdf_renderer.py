@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from backend.pdf_renderer import PdfRenderer, RendererBusyError, RenderTimeoutError
+
+
+@pytest.fixture
+def templates_dir(tmp_path):
+    (tmp_path / 'report.html').write_text('<h1>{{ title }}</h1>', encoding='utf-8')
+    # Долгий шаблон: вёрстка не успеет за таймаут
+    (tmp_path / 'slow.html').write_text('{% for i in range(10 ** 9) %}{% endfor %}', encoding='utf-8')
+    return str(tmp_path)
+
+
+@pytest.fixture
+def renderer(templates_dir):
+    renderer = PdfRenderer(workers=1, max_queue=1, timeout=0.5, templates_dir=templates_dir)
+    yield renderer
+    renderer.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_renders_in_worker_process(renderer):
+    pdf = await renderer.render('report.html', {'title': 'Отчёт'})
+    assert pdf.startswith(b'%PDF')
+
+    stats = renderer.stats()
+    assert stats['rendered'] == 1 and stats['pending'] == 0
+    assert stats['render_ms']['count'] == stats['latency_ms']['count'] == 1
+
+
+@pytest.mark.asyncio
+async def test_render_timeout_frees_worker(renderer):
+    with pytest.raises(RenderTimeoutError):
+        await renderer.render('slow.html', {})
+    assert renderer.stats()['timeouts'] == 1
+
+    # Воркер прервал вёрстку и свободен для следующего отчёта
+    assert (await renderer.render('report.html', {'title': 'x'})).startswith(b'%PDF')
+
+
+@pytest.mark.asyncio
+async def test_queue_limit_rejects_extra_renders(renderer):
+    results = await asyncio.gather(
+        *(renderer.render('slow.html', {}) for _ in range(3)), return_exceptions=True)
+
+    # Один рендер в работе, один в очереди, третий отклонён сразу
+    assert [type(result) for result in results] == [RenderTimeoutError, RenderTimeoutError, RendererBusyError]
+    assert renderer.stats()['rejected'] == 1
+    assert renderer.stats()['pending'] == 0
+
+
+@pytest.mark.asyncio
+async def test_start_warms_up_every_worker(templates_dir):
+    renderer = PdfRenderer(workers=2, max_queue=1, timeout=5, templates_dir=templates_dir)
+    try:
+        await renderer.start()
+        # Оба процесса уже запущены и прошли _init_worker
+        assert len(renderer._executor._processes) == 2
+        assert len({future.result() for future in renderer._warm_up}) == 2
+    finally:
+        renderer.shutdown()
@@ -0,0 +1,182 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import httpx
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from telegram_bot import reminders
+from telegram_bot.reminders import RateLimiter, ReminderQueue, notify_at, send_due_reminders
+
+NOW = datetime(2024, 6, 10, 12, 0)
+HOUR = reminders.REMINDER_HOUR
+
+
+def at(day, hour=HOUR):
+    return datetime(2024, 6, day, hour)
+
+
+def test_notify_at_moves_past_reminders_to_next_hour():
+    assert notify_at(date(2024, 6, 12), NOW) == at(12)
+    # Напоминание за сегодня уже было (12:00 позже REMINDER_HOUR) - следующее завтра
+    assert notify_at(date(2024, 6, 10), NOW) == at(11)
+    assert notify_at(date(2024, 6, 1), NOW) == at(11)
+    assert notify_at(date(2024, 6, 1), datetime(2024, 6, 10, HOUR - 1)) == at(10)
+
+
+def test_queue_keeps_latest_schedule_per_user():
+    queue = ReminderQueue()
+    queue.rebuild([
+        {'user_id': 1, 'next_reminder_date': date(2024, 6, 12)},
+        {'user_id': 2, 'next_reminder_date': date(2024, 6, 11)},
+        {'user_id': 3, 'next_reminder_date': date(2024, 6, 13)},
+    ], NOW)
+    assert len(queue) == 3
+    assert queue.next_time() == at(11)
+
+    queue.schedule(2, date(2024, 6, 14), NOW)      # слова повторили - напоминание позже
+    queue.schedule_earlier(3, date(2024, 6, 15), NOW)  # новое слово не отодвигает напоминание
+    queue.schedule_earlier(1, date(2024, 6, 11), NOW)
+    queue.schedule(4, None, NOW)
+    assert queue.next_time() == at(11)
+    assert queue.get(3) == at(13)
+
+    assert queue.pop_due(at(12)) == [1]
+    assert queue.pop_due(at(13)) == [3]
+    assert queue.pop_due(at(20)) == [2]
+    assert queue.pop_due(at(20)) == []
+    assert queue.next_time() is None
+
+
+def test_queue_compacts_stale_entries():
+    queue = ReminderQueue()
+    for day in range(1, 200):
+        queue.schedule(1, date(2024, 6, 10) + timedelta(days=day), NOW)
+    assert len(queue._heap) < 100
+    assert queue.pop_due(datetime(2025, 1, 1)) == [1]
+
+
+class FakeBot:
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        error = self.errors.get(chat_id)
+        if error is not None:
+            self.errors[chat_id] = None if isinstance(error, TelegramRetryAfter) else error
+            raise error
+        self.sent.append((chat_id, text))
+
+
+@pytest.mark.asyncio
+async def test_send_due_reminders():
+    requests = []
+    today = datetime.utcnow().date()
+
+    def handler(request):
+        requests.append(request.url.params.get_list('user_id'))
+        return httpx.Response(200, json=[
+            {'user_id': 1, 'due': 3, 'next_reminder_date': str(today - timedelta(days=1))},
+            {'user_id': 2, 'due': 0, 'next_reminder_date': str(today + timedelta(days=2))},
+            {'user_id': 4, 'due': 1, 'next_reminder_date': str(today)},
+            {'user_id': 5, 'due': 2, 'next_reminder_date': str(today)},
+        ])
+
+    method = SendMessage(chat_id=0, text='')
+    bot = FakeBot(errors={
+        4: TelegramForbiddenError(method=method, message='bot was blocked by the user'),
+        5: TelegramRetryAfter(method=method, message='Too Many Requests', retry_after=0),
+    })
+    queue = ReminderQueue()
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await send_due_reminders(bot, client, queue, [1, 2, 3, 4, 5], RateLimiter(1000))
+
+    # Один запрос на всю пачку пользователей
+    assert requests == [['1', '2', '3', '4', '5']]
+    assert [chat_id for chat_id, _ in bot.sent] == [1, 5]
+    assert '3' in bot.sent[0][1]
+
+    # Не повторившим слова напомним снова, у кого слов нет или бот заблокирован - нет
+    assert queue.get(1) is not None and queue.get(5) is not None
+    assert queue.get(2) == notify_at(today + timedelta(days=2), datetime.utcnow())
+    assert queue.get(3) is None and queue.get(4) is None
+
+
+@pytest.mark.asyncio
+async def test_send_due_reminders_retries_on_backend_error():
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(503))) as client:
+        queue = ReminderQueue()
+        await send_due_reminders(FakeBot(), client, queue, [1, 2], RateLimiter(1000))
+
+    assert queue.get(1) is not None and queue.get(1) - datetime.utcnow() <= reminders.REMINDERS_RETRY_DELAY
+    assert queue.get(2) is not None
+
+
+class FlakyBot(FakeBot):
+    async def send_message(self, chat_id, text, reply_markup=None):
+        error = self.errors.get(chat_id)
+        if error is not None:
+            raise error
+        self.sent.append((chat_id, text))
+
+
+@pytest.mark.asyncio
+async def test_send_due_reminders_retries_failed_sends():
+    today = datetime.utcnow().date()
+    rows = [{'user_id': user_id, 'due': 1, 'next_reminder_date': str(today)} for user_id in (1, 2, 3, 4)]
+    method = SendMessage(chat_id=0, text='')
+    bot = FlakyBot(errors={
+        1: TelegramNetworkError(method=method, message='timeout'),
+        2: TelegramRetryAfter(method=method, message='Too Many Requests', retry_after=0),
+        3: RuntimeError('boom'),
+    })
+    queue = ReminderQueue()
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=rows))) as client:
+        await send_due_reminders(bot, client, queue, [1, 2, 3, 4], RateLimiter(1000))
+
+    assert bot.sent == [(4, bot.sent[0][1])]
+    # Недоставленные напоминания повторяются, а не теряются
+    for user_id in (1, 2, 3):
+        assert queue.get(user_id) - datetime.utcnow() <= reminders.REMINDERS_RETRY_DELAY
+
+
+@pytest.mark.asyncio
+async def test_send_due_reminders_retries_on_bad_summary():
+    response = httpx.Response(200, json=[{'user_id': 1}])
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: response)) as client:
+        queue = ReminderQueue()
+        await send_due_reminders(FakeBot(), client, queue, [1], RateLimiter(1000))
+    assert queue.get(1) is not None
+
+
+@pytest.mark.asyncio
+async def test_run_reminders_survives_errors(monkeypatch):
+    async def broken_send(*args):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(reminders, 'send_due_reminders', broken_send)
+    monkeypatch.setattr(reminders, 'fetch_due_summary', broken_send)
+    queue = ReminderQueue()
+    queue.retry_later([1], datetime.utcnow() - reminders.REMINDERS_RETRY_DELAY)
+
+    task = asyncio.create_task(reminders.run_reminders(FakeBot(), queue, rate=1000))
+    await asyncio.sleep(0.05)
+    assert not task.done()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # Пользователь не потерян после упавшей рассылки
+    assert queue.get(1) is not None
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_sends():
+    limiter = RateLimiter(50)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.gather(*(limiter.wait() for _ in range(6)))
+    assert loop.time() - started >= 5 / 50 * 0.9
@@ -1,3 +1,6 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 
 import pytest
@@ -7,16 +10,11 @@ from backend.main import app
 
 from backend.models import UserWord
 from fastapi.testclient import TestClient
-from backend.routers.repetition import get_db
-from test.db_conection import TestingSessionLocal, db_session, engine
-
-
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from backend.database import run_db
+from backend.routers import repetition
+from backend.routers.repetition import get_db, next_word
+from backend.scheduling import get_scheduler
+from test.db_conection import override_get_db, db_session, engine
 
 
 client = TestClient(app)
@@ -61,6 +59,7 @@ def test_add_word(test_word, db_session):
 
     response = client.post("/word/", json=request_data)
     assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {"success": True, "reminder_date": str(datetime.utcnow().date() + timedelta(days=1))}
 
     model = db_session.query(UserWord).filter(UserWord.id == 3).first()
     assert model.user_id == request_data.get('user_id')
@@ -70,7 +69,7 @@ def test_add_word(test_word, db_session):
 
 
 def test_get_word_and_change_interval(test_word, db_session):
-    response = client.get('/word/')
+    response = client.get('/word/?user_id=1')
     assert response.status_code == 200
 
     # Получаем текущую дату без времени и добавляем 2 дня
@@ -82,3 +81,236 @@ def test_get_word_and_change_interval(test_word, db_session):
 
     assert word_model is not None
     assert word_model.reminder_date.date() == next_date
+
+
+def test_get_word_only_for_own_user(test_word, db_session):
+    response = client.get('/word/?user_id=2')
+    assert response.status_code == 200
+    assert response.json()['success'] is False
+
+    db_session.add(UserWord(user_id=2, word='own', translation='свой', interval=2,
+                            reminder_date=datetime.utcnow().date() - timedelta(days=3)))
+    db_session.commit()
+
+    response = client.get('/word/?user_id=2')
+    assert response.json()['word'] == 'own'
+
+
+def test_get_word_not_yet_due(test_word, db_session):
+    db_session.query(UserWord).update({UserWord.reminder_date: datetime.utcnow().date() + timedelta(days=1)})
+    db_session.commit()
+
+    response = client.get('/word/?user_id=1')
+    assert response.json() == {"success": False, "message": "Нет слов для повторения"}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reviews_get_distinct_words(db_session):
+    words_count, workers = 200, 16
+    db_session.add_all([
+        UserWord(user_id=1, word=f'word{i}', translation=f'слово{i}', interval=2,
+                 reminder_date=datetime.utcnow().date())
+        for i in range(words_count)
+    ])
+    db_session.commit()
+
+    async def review_session():
+        served = []
+        async with asynccontextmanager(override_get_db)() as db:
+            while True:
+                data = await run_db(db, next_word, 1)
+                if not data['success']:
+                    return served
+                served.append(data['word'])
+
+    results = await asyncio.gather(*(review_session() for _ in range(workers)))
+    served = [word for session in results for word in session]
+
+    assert len(served) == words_count
+    assert len(set(served)) == words_count
+    assert sum(1 for session in results if session) > 1
+
+    next_date = datetime.utcnow().date() + timedelta(days=2)
+    assert db_session.query(UserWord).filter(UserWord.reminder_date == next_date).count() == words_count
+
+
+def test_get_session_returns_due_words_without_rescheduling(test_word, db_session):
+    response = client.get('/word/session?user_id=1&limit=1')
+    assert response.status_code == 200
+    data = response.json()
+    assert data['success'] is True
+    assert len(data['words']) == 1
+    assert data['words'][0].keys() == {'id', 'word', 'translation'}
+
+    response = client.get('/word/session?user_id=1')
+    assert {word['word'] for word in response.json()['words']} == {'test', 'check'}
+
+    today = datetime.utcnow().date()
+    assert db_session.query(UserWord).filter(func.date(UserWord.reminder_date) == today).count() == 2
+
+
+def test_get_session_empty_and_limit_validation(test_word):
+    response = client.get('/word/session?user_id=2')
+    assert response.json() == {"success": False, "message": "Нет слов для повторения"}
+
+    response = client.get('/word/session?user_id=1&limit=0')
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_post_session_results(test_word, db_session):
+    last = UserWord(user_id=1, word='last', translation='последнее', interval=180,
+                    reminder_date=datetime.utcnow().date())
+    foreign = UserWord(user_id=2, word='foreign', translation='чужое', interval=2,
+                       reminder_date=datetime.utcnow().date())
+    db_session.add_all([last, foreign])
+    db_session.commit()
+
+    words = client.get('/word/session?user_id=1').json()['words']
+    word_ids = [word['id'] for word in words] + [foreign.id]
+
+    response = client.post('/word/session/results', json={'user_id': 1, 'word_ids': word_ids})
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "updated": 2, "deleted": 1, "skipped": 1,
+                               "next_reminder_date": str(datetime.utcnow().date() + timedelta(days=2))}
+
+    db_session.expire_all()
+    next_date = datetime.utcnow().date() + timedelta(days=2)
+    assert db_session.query(UserWord).filter(UserWord.user_id == 1).count() == 2
+    assert db_session.query(UserWord).filter(func.date(UserWord.reminder_date) == next_date).count() == 2
+    assert db_session.get(UserWord, foreign.id).interval == 2
+
+    # Повторная отправка тех же результатов ничего не переносит второй раз
+    response = client.post('/word/session/results', json={'user_id': 1, 'word_ids': word_ids})
+    assert response.json()["updated"] == 0
+    assert response.json()["skipped"] == 4
+
+
+def test_session_results_with_grades_sm2(test_word, db_session, monkeypatch):
+    monkeypatch.setattr(repetition, 'scheduler', get_scheduler('sm2'))
+    db_session.query(UserWord).update({UserWord.repetitions: 2, UserWord.interval: 6})
+    db_session.commit()
+    easy, forgotten = test_word
+
+    response = client.post('/word/session/results', json={
+        'user_id': 1, 'results': [{'id': easy.id, 'grade': 5}, {'id': forgotten.id, 'grade': 1}],
+    })
+    assert response.json() == {"success": True, "updated": 2, "deleted": 0, "skipped": 0,
+                               "next_reminder_date": str(datetime.utcnow().date() + timedelta(days=1))}
+
+    db_session.expire_all()
+    today = datetime.utcnow().date()
+    assert (easy.interval, easy.repetitions, easy.ease_factor) == (15, 3, pytest.approx(2.6))
+    assert easy.reminder_date.date() == today + timedelta(days=15)
+    assert (forgotten.interval, forgotten.repetitions, forgotten.ease_factor) == (1, 0, 2.5)
+
+    response = client.post('/word/session/results', json={'user_id': 1, 'results': [{'id': easy.id, 'grade': 6}]})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_forecast(test_word, db_session):
+    db_session.add(UserWord(user_id=1, word='later', translation='позже', interval=180,
+                            reminder_date=datetime.utcnow().date() + timedelta(days=3)))
+    db_session.commit()
+
+    response = client.get('/word/forecast?user_id=1&days=5')
+    assert response.status_code == 200
+    data = response.json()
+    assert data['scheduler'] == 'ladder'
+
+    today = datetime.utcnow().date()
+    assert [day['date'] for day in data['forecast']] == [str(today + timedelta(days=i)) for i in range(5)]
+    # Два слова сегодня и через 2 дня снова (интервал 2), слово с последним интервалом - через 3 дня
+    assert [day['reviews'] for day in data['forecast']] == [2, 0, 2, 1, 0]
+
+    response = client.get('/word/forecast?user_id=2&days=2')
+    assert [day['reviews'] for day in response.json()['forecast']] == [0, 0]
+
+    response = client.get('/word/forecast?user_id=1&days=0')
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def chunked(data: bytes, size: int):
+    # Мелкие куски режут строки и многобайтовые символы посередине
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_import_csv_streaming(test_word, db_session):
+    body = (
+        '﻿word,translation\n'
+        'apple,яблоко\n'
+        'test,тест\n'
+        'apple,яблоко ещё раз\n'
+        '"a, b","с запятой"\r\n'
+        '"multi\nline","перевод"\n'
+        'broken\n'
+        ',пусто\n'
+        '\n'
+        'pear,груша'
+    ).encode()
+
+    response = client.post('/word/import?user_id=1', content=chunked(body, 7))
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "total": 8, "inserted": 4, "duplicates": 2, "invalid": 2,
+                               "next_reminder_date": str(datetime.utcnow().date())}
+
+    words = dict(db_session.query(UserWord.word, UserWord.translation).filter(UserWord.user_id == 1).all())
+    assert words['apple'] == 'яблоко'
+    assert words['a, b'] == 'с запятой'
+    assert words['multi\nline'] == 'перевод'
+    assert words['test'] == 'тест'
+    assert len(words) == 6
+
+    imported = db_session.query(UserWord).filter(UserWord.word == 'pear').one()
+    assert imported.interval == 2
+    assert imported.reminder_date.date() == datetime.utcnow().date() + timedelta(days=1)
+
+
+def test_import_jsonl_in_batches(db_session, monkeypatch):
+    monkeypatch.setattr(repetition, 'IMPORT_BATCH_SIZE', 100)
+    lines = [json.dumps({'word': f'word{i % 300}', 'translation': f'слово{i}'}) for i in range(450)]
+    lines += ['not json', json.dumps(['word', 'list']), json.dumps({'word': 'no translation'})]
+    body = '\n'.join(lines).encode()
+
+    response = client.post('/word/import?user_id=5&format=jsonl', content=chunked(body, 1000))
+    assert response.json() == {"success": True, "total": 453, "inserted": 300, "duplicates": 150, "invalid": 3,
+                               "next_reminder_date": str(datetime.utcnow().date() + timedelta(days=1))}
+    assert db_session.query(UserWord).filter(UserWord.user_id == 5).count() == 300
+
+    # Повторный импорт ничего не добавляет
+    response = client.post('/word/import?user_id=5&format=jsonl', content=body)
+    assert response.json()['inserted'] == 0
+    assert response.json()['duplicates'] == 450
+
+    db_session.query(UserWord).delete()
+    db_session.commit()
+
+
+def test_import_rejects_bad_input(db_session):
+    response = client.post('/word/import?user_id=1', content='слово,перевод'.encode('cp1251'))
+    assert response.status_code == 400
+
+    response = client.post('/word/import?user_id=1', content=b'x' * (2 * 64 * 1024))
+    assert response.status_code == 413
+
+    response = client.post('/word/import?user_id=1&format=xml', content=b'')
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_due_summary(test_word, db_session):
+    today = datetime.utcnow().date()
+    db_session.add_all([
+        UserWord(user_id=1, word='later', translation='позже', interval=5, reminder_date=today + timedelta(days=4)),
+        UserWord(user_id=2, word='future', translation='будущее', interval=5, reminder_date=today + timedelta(days=3)),
+    ])
+    db_session.commit()
+
+    response = client.get('/word/due-summary')
+    assert response.status_code == 200
+    assert sorted(response.json(), key=lambda row: row['user_id']) == [
+        {"user_id": 1, "due": 2, "next_reminder_date": str(today)},
+        {"user_id": 2, "due": 0, "next_reminder_date": str(today + timedelta(days=3))},
+    ]
+
+    response = client.get('/word/due-summary?user_id=2&user_id=3')
+    assert response.json() == [{"user_id": 2, "due": 0, "next_reminder_date": str(today + timedelta(days=3))}]
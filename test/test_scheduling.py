@@ -0,0 +1,98 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from backend.scheduling import DEFAULT_GRADE, REPEAT_SCHEDULE, LadderScheduler, ReviewState, SM2Scheduler, \
+    get_scheduler
+
+TODAY = date(2024, 6, 1)
+
+
+def simulate(scheduler, states, days):
+    # Эталон для прогноза: повторяем каждое слово по одному через review()
+    counts = [0] * days
+    for state in states:
+        day = max((state.reminder_date - TODAY).days, 0)
+        while state is not None and day < days:
+            counts[day] += 1
+            state = scheduler.review(state, DEFAULT_GRADE, TODAY + timedelta(days=day))
+            day = (state.reminder_date - TODAY).days if state is not None else days
+    return counts
+
+
+def forecast(scheduler, states, days):
+    return scheduler.forecast(
+        [(state.reminder_date - TODAY).days for state in states],
+        [state.interval or 0 for state in states],
+        [state.ease_factor for state in states],
+        [state.repetitions for state in states],
+        days,
+    ).tolist()
+
+
+def test_ladder_keeps_fixed_schedule():
+    ladder = LadderScheduler()
+    state = ladder.initial(TODAY)
+    assert state == ReviewState(TODAY + timedelta(days=1), 2)
+
+    state = ladder.review(state, 0, TODAY)
+    assert (state.reminder_date, state.interval) == (TODAY + timedelta(days=2), 5)
+
+    # Интервал не из лестницы переходит на ближайшую ступень сверху
+    state = ladder.review(ReviewState(TODAY, 3), DEFAULT_GRADE, TODAY)
+    assert (state.reminder_date, state.interval) == (TODAY + timedelta(days=5), 7)
+
+    assert ladder.review(ReviewState(TODAY, REPEAT_SCHEDULE[-1]), DEFAULT_GRADE, TODAY) is None
+
+
+def test_sm2_intervals_follow_grades():
+    sm2 = SM2Scheduler()
+    state = sm2.initial(TODAY)
+
+    state = sm2.review(state, 4, TODAY)
+    assert (state.interval, state.repetitions, state.ease_factor) == (1, 1, pytest.approx(2.5))
+    state = sm2.review(state, 4, TODAY)
+    assert state.interval == 6
+    state = sm2.review(state, 5, TODAY)
+    assert (state.interval, state.ease_factor) == (15, pytest.approx(2.6))
+    assert state.reminder_date == TODAY + timedelta(days=15)
+
+    forgotten = sm2.review(state, 1, TODAY)
+    assert (forgotten.interval, forgotten.repetitions, forgotten.ease_factor) == (1, 0, state.ease_factor)
+
+    hard = sm2.review(ReviewState(TODAY, 10, 1.35, 5), 3, TODAY)
+    assert hard.ease_factor == pytest.approx(1.3)
+
+    assert sm2.review(ReviewState(TODAY, 100, 2.5, 5), 4, TODAY) is None
+
+
+def test_forecast_counts_overdue_words_today():
+    ladder = LadderScheduler()
+    states = [ReviewState(TODAY - timedelta(days=5), 180), ReviewState(TODAY + timedelta(days=2), 180)]
+    assert forecast(ladder, states, 4) == [1, 0, 1, 0]
+    assert forecast(ladder, [], 3) == [0, 0, 0]
+
+
+@pytest.mark.parametrize('name', ['ladder', 'sm2'])
+def test_forecast_matches_review_by_review_simulation(name):
+    scheduler = get_scheduler(name)
+    generator = random.Random(42)
+    states = [
+        ReviewState(
+            reminder_date=TODAY + timedelta(days=generator.randint(-10, 40)),
+            interval=generator.choice(REPEAT_SCHEDULE + [None, 3]),
+            ease_factor=generator.uniform(1.3, 3.0),
+            repetitions=generator.randint(0, 6),
+        )
+        for _ in range(500)
+    ]
+
+    expected = simulate(scheduler, states, 90)
+    assert forecast(scheduler, states, 90) == expected
+    assert sum(expected) > len(states)
+
+
+def test_unknown_scheduler():
+    with pytest.raises(ValueError):
+        get_scheduler('leitner')
@@ -0,0 +1,108 @@
+import pytest
+
+from backend.todo_cache import LocalTodoCache, RedisTodoCache, TodoListCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['local', 'redis'])
+def backend(request):
+    if request.param == 'local':
+        return LocalTodoCache(max_users=2, ttl=30)
+    fakeredis = pytest.importorskip('fakeredis')
+    return RedisTodoCache('', ttl=30, client=fakeredis.FakeAsyncRedis())
+
+
+@pytest.mark.asyncio
+async def test_backend_keeps_variants_until_invalidated(backend):
+    value, generation = await backend.get(1, 'all')
+    assert value is None
+    await backend.set(1, 'all', b'[1]', generation)
+    await backend.set(1, 'page', b'{}', generation)
+    await backend.set(2, 'all', b'[2]', (await backend.get(2, 'all'))[1])
+
+    assert (await backend.get(1, 'all'))[0] == b'[1]'
+    assert (await backend.get(1, 'page'))[0] == b'{}'
+
+    await backend.invalidate(1)
+    assert (await backend.get(1, 'all'))[0] is None
+    assert (await backend.get(1, 'page'))[0] is None
+    assert (await backend.get(2, 'all'))[0] == b'[2]'
+
+
+@pytest.mark.asyncio
+async def test_backend_skips_value_read_before_invalidation(backend):
+    _, generation = await backend.get(1, 'all')
+    # Пока читали БД, задачи изменили
+    await backend.invalidate(1)
+    await backend.set(1, 'all', b'[stale]', generation)
+    assert (await backend.get(1, 'all'))[0] is None
+
+    _, generation = await backend.get(1, 'all')
+    await backend.set(1, 'all', b'[fresh]', generation)
+    assert (await backend.get(1, 'all'))[0] == b'[fresh]'
+
+
+@pytest.mark.asyncio
+async def test_local_cache_lru_and_ttl():
+    clock = FakeClock()
+    cache = LocalTodoCache(max_users=2, ttl=30, clock=clock)
+    for user_id in (1, 2):
+        await cache.set(user_id, 'all', b'[]', (await cache.get(user_id, 'all'))[1])
+    await cache.get(1, 'all')  # 1 использован недавно - вытесняется 2
+    await cache.set(3, 'all', b'[]', (await cache.get(3, 'all'))[1])
+    assert len(cache) == 2
+    assert (await cache.get(1, 'all'))[0] == b'[]'
+    assert (await cache.get(2, 'all'))[0] is None
+
+    clock.now = 31
+    assert (await cache.get(1, 'all'))[0] is None
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_local_cache_forgets_generations_safely():
+    cache = LocalTodoCache(max_users=1, ttl=30)
+    _, generation = await cache.get(1, 'all')
+    for user_id in range(1, 10):
+        await cache.invalidate(user_id)
+    # Поколения сброшены, но старое значение поколения уже не совпадёт
+    await cache.set(1, 'all', b'[stale]', generation)
+    assert (await cache.get(1, 'all'))[0] is None
+
+
+class BrokenBackend(LocalTodoCache):
+    async def get(self, user_id, variant):
+        raise ConnectionError()
+
+    async def invalidate(self, user_id):
+        raise ConnectionError()
+
+
+@pytest.mark.asyncio
+async def test_cache_counts_hits_and_survives_backend_errors():
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return [{'id': 1, 'title': 'Задача'}]
+
+    cache = TodoListCache(LocalTodoCache())
+    assert await cache.get_or_load(1, 'all', load) == '[{"id":1,"title":"Задача"}]'.encode()
+    await cache.get_or_load(1, 'all', load)
+    await cache.invalidate(1, 1)
+    await cache.get_or_load(1, 'all', load)
+    assert len(loads) == 2
+    assert cache.stats() == {'backend': 'local', 'hits': 1, 'misses': 2, 'hit_ratio': 0.333,
+                             'invalidations': 1, 'errors': 0}
+
+    broken = TodoListCache(BrokenBackend())
+    assert await broken.get_or_load(1, 'all', load) == await cache.get_or_load(1, 'all', load)
+    await broken.invalidate(1)
+    assert broken.stats()['errors'] == 2
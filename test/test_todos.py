@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from starlette import status
 
@@ -5,21 +7,20 @@ from backend.models import Todos
 from fastapi.testclient import TestClient
 from backend.main import app
 from backend.routers.todos import get_db
-from test.db_conection import TestingSessionLocal, db_session
-
-
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from backend.todo_cache import todo_cache
+from test.db_conection import override_get_db, db_session, round_trips
 
 
 client = TestClient(app)
 app.dependency_overrides[get_db] = override_get_db
 
 
+@pytest.fixture(autouse=True)
+def clear_todo_cache():
+    # Фикстуры пишут в БД напрямую, мимо сброса кэша в обработчиках
+    asyncio.run(todo_cache.clear())
+
+
 @pytest.fixture
 def test_todo(db_session):
     todos = [
@@ -148,3 +149,214 @@ def test_delete_todo(test_todo, db_session):
 def test_delete_todo_not_found(test_todo, db_session):
     response = client.delete('/todos/todo/7')
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.fixture
+def many_todos(db_session):
+    db_session.add_all([
+        Todos(title=f"Task {i}", description="Descr", priority=i % 5 + 1, complete=i % 3 == 0, owner_id=10)
+        for i in range(23)
+    ])
+    # Задачи без приоритета и статуса получают значения по умолчанию и попадают в курсор
+    db_session.add_all([Todos(title="Legacy", owner_id=10), Todos(title="Legacy", owner_id=10)])
+    db_session.commit()
+
+    expected = sorted(db_session.query(Todos).filter(Todos.owner_id == 10).all(),
+                      key=lambda todo: (todo.complete, todo.priority, todo.id))
+    yield [todo.id for todo in expected]
+
+    db_session.query(Todos).delete()
+    db_session.commit()
+
+
+def test_read_page_walks_forward_and_back(many_todos):
+    pages = []
+    cursor = None
+    while True:
+        params = {"user_id": 10, "limit": 5, "fields": ["id"]}
+        if cursor:
+            params["after"] = cursor
+        data = client.get("/todos/page", params=params).json()
+        pages.append(data)
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [item["id"] for page in pages for item in page["items"]] == many_todos
+    assert [len(page["items"]) for page in pages] == [5, 5, 5, 5, 5]
+    assert pages[0]["prev_cursor"] is None
+
+    # Назад с последней страницы возвращает ту же предпоследнюю страницу
+    data = client.get("/todos/page", params={"user_id": 10, "limit": 5, "fields": ["id"],
+                                             "before": pages[-1]["prev_cursor"]}).json()
+    assert data["items"] == pages[-2]["items"]
+    assert data["next_cursor"] == pages[-2]["next_cursor"]
+
+    data = client.get("/todos/page", params={"user_id": 10, "limit": 5, "before": pages[1]["prev_cursor"]}).json()
+    assert [item["id"] for item in data["items"]] == many_todos[:5]
+    assert data["prev_cursor"] is None
+
+
+def test_read_page_projection(test_todo):
+    response = client.get("/todos/page", params={"user_id": 1, "fields": ["title", "complete"]})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "items": [{"title": "Check", "complete": False}, {"title": "Learn to code!", "complete": False}],
+        "next_cursor": None,
+        "prev_cursor": None,
+    }
+
+    response = client.get("/todos/page", params={"user_id": 1, "limit": 1})
+    assert response.json()["items"][0].keys() == {"id", "owner_id", "title", "description", "priority", "complete"}
+    assert response.json()["next_cursor"] == "0.3.2"
+
+
+def test_read_page_bad_params(test_todo):
+    assert client.get("/todos/page", params={"user_id": 1, "fields": ["secret"]}).status_code == 422
+    assert client.get("/todos/page", params={"user_id": 1, "limit": 0}).status_code == 422
+    assert client.get("/todos/page", params={"user_id": 1, "after": "bad"}).status_code == 400
+    assert client.get("/todos/page", params={"user_id": 1, "after": "0.1.1", "before": "0.1.1"}).status_code == 400
+
+
+def test_bulk_operations(test_todo, db_session):
+    new_todo = {'title': 'Bulk todo', 'description': 'Created in bulk', 'priority': 2, 'complete': False,
+                'owner_id': 1}
+    response = client.post('/todos/bulk', json={'operations': [
+        {'op': 'toggle', 'id': 1},
+        {'op': 'create', 'todo': new_todo},
+        {'op': 'delete', 'id': 3},
+        {'op': 'toggle', 'id': 2},
+        {'op': 'toggle', 'id': 2},
+        {'op': 'delete', 'id': 90},
+        {'op': 'create', 'todo': {**new_todo, 'title': 'Second bulk'}},
+        {'op': 'toggle', 'id': 91},
+    ]})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'results': [
+        {'op': 'toggle', 'id': 1, 'complete': True},
+        {'op': 'create', 'id': 4},
+        {'op': 'delete', 'id': 3},
+        {'op': 'toggle', 'id': 2, 'complete': False},
+        {'op': 'toggle', 'id': 2, 'complete': False},
+        {'op': 'delete', 'id': 90, 'error': 'Todo not found.'},
+        {'op': 'create', 'id': 5},
+        {'op': 'toggle', 'id': 91, 'error': 'Todo not found.'},
+    ]}
+
+    todos = {todo.id: todo for todo in db_session.query(Todos).all()}
+    assert sorted(todos) == [1, 2, 4, 5]
+    assert todos[1].complete and not todos[2].complete
+    assert todos[5].title == 'Second bulk'
+
+
+def test_bulk_validation(test_todo):
+    assert client.post('/todos/bulk', json={'operations': []}).status_code == 422
+    assert client.post('/todos/bulk', json={'operations': [{'op': 'rename', 'id': 1}]}).status_code == 422
+    assert client.post('/todos/bulk', json={'operations': [{'op': 'create', 'todo': {'title': 'x'}}]}).status_code == 422
+
+
+@pytest.mark.parametrize('method', ['put', 'delete'])
+def test_single_writes_are_one_statement(test_todo, method):
+    with round_trips() as calls:
+        response = getattr(client, method)('/todos/todo/2')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    # BEGIN и COMMIT не проходят через before_cursor_execute: остаётся только сама запись
+    assert len(calls) == 1
+
+
+def test_read_all_is_cached_until_write(test_todo, db_session):
+    stats = todo_cache.stats()
+    assert len(client.get("/todos/?user_id=1").json()) == 2
+    with round_trips() as calls:
+        assert len(client.get("/todos/?user_id=1").json()) == 2
+    assert calls == []
+    assert todo_cache.stats()['hits'] == stats['hits'] + 1
+    assert todo_cache.stats()['misses'] == stats['misses'] + 1
+
+    # Запись мимо API видна только после сброса кэша
+    db_session.add(Todos(title="Direct", description="Inserted directly", priority=1, complete=False, owner_id=1))
+    db_session.commit()
+    assert len(client.get("/todos/?user_id=1").json()) == 2
+
+    client.put('/todos/todo/3')  # задача другого пользователя не сбрасывает кэш первого
+    assert len(client.get("/todos/?user_id=1").json()) == 2
+
+    client.put('/todos/todo/1')
+    todos = client.get("/todos/?user_id=1").json()
+    assert len(todos) == 3
+    assert next(todo for todo in todos if todo['id'] == 1)['complete']
+
+
+@pytest.mark.parametrize('request_args', [
+    ('post', '/todos/todo', {'json': {'title': 'Cached', 'description': 'New one', 'priority': 1,
+                                      'complete': False, 'owner_id': 1}}),
+    ('delete', '/todos/todo/2', {}),
+    ('post', '/todos/bulk', {'json': {'operations': [{'op': 'toggle', 'id': 2}]}}),
+])
+def test_writes_invalidate_cached_lists(test_todo, request_args):
+    method, url, kwargs = request_args
+    before_all = client.get("/todos/?user_id=1").json()
+    before_page = client.get("/todos/page", params={"user_id": 1, "fields": ["id", "complete"]}).json()
+
+    assert getattr(client, method)(url, **kwargs).status_code < 300
+    assert client.get("/todos/?user_id=1").json() != before_all
+    assert client.get("/todos/page", params={"user_id": 1, "fields": ["id", "complete"]}).json() != before_page
+    assert todo_cache.stats()['invalidations'] > 0
+
+
+def test_cache_stats(test_todo):
+    client.get("/todos/?user_id=1")
+    response = client.get("/todos/cache")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['backend'] == 'local'
+    assert response.json()['misses'] >= 1
+
+
+@pytest.fixture
+def search_todos(db_session):
+    db_session.add_all([
+        Todos(title="Купить молоко", description="Молоко и хлеб в магазине", priority=2, complete=False, owner_id=20),
+        Todos(title="Позвонить маме", description="Спросить про молоко", priority=1, complete=False, owner_id=20),
+        Todos(title="Read a book", description="Finish the book about databases", priority=3, complete=True,
+              owner_id=20),
+        Todos(title="Купить молоко", description="Чужая задача", priority=1, complete=False, owner_id=21),
+    ])
+    db_session.commit()
+    yield
+    db_session.query(Todos).delete()
+    db_session.commit()
+
+
+def test_search_ranks_matches(search_todos):
+    response = client.get("/todos/search", params={"user_id": 20, "q": "молоко"})
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [todo["title"] for todo in results] == ["Купить молоко", "Позвонить маме"]
+    assert results[0]["rank"] > results[1]["rank"]
+    assert results[0].keys() == {"id", "title", "description", "priority", "complete", "rank"}
+
+    response = client.get("/todos/search", params={"user_id": 20, "q": "молоко -маме"})
+    assert [todo["title"] for todo in response.json()] == ["Купить молоко"]
+
+    response = client.get("/todos/search", params={"user_id": 20, "q": "BOOK databases"})
+    assert [todo["title"] for todo in response.json()] == ["Read a book"]
+
+
+def test_search_prefix_mode(search_todos):
+    response = client.get("/todos/search", params={"user_id": 20, "q": "мол"})
+    assert response.json() == []
+
+    response = client.get("/todos/search", params={"user_id": 20, "q": "мол хле", "mode": "prefix"})
+    assert [todo["title"] for todo in response.json()] == ["Купить молоко"]
+
+    # Спецсимволы tsquery в префиксном режиме игнорируются
+    response = client.get("/todos/search", params={"user_id": 20, "q": "dat:* | !", "mode": "prefix"})
+    assert [todo["title"] for todo in response.json()] == ["Read a book"]
+
+    response = client.get("/todos/search", params={"user_id": 20, "q": "&!", "mode": "prefix"})
+    assert response.json() == []
+
+
+def test_search_validation(search_todos):
+    assert client.get("/todos/search", params={"user_id": 20, "q": ""}).status_code == 422
+    assert client.get("/todos/search", params={"user_id": 20, "q": "x", "mode": "regex"}).status_code == 422
@@ -6,24 +6,27 @@ from sqlalchemy import func
 from starlette import status
 from backend.main import app
 
-from backend.models import WorkoutRecord, BodyMeasurements
+from backend.models import WorkoutRecord, BodyMeasurements, PersonalRecord, WorkoutVersion
+from backend.pdf_cache import PdfCache
+from backend.pdf_renderer import pdf_renderer
 from fastapi.testclient import TestClient
+from backend.routers import training
 from backend.routers.training import get_db
-from test.db_conection import TestingSessionLocal, db_session
-
-
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from test.db_conection import override_get_db, db_session, round_trips
 
 
 client = TestClient(app)
 app.dependency_overrides[get_db] = override_get_db
 
 
+@pytest.fixture(autouse=True)
+def pdf_cache(monkeypatch):
+    # Таблицы пересоздаются в каждом тесте, версии данных начинаются заново
+    cache = PdfCache(directory=None)
+    monkeypatch.setattr(training, 'pdf_cache', cache)
+    return cache
+
+
 @pytest.fixture
 def test_body_measurements(db_session):
     measurement = BodyMeasurements(
@@ -191,6 +194,17 @@ def test_workouts_by_filter(test_workouts, db_session):
     assert int(response.headers['content-length']) > 0
 
 
+def test_workouts_pdf_back_pressure(test_workouts, monkeypatch):
+    rendered = pdf_renderer.stats()['rendered']
+    assert client.get('/workout/?user_id=1').status_code == status.HTTP_200_OK
+    assert client.get('/workout/renderer').json()['rendered'] == rendered + 1
+
+    monkeypatch.setattr(pdf_renderer, 'max_queue', -pdf_renderer.workers)
+    response = client.get('/workout/?user_id=1&period=current-week')
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert 'retry-after' in response.headers
+
+
 def test_workouts_by_filter_not_found(test_workouts, db_session):
     response = client.get('/workout/?user_id=1&date=01.01.2023')
     assert response.json()['message'] == 'Ничего не найдено по заданным критериям.'
@@ -207,3 +221,174 @@ def test_create_workout(test_workouts, db_session):
 
     response = client.post('/workout/?user_id=1', json=request_data)
     assert response.status_code == status.HTTP_201_CREATED
+
+    assert db_session.query(WorkoutVersion.version).filter(WorkoutVersion.user_id == 1).scalar() == 1
+
+
+def test_repeated_report_comes_from_cache(test_workouts, pdf_cache):
+    first = client.get('/workout/?user_id=1&period=current-month')
+    rendered = pdf_renderer.stats()['rendered']
+
+    second = client.get('/workout/?user_id=1&period=current-month')
+    assert second.content == first.content
+    assert pdf_renderer.stats()['rendered'] == rendered
+    assert client.get('/workout/renderer').json()['cache']['hits'] == 1
+
+    # Другой фильтр - другой отчёт
+    client.get('/workout/?user_id=1&period=current-month&exercise_name=Жим')
+    assert pdf_renderer.stats()['rendered'] == rendered + 1
+
+    # Новая тренировка меняет версию данных - отчёт строится заново
+    client.post('/workout/?user_id=1', json={
+        "exercise_name": "Присед", "sets": 5, "repetitions": 10, "weight": 100,
+        "workout_date": datetime.now().isoformat(),
+    })
+    third = client.get('/workout/?user_id=1&period=current-month')
+    assert pdf_renderer.stats()['rendered'] == rendered + 2
+    assert third.content != first.content
+
+
+def test_workouts_report_pages(test_workouts, monkeypatch):
+    monkeypatch.setattr(training, 'PDF_PAGE_ROWS', 3)
+    first = client.get('/workout/?user_id=1')
+    second = client.get('/workout/?user_id=1&page=2')
+    assert first.headers['content-type'] == second.headers['content-type'] == 'application/pdf'
+    assert first.content != second.content
+    assert (first.headers['x-has-more'], second.headers['x-has-more']) == ('1', '0')
+    # Из кэша - с тем же признаком следующей страницы
+    cached = client.get('/workout/?user_id=1')
+    assert cached.content == first.content and cached.headers['x-has-more'] == '1'
+    assert client.get('/workout/?user_id=1&page=2').headers['x-has-more'] == '0'
+    assert client.get('/workout/renderer').json()['cache']['hits'] == 2
+    assert client.get('/workout/?user_id=1&page=3').json()['message'] == 'Ничего не найдено по заданным критериям.'
+    assert client.get('/workout/?user_id=1&page=0').status_code == 422
+
+    last = client.get('/workout/?user_id=1&period=last-workout')
+    assert last.headers['x-has-more'] == '0'
+    response = client.get('/workout/?user_id=1&period=last-workout&page=2')
+    assert response.json()['message'] == 'Ничего не найдено по заданным критериям.'
+    assert client.get('/workout/?user_id=777&period=last-workout').json()['message'] == 'Последняя тренировка не найдена.'
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 1])
+def test_export_csv(test_workouts, monkeypatch, chunk_size):
+    monkeypatch.setattr(training, 'EXPORT_CHUNK_SIZE', chunk_size)
+    with client.stream('GET', '/workout/export?user_id=1') as response:
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'] == 'text/csv; charset=utf-8'
+        chunks = list(response.iter_bytes())
+
+    lines = b''.join(chunks).decode('utf-8-sig').splitlines()
+    assert lines[0] == 'workout_date,exercise_name,sets,repetitions,weight'
+    assert lines[1] == '2024-01-01 00:00:00,Жим гантелей,4,12,75.0'
+    # Хронологический порядок, по строке на запись
+    assert len(lines) == 5
+    assert lines[1:] == sorted(lines[1:])
+
+
+def test_export_ndjson(test_workouts):
+    response = client.get('/workout/export', params={'user_id': 1, 'format': 'ndjson', 'exercise_name': 'Присед'})
+    assert response.headers['content-type'] == 'application/x-ndjson'
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(record['exercise_name'] for record in records) == ['Приседания', 'Приседания со штангой']
+    assert set(records[0]) == {'workout_date', 'exercise_name', 'sets', 'repetitions', 'weight'}
+
+    assert client.get('/workout/export?user_id=777&format=ndjson').text == ''
+    assert client.get('/workout/export?user_id=1&format=xml').status_code == 422
+
+
+@pytest.fixture
+def stats_workouts(db_session):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    monday = today - timedelta(days=today.weekday())
+    two_weeks_ago = monday - timedelta(weeks=2)
+    db_session.add_all([
+        WorkoutRecord(user_id=5, exercise_name="Присед", sets=3, repetitions=10, weight=80, workout_date=two_weeks_ago),
+        WorkoutRecord(user_id=5, exercise_name="Присед", sets=3, repetitions=5, weight=100, workout_date=monday),
+        WorkoutRecord(user_id=5, exercise_name="Присед", sets=2, repetitions=5, weight=110, workout_date=monday),
+        WorkoutRecord(user_id=5, exercise_name="Присед", sets=1, repetitions=10, weight=None,
+                      workout_date=monday + timedelta(hours=1)),
+        WorkoutRecord(user_id=5, exercise_name="Жим", sets=5, repetitions=5, weight=60, workout_date=monday),
+        # Старше выбранного периода и чужая тренировка
+        WorkoutRecord(user_id=5, exercise_name="Жим", sets=5, repetitions=5, weight=50,
+                      workout_date=monday - timedelta(weeks=20)),
+        WorkoutRecord(user_id=6, exercise_name="Присед", sets=5, repetitions=5, weight=200, workout_date=monday),
+    ])
+    db_session.commit()
+    yield monday.date(), two_weeks_ago.date()
+    db_session.query(WorkoutRecord).delete()
+    db_session.commit()
+
+
+def test_workout_stats(stats_workouts):
+    monday, two_weeks_ago = stats_workouts
+    response = client.get('/workout/stats', params={'user_id': 5, 'weeks': 3})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {'exercise_name': 'Жим', 'trend': None, 'weeks': [
+            {'week': str(monday), 'volume': 1500.0, 'max_weight': 60.0, 'sessions': 1, 'volume_change': None},
+        ]},
+        {'exercise_name': 'Присед', 'trend': 100.0, 'weeks': [
+            {'week': str(two_weeks_ago), 'volume': 2400.0, 'max_weight': 80.0, 'sessions': 1, 'volume_change': None},
+            {'week': str(monday), 'volume': 2600.0, 'max_weight': 110.0, 'sessions': 1, 'volume_change': 200.0},
+        ]},
+    ]
+
+    filtered = client.get('/workout/stats', params={'user_id': 5, 'weeks': 52, 'exercise_name': 'Жим'}).json()
+    assert [len(exercise['weeks']) for exercise in filtered] == [2]
+    assert client.get('/workout/stats', params={'user_id': 5, 'weeks': 0}).status_code == 422
+
+
+def add_workout(exercise_name, sets, repetitions, weight, day):
+    response = client.post('/workout/?user_id=8', json={
+        "exercise_name": exercise_name, "sets": sets, "repetitions": repetitions, "weight": weight,
+        "workout_date": f"2024-06-{day:02d}T00:00:00",
+    })
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+def test_personal_records_follow_new_workouts(db_session):
+    with round_trips() as calls:
+        add_workout("Жим", 3, 5, 100, 1)
+    # Запись, рекорды и версия данных - по одному запросу, сколько бы ни было истории
+    assert len(calls) == 3
+
+    add_workout("Жим", 5, 10, 90, 2)   # больше объём и оценка 1ПМ, но не вес
+    add_workout("Жим", 1, 1, 90, 3)
+    add_workout("Подтягивания", 3, 8, 0, 3)
+
+    records = client.get('/workout/records?user_id=8').json()
+    assert records == [
+        {'exercise_name': 'Жим',
+         'best_weight': 100.0, 'best_weight_date': '2024-06-01T00:00:00',
+         'best_one_rep_max': pytest.approx(120.0), 'best_one_rep_max_date': '2024-06-02T00:00:00',
+         'best_volume': 4500.0, 'best_volume_date': '2024-06-02T00:00:00'},
+        {'exercise_name': 'Подтягивания',
+         'best_weight': 0.0, 'best_weight_date': '2024-06-03T00:00:00',
+         'best_one_rep_max': 0.0, 'best_one_rep_max_date': '2024-06-03T00:00:00',
+         'best_volume': 0.0, 'best_volume_date': '2024-06-03T00:00:00'},
+    ]
+    assert client.get('/workout/records?user_id=9').json() == []
+
+
+def test_rebuild_personal_records(db_session):
+    for day, (sets, repetitions, weight) in enumerate([(3, 5, 100), (5, 10, 80), (4, 6, 100), (1, 1, 95)], start=1):
+        add_workout("Жим", sets, repetitions, weight, day)
+    add_workout("Присед", 5, 5, 120, 4)
+    incremental = client.get('/workout/records?user_id=8').json()
+
+    # История, загруженная в обход API, и испорченные рекорды
+    db_session.add(WorkoutRecord(user_id=8, exercise_name="Присед", sets=1, repetitions=3, weight=140,
+                                 workout_date=datetime(2024, 5, 1)))
+    db_session.query(PersonalRecord).filter(PersonalRecord.exercise_name == "Жим").update({'best_weight': 500})
+    db_session.commit()
+
+    response = client.post('/workout/records/rebuild', params={'user_id': [8]})
+    assert response.json() == {'rebuilt': 2}
+    rebuilt = client.get('/workout/records?user_id=8').json()
+    assert rebuilt[0] == incremental[0]
+    assert (rebuilt[1]['best_weight'], rebuilt[1]['best_weight_date']) == (140.0, '2024-05-01T00:00:00')
+    assert rebuilt[1]['best_volume'] == incremental[1]['best_volume']
+
+    assert client.post('/workout/records/rebuild').status_code == 422